@@ -0,0 +1,9 @@
+import os
+from pathlib import Path
+package_path=Path(__file__).parent.parent.absolute()
+data_path=package_path / 'tests' / 'data'
+from dotenv import load_dotenv
+if os.path.isfile(f"{package_path}/.env"):
+    load_dotenv(dotenv_path=f"{package_path}/.env")
+# benchmarks run offline. Provide the items used by default (see smart_meter_to_openhab.config).
+os.environ.setdefault('OVERALL_CONSUMPTION_WATT_OH_ITEM', 'benchmark_smart_meter_overall_consumption')
@@ -0,0 +1,61 @@
+import argparse
+import logging
+import multiprocessing
+from time import perf_counter, process_time
+from typing import Any, Callable, Union
+from .stub_openhab import StubOpenhabServer
+from .stub_mqtt import StubMqttBroker
+from smart_meter_to_openhab.interfaces import SmartMeterValues
+from smart_meter_to_openhab.openhab import OpenhabConnection
+from smart_meter_to_openhab.mqtt import MqttConnection, MqttSettings
+
+OH_ITEM_NAMES=('bench_phase_1', 'bench_phase_2', 'bench_phase_3', 'bench_overall', 'bench_electricity_meter')
+
+def _serve(backend : str, port_queue : Any, stop : Any) -> None:
+    server : Union[StubOpenhabServer, StubMqttBroker] = StubOpenhabServer() if backend == 'rest' else StubMqttBroker()
+    with server:
+        port_queue.put(server.server_address[1])
+        stop.wait()
+
+def measure(name : str, post : Callable[[SmartMeterValues], bool], count : int) -> None:
+    values=SmartMeterValues(100, 200, 300, 600, 1000, OH_ITEM_NAMES)
+    post(values)
+    wall, cpu=perf_counter(), process_time()
+    for _ in range(count):
+        values.overall_consumption.value+=1 # type: ignore
+        if not post(values):
+            raise RuntimeError(f"Failed to post values ({name})")
+    wall, cpu=perf_counter()-wall, process_time()-cpu
+    print(f"{name:24}: {count/wall:8.1f} readings/s, {wall/count*1e6:8.1f} us/reading, CPU {cpu/count*1e6:8.1f} us/reading ({cpu/count/len(OH_ITEM_NAMES)*1e6:6.1f} us/value)")
+
+def main() -> None:
+    parser=argparse.ArgumentParser(description="Compare the publishing backends (REST API of openHAB and MQTT) against local stubs. "
+                                   "The stubs run in a separate process, so the CPU time is the time of the client only.")
+    parser.add_argument("-c", "--count", type=int, default=1000)
+    args=parser.parse_args()
+    logger=logging.getLogger('benchmark')
+    context=multiprocessing.get_context('spawn')
+    for backend in ('rest', 'mqtt'):
+        port_queue, stop=context.Queue(), context.Event()
+        process=context.Process(target=_serve, args=(backend, port_queue, stop), daemon=True)
+        process.start()
+        port=port_queue.get(timeout=30)
+        try:
+            if backend == 'rest':
+                connection=OpenhabConnection(f"http://127.0.0.1:{port}", '', '', logger)
+                measure('REST (per item)', connection.post_to_items, args.count)
+                connection.close()
+            else:
+                for qos in (0, 1):
+                    mqtt=MqttConnection('127.0.0.1', port, '', '', logger, MqttSettings(qos=qos)) # type: ignore
+                    measure(f'MQTT (QoS {qos})', mqtt.post_to_items, args.count)
+                    mqtt.close()
+                mqtt=MqttConnection('127.0.0.1', port, '', '', logger, MqttSettings(qos=1, packed_topic='smart_meter/reading'))
+                measure('MQTT (QoS 1, packed)', mqtt.post_to_items, args.count)
+                mqtt.close()
+        finally:
+            stop.set()
+            process.join()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+import argparse
+import random
+from statistics import mean, median
+from time import perf_counter
+from typing import Callable, List
+from smart_meter_to_openhab.interfaces import SmartMeterValues
+from smart_meter_to_openhab.batch import SmartMeterBatch, numpy_available
+
+def create_values(count : int) -> List[SmartMeterValues]:
+    random.seed(count)
+    return [SmartMeterValues(random.uniform(0, 500), random.uniform(0, 500), None if i % 10 == 0 else random.uniform(0, 500), 
+                             random.uniform(0, 1500), 1000+i/1000) for i in range(count)]
+
+def run(name : str, function : Callable[[], SmartMeterValues], repeat : int, count : int) -> float:
+    start=perf_counter()
+    for _ in range(repeat):
+        function()
+    duration=(perf_counter()-start)/repeat
+    print(f"{name:30}: {count:6} reads -> {duration*1e6:9.1f} us")
+    return duration
+
+def main() -> None:
+    parser=argparse.ArgumentParser(description="Benchmark the aggregation of SmartMeterValues")
+    parser.add_argument("-r", "--repeat", type=int, default=20)
+    args=parser.parse_args()
+    for count in (5, 60, 3600, 86400):
+        values=create_values(count)
+        # create_avg with statistics.mean/median (per channel lists) is the implementation up to version 0.5.3
+        run('statistics mean', lambda: SmartMeterValues.create_avg(values, mean), args.repeat, count)
+        run('statistics median', lambda: SmartMeterValues.create_avg(values, median), args.repeat, count)
+        run('batch python mean', lambda: SmartMeterBatch(values, use_numpy=False).mean(), args.repeat, count)
+        run('batch python median', lambda: SmartMeterBatch(values, use_numpy=False).median(), args.repeat, count)
+        run('batch python mad_mean', lambda: SmartMeterBatch(values, use_numpy=False).aggregate('mad_mean'), args.repeat, count)
+        if numpy_available():
+            run('batch numpy mean', lambda: SmartMeterBatch(values, use_numpy=True).mean(), args.repeat, count)
+            run('batch numpy median', lambda: SmartMeterBatch(values, use_numpy=True).median(), args.repeat, count)
+            run('batch numpy mad_mean', lambda: SmartMeterBatch(values, use_numpy=True).aggregate('mad_mean'), args.repeat, count)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+import argparse
+from time import perf_counter
+from typing import Callable
+from smart_meter_to_openhab.interfaces import SmartMeterValues, SmartMeterOhItemNames, OhItemAndValue
+
+OH_ITEM_NAMES : SmartMeterOhItemNames = ('bench_phase_1', 'bench_phase_2', 'bench_phase_3', 'bench_overall', 'bench_electricity_meter')
+
+def construct(i : int) -> None:
+    SmartMeterValues(i, i+1, i+2, 3*i+3, 1000+i, OH_ITEM_NAMES)
+
+def construct_and_validate(i : int) -> None:
+    # the work done per decoded frame: create, check validity and consistency against the previous values
+    values=SmartMeterValues(i, i+1, i+2, 3*i+3, 1000+i, OH_ITEM_NAMES)
+    values.is_invalid()
+    values.is_consistent(PREV_VALUES)
+    values.value_list()
+
+def assign(i : int) -> None:
+    values=SmartMeterValues(user_specified_oh_item_names=OH_ITEM_NAMES)
+    values.assign_values(ITEM_VALUES)
+
+PREV_VALUES=SmartMeterValues(1, 2, 3, 6, 1000, OH_ITEM_NAMES)
+ITEM_VALUES=[OhItemAndValue(name, 1) for name in reversed(OH_ITEM_NAMES)]
+
+def run(name : str, function : Callable[[int], None], count : int) -> float:
+    start=perf_counter()
+    for i in range(count):
+        function(i)
+    duration=perf_counter()-start
+    print(f"{name:25}: {count} frames in {duration:.3f} s -> {duration/count*1e6:6.2f} us/frame")
+    return duration
+
+def main() -> None:
+    parser=argparse.ArgumentParser(description="Benchmark the creation and validation of SmartMeterValues per frame")
+    parser.add_argument("-c", "--count", type=int, default=100000)
+    args=parser.parse_args()
+    run('construct', construct, args.count)
+    run('construct and validate', construct_and_validate, args.count)
+    run('assign values', assign, args.count)
+
+if __name__ == '__main__':
+    main()
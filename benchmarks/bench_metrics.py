@@ -0,0 +1,50 @@
+import argparse
+from time import perf_counter
+from typing import Callable, Any, List
+from .bench_sml_frame import load_captures
+from .bench_sml_decode import run
+from smart_meter_to_openhab.metrics import MetricsRegistry
+from smart_meter_to_openhab.sml_parser import SmlParseError
+from smart_meter_to_openhab.sml_iskra_mt175 import _decode_sml_iskra_mt175_one_way, _decode_frame
+
+REGISTRY=MetricsRegistry()
+COUNTER=REGISTRY.counter('bench_counter', "Counter.")
+LABELED_COUNTER=REGISTRY.counter('bench_labeled_counter', "Counter with label.", ('reason',))
+HISTOGRAM=REGISTRY.histogram('bench_histogram', "Histogram.", (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 5e-3))
+
+def per_call(name : str, function : Callable[[], Any], count : int) -> float:
+    start=perf_counter()
+    for _ in range(count):
+        function()
+    duration=perf_counter()-start
+    print(f"{name:20}: {count} calls in {duration:.3f} s -> {duration/count*1e6:7.3f} us/call")
+    return duration/count
+
+def plain_decode(frame : bytes) -> None:
+    try:
+        _decode_sml_iskra_mt175_one_way(frame)
+    except SmlParseError:
+        pass
+
+def instrumented_decode(frame : bytes) -> None:
+    # counts the frame, measures the decode time and counts corrupt frames
+    try:
+        _decode_frame(frame, None)
+    except SmlParseError:
+        pass
+
+def main() -> None:
+    parser=argparse.ArgumentParser(description="Benchmark the overhead of the metrics on the hot path (decoding a frame)")
+    parser.add_argument("-c", "--count", type=int, default=200000)
+    parser.add_argument("-r", "--repeat", type=int, default=2000)
+    args=parser.parse_args()
+    per_call('counter', COUNTER.inc, args.count)
+    per_call('labeled counter', lambda: LABELED_COUNTER.inc('corrupt'), args.count)
+    per_call('histogram', lambda: HISTOGRAM.observe(1.5e-4), args.count)
+    frames : List[bytes] = load_captures()
+    plain=run('decode', plain_decode, frames, args.repeat)
+    instrumented=run('decode with metrics', instrumented_decode, frames, args.repeat)
+    print(f"overhead of the metrics: {(instrumented/plain-1)*100:.1f} %")
+
+if __name__ == '__main__':
+    main()
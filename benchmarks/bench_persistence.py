@@ -0,0 +1,71 @@
+import argparse
+import random
+from time import perf_counter
+from typing import Callable, List, Any
+from smart_meter_to_openhab.interfaces import (SmartMeterValues, OhItemAndValue, PersistenceValuesView, 
+                                               create_from_persistence_values, convert_to_persistence_values)
+from smart_meter_to_openhab.utils import PersistenceValuesType
+
+OH_ITEM_NAMES=('bench_phase_1', 'bench_phase_2', 'bench_phase_3', 'bench_overall', 'bench_electricity_meter')
+
+# implementations up to version 0.5.3
+def legacy_create_from_persistence_values(list_values : PersistenceValuesType) -> List[SmartMeterValues]:
+    smart_meter_values : List[SmartMeterValues] = []
+    valid_items=[item for item in SmartMeterValues.oh_item_names() if item]
+    for value_index in range(len(list_values[0]) if list_values else 0):
+        item_value_list : List[OhItemAndValue] = []
+        for item_index, item in enumerate(valid_items):
+            item_value_list.append(OhItemAndValue(item, list_values[item_index][value_index]))
+        smart_meter_values.append(SmartMeterValues.create(item_value_list))
+    return smart_meter_values
+
+def legacy_convert_to_persistence_values(values : List[SmartMeterValues]) -> PersistenceValuesType:
+    list_values : PersistenceValuesType = []
+    for i in range(len(SmartMeterValues().value_list())):
+        list_values.append([])
+    for value_set in values:
+        for index_value, value in enumerate(value_set.value_list()):
+            if SmartMeterValues.oh_item_names()[index_value] and value is not None:
+                list_values[index_value].append(value)
+    return list_values
+
+def legacy_check_if_updated(pers_values : PersistenceValuesType) -> bool:
+    electricity_meter_values=SmartMeterValues.all_values_for_item(4, pers_values)
+    if len(electricity_meter_values) > 1 and all(value == electricity_meter_values[0] for value in electricity_meter_values):
+        return True
+    for values in pers_values:
+        if any(value != values[0] for value in values):
+            return True
+    return False
+
+def create_day(seconds : int) -> PersistenceValuesType:
+    # a day of 1 second persistence data. Constant values are the worst case for check_if_updated (no early exit).
+    random.seed(seconds)
+    return [[0.0]*seconds, [0.0]*seconds, [0.0]*seconds, [0.0]*seconds, [1000.0+random.random()]*seconds]
+
+def run(name : str, function : Callable[[], Any]) -> float:
+    start=perf_counter()
+    function()
+    duration=perf_counter()-start
+    print(f"{name:45}: {duration*1000:8.1f} ms")
+    return duration
+
+def main() -> None:
+    parser=argparse.ArgumentParser(description="Benchmark the conversion of persistence values (1 value per second)")
+    parser.add_argument("-s", "--seconds", type=int, default=24*3600)
+    args=parser.parse_args()
+    # NOTE: SmartMeterValues.oh_item_names() are used by the conversion, all of them have to be specified
+    SmartMeterValues._oh_item_names=OH_ITEM_NAMES # type: ignore
+    SmartMeterValues.oh_item_names.cache_clear() # type: ignore
+    pers_values=create_day(args.seconds)
+    values=create_from_persistence_values(pers_values)
+    run('legacy create_from_persistence_values', lambda: legacy_create_from_persistence_values(pers_values))
+    run('create_from_persistence_values', lambda: create_from_persistence_values(pers_values))
+    run('PersistenceValuesView (lazy, every 60th row)', lambda: [PersistenceValuesView(pers_values)[i] for i in range(0, args.seconds, 60)])
+    run('legacy convert_to_persistence_values', lambda: legacy_convert_to_persistence_values(values))
+    run('convert_to_persistence_values', lambda: convert_to_persistence_values(values))
+    run('legacy check_if_updated', lambda: legacy_check_if_updated(pers_values))
+    run('check_if_updated', lambda: SmartMeterValues.check_if_updated(pers_values))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+import argparse
+from time import perf_counter
+from typing import Any, Callable, List
+from .bench_batch import create_values
+from smart_meter_to_openhab.interfaces import SmartMeterValues
+from smart_meter_to_openhab.batch import SmartMeterBatch
+from smart_meter_to_openhab.rolling import SmartMeterRollingWindow
+
+OH_ITEM_NAMES=('bench_phase_1', 'bench_phase_2', 'bench_phase_3', 'bench_overall', 'bench_electricity_meter')
+
+# implementation up to version 0.5.3 (utils.manage_rolling_list): each append copies the window
+def legacy_manage_rolling_list(list : List[Any], max_value_count : int, new_end_value : Any) -> List[Any]:
+    if len(list) < max_value_count:
+        return list+[new_end_value]
+    else:
+        return list[1:]+[new_end_value]
+
+def run(name : str, push : Callable[[SmartMeterValues], Any], values : List[SmartMeterValues], capacity : int) -> float:
+    start=perf_counter()
+    for value in values:
+        push(value)
+    duration=(perf_counter()-start)/len(values)
+    print(f"{name:35}: window {capacity:6} -> {duration*1e6:9.1f} us/read")
+    return duration
+
+def main() -> None:
+    parser=argparse.ArgumentParser(description="Benchmark rolling statistics (append a read and get the mean and median of the window)")
+    parser.add_argument("-c", "--count", type=int, default=2000, help="Number of measured reads (after the window is filled)")
+    args=parser.parse_args()
+    for capacity in (60, 3600, 86400):
+        values=create_values(capacity+args.count)
+        window_list : List[SmartMeterValues] = []
+        def _legacy(value : SmartMeterValues) -> None:
+            nonlocal window_list
+            window_list=legacy_manage_rolling_list(window_list, capacity, value)
+            batch=SmartMeterBatch(window_list, OH_ITEM_NAMES)
+            batch.mean()
+            batch.median()
+        window=SmartMeterRollingWindow(capacity, OH_ITEM_NAMES)
+        def _rolling(value : SmartMeterValues) -> None:
+            window.push(value)
+            window.mean()
+            window.median()
+        for value in values[:capacity]:
+            window_list=legacy_manage_rolling_list(window_list, capacity, value)
+            window.push(value)
+        if capacity <= 3600:
+            run('rolling list + SmartMeterBatch', _legacy, values[capacity:], capacity)
+        run('SmartMeterRollingWindow', _rolling, values[capacity:], capacity)
+
+if __name__ == '__main__':
+    main()
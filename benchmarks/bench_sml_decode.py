@@ -0,0 +1,60 @@
+import argparse
+from time import perf_counter
+from typing import Optional, Callable, List, Any
+from .bench_sml_frame import load_captures
+from smart_meter_to_openhab.interfaces import SmartMeterValues
+from smart_meter_to_openhab.sml_parser import SmlParseError
+from smart_meter_to_openhab.sml_iskra_mt175 import _decode_sml_iskra_mt175_one_way
+
+def legacy_decode(raw_data : str) -> SmartMeterValues:
+    # fixed offset decoding of the hex string up to version 0.5.3
+    def _convert_to_float(pos_begin : int, pos_end : int) -> Optional[float]:
+        try:
+            hex_number=raw_data[pos_begin:pos_end]
+            if hex_number.startswith('ff'):
+                return 0
+            return int(hex_number, 16)
+        except Exception as e:
+            return None
+    smart_meter_values=SmartMeterValues()
+    pos = raw_data.find('070100010800ff')
+    smart_meter_values.electricity_meter.value = _convert_to_float(pos+36, pos+52) if pos != -1 else None
+    if smart_meter_values.electricity_meter.value is not None:
+        smart_meter_values.electricity_meter.value /= 1e4
+    pos = raw_data.find('070100100700ff')
+    smart_meter_values.overall_consumption.value = _convert_to_float(pos+28, pos+36) if pos != -1 else None
+    pos = raw_data.find('070100240700ff')
+    smart_meter_values.phase_1_consumption.value = _convert_to_float(pos+28, pos+36) if pos != -1 else None
+    pos = raw_data.find('070100380700ff')
+    smart_meter_values.phase_2_consumption.value = _convert_to_float(pos+28, pos+36) if pos != -1 else None
+    pos = raw_data.find('0701004c0700ff')
+    smart_meter_values.phase_3_consumption.value = _convert_to_float(pos+28, pos+36) if pos != -1 else None
+    return smart_meter_values
+
+def decode(frame : bytes) -> Optional[SmartMeterValues]:
+    try:
+        return _decode_sml_iskra_mt175_one_way(frame)
+    except SmlParseError:
+        return None
+
+def run(name : str, function : Callable[[Any], Any], frames : List[Any], repeat : int) -> float:
+    start=perf_counter()
+    for _ in range(repeat):
+        for frame in frames:
+            function(frame)
+    duration=perf_counter()-start
+    frame_count=repeat*len(frames)
+    print(f"{name:20}: {frame_count} frames in {duration:.3f} s -> {duration/frame_count*1e6:7.1f} us/frame")
+    return duration
+
+def main() -> None:
+    parser=argparse.ArgumentParser(description="Benchmark SML decoding against the fixed offset hex string implementation")
+    parser.add_argument("-r", "--repeat", type=int, default=2000)
+    args=parser.parse_args()
+    frames=load_captures()
+    # NOTE: the hex string had to be created for every frame by the legacy implementation
+    run('legacy hex string', lambda frame: legacy_decode(frame.hex()), frames, args.repeat)
+    run('SML TLV + CRC16', decode, frames, args.repeat)
+
+if __name__ == '__main__':
+    main()
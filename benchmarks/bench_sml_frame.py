@@ -0,0 +1,85 @@
+import argparse
+from time import perf_counter
+from typing import List, Optional
+from . import data_path
+from smart_meter_to_openhab.sml_frame import SmlFrameAssembler
+
+class FakeSerial():
+    """Serial port stand-in that offers the data in chunks (like the OS buffer of a serial port would do)"""
+    def __init__(self, data : bytes, chunk_size : int) -> None:
+        self._data=data
+        self._pos=0
+        self._chunk_size=chunk_size
+
+    @property
+    def in_waiting(self) -> int:
+        return min(self._chunk_size, len(self._data)-self._pos)
+
+    def read(self, size : int = 1) -> bytes:
+        data=self._data[self._pos:self._pos+size]
+        self._pos+=len(data)
+        return data
+
+    def exhausted(self) -> bool:
+        return self._pos >= len(self._data)
+
+def load_captures() -> List[bytes]:
+    captures : List[bytes] = []
+    for file in sorted(data_path.glob('*.sml')):
+        with open(file, 'r') as f:
+            captures.append(bytes.fromhex(f.read()))
+    return captures
+
+def create_stream(frame_count : int) -> bytes:
+    captures=load_captures()
+    # some trash between the frames, like it is received when starting to read in the middle of a transmission
+    return b''.join(captures[i % len(captures)]+b'\x00\x1b\x1b' for i in range(frame_count))
+
+def legacy_read_raw(port : FakeSerial) -> Optional[str]:
+    # frame detection of SmlIskraMt175OneWay._read_raw up to version 0.5.3
+    latest_raw_data=''
+    while not port.exhausted():
+        input : bytes = port.read()
+        latest_raw_data += input.hex()
+        pos = latest_raw_data.find('1b1b1b1b01010101')
+        if (pos != -1):
+            latest_raw_data = latest_raw_data[pos:]
+        pos = latest_raw_data.find('1b1b1b1b1a')
+        if (pos != -1) and len(latest_raw_data) >= pos + 16:
+            return latest_raw_data[0:pos + 16]
+    return None
+
+def bench_legacy(stream : bytes) -> int:
+    port=FakeSerial(stream, chunk_size=64)
+    frame_count=0
+    while legacy_read_raw(port) is not None:
+        frame_count+=1
+    return frame_count
+
+def bench_assembler(stream : bytes) -> int:
+    port=FakeSerial(stream, chunk_size=64)
+    assembler=SmlFrameAssembler()
+    frame_count=0
+    while True:
+        frame=assembler.next_frame()
+        if frame is not None:
+            frame_count+=1
+        elif port.exhausted():
+            return frame_count
+        else:
+            assembler.read_from(port)
+
+def main() -> None:
+    parser=argparse.ArgumentParser(description="Benchmark SML frame assembly against the per-byte hex string implementation")
+    parser.add_argument("-n", "--frame_count", type=int, default=2000)
+    args=parser.parse_args()
+    stream=create_stream(args.frame_count)
+    for name, bench in (('legacy hex string', bench_legacy), ('SmlFrameAssembler', bench_assembler)):
+        start=perf_counter()
+        frame_count=bench(stream)
+        duration=perf_counter()-start
+        print(f"{name:20}: {frame_count} frames in {duration:.3f} s -> {frame_count/duration:10.1f} frames/s, "
+              f"{len(stream)/duration/1e6:7.2f} MB/s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from statistics import median
+from time import perf_counter, sleep
+from typing import List, Set
+from . import package_path, data_path
+from .stub_openhab import StubOpenhabServer
+from .stub_mqtt import StubMqttBroker
+
+# modules loaded by smart_meter_to_openhab_scripts.main to read and publish values (without --pipeline etc.)
+IMPORTS=('smart_meter_to_openhab.sml_iskra_mt175', 'smart_meter_to_openhab.openhab')
+
+def measure_import(module : str) -> float:
+    output=subprocess.check_output([sys.executable, '-c', f"from time import perf_counter; start=perf_counter(); import {module}; print(perf_counter()-start)"],
+                                   cwd=package_path, env=os.environ.copy())
+    return float(output)
+
+def measure_first_value(server : StubOpenhabServer, timeout_sec : float = 30) -> float:
+    """Time from the start of the process until the first value is posted to openHAB"""
+    env=os.environ.copy()
+    env['OH_HOST']=server.url
+    args=[sys.executable, '-m', 'smart_meter_to_openhab_scripts.main', '--replay', str(data_path / 'iskra_mt175_valid.sml'), '--replay_speedup', '0',
+          '--stream_window_sec', '1', '--stream_emit_frames', '1']
+    post_count=server.post_count
+    start=perf_counter()
+    process=subprocess.Popen(args, cwd=package_path, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while server.post_count == post_count:
+            if perf_counter()-start > timeout_sec or process.poll() is not None:
+                raise RuntimeError("No value has been posted")
+            sleep(0.001)
+        return perf_counter()-start
+    finally:
+        process.kill()
+        process.wait()
+
+def mqtt_imports(broker : StubMqttBroker, timeout_sec : float = 30) -> Set[str]:
+    """Modules imported by the process until the first value is published to the MQTT broker (see python -X importtime)"""
+    args=[sys.executable, '-X', 'importtime', '-m', 'smart_meter_to_openhab_scripts.main', '--backend', 'mqtt', '--mqtt_host', '127.0.0.1',
+          '--mqtt_port', str(broker.port), '--replay', str(data_path / 'iskra_mt175_valid.sml'), '--replay_speedup', '0',
+          '--stream_window_sec', '1', '--stream_emit_frames', '1']
+    publish_count=broker.publish_count
+    start=perf_counter()
+    # NOTE: a file instead of a pipe, the output of importtime would fill the pipe
+    with tempfile.TemporaryFile() as stderr:
+        process=subprocess.Popen(args, cwd=package_path, env=os.environ.copy(), stdout=subprocess.DEVNULL, stderr=stderr)
+        try:
+            while broker.publish_count == publish_count:
+                if perf_counter()-start > timeout_sec or process.poll() is not None:
+                    raise RuntimeError("No value has been published")
+                sleep(0.001)
+        finally:
+            process.kill()
+            process.wait()
+        stderr.seek(0)
+        # import time: self [us] | cumulative | imported package
+        return {line.split('|')[-1].strip() for line in stderr.read().decode().splitlines() if line.startswith('import time:')}
+
+def main() -> None:
+    parser=argparse.ArgumentParser(description="Benchmark the cold start: import time of the modules and time from exec to the first posted value")
+    parser.add_argument("-r", "--repeat", type=int, default=10)
+    args=parser.parse_args()
+    for module in IMPORTS:
+        print(f"{'import '+module:40}: {median(measure_import(module) for _ in range(args.repeat))*1000:7.1f} ms (median)")
+    with StubOpenhabServer() as server:
+        durations=[measure_first_value(server) for _ in range(args.repeat)]
+    print(f"{'exec to first posted value':40}: {median(durations)*1000:7.1f} ms (median), min {min(durations)*1000:.1f} ms")
+    with StubMqttBroker() as broker:
+        modules=mqtt_imports(broker)
+    # the dependencies of the REST API are loaded only by --backend rest
+    rest_modules=sorted(module for module in ('requests', 'urllib3') if module in modules)
+    if rest_modules:
+        raise RuntimeError(f"--backend mqtt imported {rest_modules}")
+    print(f"{'modules imported by --backend mqtt':40}: {len(modules):7d} (without requests)")
+
+if __name__ == '__main__':
+    main()
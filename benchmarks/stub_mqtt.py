@@ -0,0 +1,57 @@
+import socket
+import socketserver
+import struct
+import threading
+from typing import Dict
+from smart_meter_to_openhab.mqtt import read_packet, decode_publish, encode_packet, CONNECT, CONNACK, PUBLISH, PUBACK, PINGREQ, PINGRESP, DISCONNECT
+
+class _StubHandler(socketserver.BaseRequestHandler):
+    server : 'StubMqttBroker'
+
+    def handle(self) -> None:
+        # like real brokers (otherwise the acknowledgements are delayed by Nagle's algorithm)
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            while True:
+                packet_type, flags, body=read_packet(self.request)
+                if packet_type == CONNECT:
+                    self.request.sendall(encode_packet(CONNACK, 0, b'\x00\x00'))
+                elif packet_type == PUBLISH:
+                    topic, payload, qos, _, packet_id=decode_publish(flags, body)
+                    self.server.record(topic, payload)
+                    if qos:
+                        self.request.sendall(encode_packet(PUBACK, 0, struct.pack('!H', packet_id)))
+                elif packet_type == PINGREQ:
+                    self.request.sendall(encode_packet(PINGRESP, 0, b''))
+                elif packet_type == DISCONNECT:
+                    return
+        except ConnectionError:
+            return
+
+class StubMqttBroker(socketserver.ThreadingTCPServer):
+    """Minimal stand-in of an MQTT broker (QoS 0 and 1, no subscriptions) on a free local port"""
+    daemon_threads=True
+
+    def __init__(self) -> None:
+        super().__init__(('127.0.0.1', 0), _StubHandler)
+        self._lock=threading.Lock()
+        self.messages : Dict[str, bytes] = {}
+        self.publish_count=0
+        self._thread=threading.Thread(target=self.serve_forever, name='stub-mqtt', daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def record(self, topic : str, payload : bytes) -> None:
+        with self._lock:
+            self.messages[topic]=payload
+            self.publish_count+=1
+
+    def __enter__(self) -> 'StubMqttBroker':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.shutdown()
+        self.server_close()
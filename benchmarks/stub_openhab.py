@@ -0,0 +1,64 @@
+import sys
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict
+
+class _StubHandler(BaseHTTPRequestHandler):
+    server : 'StubOpenhabServer'
+    # keep-alive, like openHAB
+    protocol_version='HTTP/1.1'
+
+    def do_POST(self) -> None:
+        # POST /rest/items/<item> with the state as plain text
+        length=int(self.headers.get('Content-Length', 0))
+        state=self.rfile.read(length).decode()
+        self.server.record(self.path.rsplit('/', 1)[-1], state)
+        self._respond(200, b'')
+
+    def do_GET(self) -> None:
+        item=self.path.split('?', 1)[0].rstrip('/').split('/')[-2] if self.path.endswith('/state') else ''
+        state=self.server.states.get(item)
+        self._respond(200 if state is not None else 404, (state or '').encode())
+
+    def _respond(self, status : int, body : bytes) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+class StubOpenhabServer(ThreadingHTTPServer):
+    """Minimal stand-in of the openHAB REST API (item states only) on a free local port"""
+    daemon_threads=True
+
+    def __init__(self) -> None:
+        super().__init__(('127.0.0.1', 0), _StubHandler)
+        self._lock=threading.Lock()
+        self.states : Dict[str, str] = {}
+        self.post_count=0
+        self._thread=threading.Thread(target=self.serve_forever, name='stub-openhab', daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def handle_error(self, request, client_address) -> None:
+        # clients may disconnect at any time (e.g. a killed process)
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def record(self, item : str, state : str) -> None:
+        with self._lock:
+            self.states[item]=state
+            self.post_count+=1
+
+    def __enter__(self) -> 'StubOpenhabServer':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.shutdown()
+        self.server_close()
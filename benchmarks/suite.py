@@ -0,0 +1,182 @@
+import argparse
+import importlib.metadata
+import json
+import logging
+import platform
+import sys
+import tempfile
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, Any, List, Dict, Optional
+from .bench_sml_frame import load_captures
+from .bench_batch import create_values
+from .bench_persistence import create_day
+from .stub_openhab import StubOpenhabServer
+from .stub_mqtt import StubMqttBroker
+from smart_meter_to_openhab.interfaces import SmartMeterValues, create_from_persistence_values
+from smart_meter_to_openhab.openhab import OpenhabConnection
+from smart_meter_to_openhab.mqtt import MqttConnection, MqttSettings
+from smart_meter_to_openhab.sml_iskra_mt175 import SmlIskraMt175OneWay, _decode_sml_iskra_mt175_one_way
+from smart_meter_to_openhab.sml_parser import SmlParseError
+from smart_meter_to_openhab.transport import ReplayTransport
+from smart_meter_to_openhab.metrics import MetricsRegistry
+from smart_meter_to_openhab.timeseries import TimeSeriesArchive
+from smart_meter_to_openhab.rolling import SmartMeterRollingWindow
+
+OH_ITEM_NAMES=('bench_phase_1', 'bench_phase_2', 'bench_phase_3', 'bench_overall', 'bench_electricity_meter')
+
+@dataclass
+class BenchmarkResult():
+    name : str
+    # number of measured calls and the number of processed items (frames, values, ...) per call
+    calls : int
+    items_per_call : int
+    total_sec : float
+    items_per_sec : float
+    latency_p50_us : float
+    latency_p99_us : float
+    latency_max_us : float
+
+def measure(name : str, function : Callable[[], Any], calls : int, items_per_call : int = 1, warmup : int = 1) -> BenchmarkResult:
+    for _ in range(warmup):
+        function()
+    latencies : List[float] = []
+    for _ in range(calls):
+        start=perf_counter()
+        function()
+        latencies.append(perf_counter()-start)
+    latencies.sort()
+    total=sum(latencies)
+    result=BenchmarkResult(name, calls, items_per_call, total, calls*items_per_call/total if total > 0 else 0,
+                           latencies[len(latencies)//2]*1e6, latencies[min(len(latencies)-1, int(len(latencies)*0.99))]*1e6, latencies[-1]*1e6)
+    print(f"{name:40}: {result.items_per_sec:12.1f} items/s, p50 {result.latency_p50_us:10.1f} us, p99 {result.latency_p99_us:10.1f} us")
+    return result
+
+def bench_read_raw(frame_count : int) -> BenchmarkResult:
+    reader=SmlIskraMt175OneWay(ReplayTransport(load_captures(), speedup=0), logging.getLogger('benchmark'))
+    return measure('read_raw (replay)', reader._read_raw, frame_count)
+
+def bench_decode(repeat : int) -> BenchmarkResult:
+    frames=load_captures()
+    def _decode() -> None:
+        for frame in frames:
+            try:
+                _decode_sml_iskra_mt175_one_way(frame)
+            except SmlParseError:
+                pass
+    return measure('decode (tests/data)', _decode, repeat, len(frames))
+
+def bench_metrics(calls : int) -> BenchmarkResult:
+    registry=MetricsRegistry()
+    counter=registry.counter('bench_counter', "Counter.")
+    histogram=registry.histogram('bench_histogram', "Histogram.", (1e-5, 1e-4, 1e-3))
+    def _record() -> None:
+        # instrumentation of one decoded frame
+        counter.inc()
+        histogram.observe(5e-5)
+    return measure('metrics (counter + histogram)', _record, calls)
+
+def bench_aggregate(count : int, calls : int) -> List[BenchmarkResult]:
+    values=create_values(count)
+    return [measure(f'create_mean ({count} reads)', lambda: SmartMeterValues.create_mean(values), calls, count),
+            measure(f'create_median ({count} reads)', lambda: SmartMeterValues.create_median(values), calls, count)]
+
+def bench_rolling(capacity : int, calls : int) -> BenchmarkResult:
+    values=create_values(capacity+calls+1)
+    window=SmartMeterRollingWindow(capacity, OH_ITEM_NAMES)
+    for value in values[:capacity]:
+        window.push(value)
+    reads=iter(values[capacity:])
+    def _push() -> None:
+        window.push(next(reads))
+        window.median()
+    return measure(f'rolling window push + median ({capacity})', _push, calls)
+
+def bench_create_from_persistence(seconds : int, calls : int) -> BenchmarkResult:
+    pers_values=create_day(seconds)
+    return measure(f'create_from_persistence ({seconds} rows)', lambda: create_from_persistence_values(pers_values), calls, seconds)
+
+def bench_post_to_items(calls : int) -> BenchmarkResult:
+    with StubOpenhabServer() as server:
+        connection=OpenhabConnection(server.url, '', '', logging.getLogger('benchmark'))
+        values=SmartMeterValues(100, 200, 300, 600, 1000, OH_ITEM_NAMES)
+        def _post() -> None:
+            values.overall_consumption.value+=1
+            if not connection.post_to_items(values):
+                raise RuntimeError("Failed to post values to the stub server")
+        try:
+            return measure('post_to_items (local stub)', _post, calls, len(OH_ITEM_NAMES))
+        finally:
+            connection.close()
+
+def bench_publish_mqtt(calls : int, qos : int) -> BenchmarkResult:
+    with StubMqttBroker() as broker:
+        connection=MqttConnection('127.0.0.1', broker.port, '', '', logging.getLogger('benchmark'), MqttSettings(qos=qos)) # type: ignore
+        values=SmartMeterValues(100, 200, 300, 600, 1000, OH_ITEM_NAMES)
+        def _publish() -> None:
+            values.overall_consumption.value+=1
+            if not connection.post_to_items(values):
+                raise RuntimeError("Failed to publish values to the stub broker")
+        try:
+            return measure(f'post_to_items mqtt qos {qos} (local stub)', _publish, calls, len(OH_ITEM_NAMES))
+        finally:
+            connection.close()
+
+def bench_timeseries(seconds : int, calls : int) -> List[BenchmarkResult]:
+    # a day of 1 second reads, queried for the mean of the day (with partial minutes at both edges)
+    with tempfile.TemporaryDirectory() as directory:
+        archive=TimeSeriesArchive(Path(directory), logging.getLogger('benchmark'), grow_records=seconds)
+        values=SmartMeterValues(100, 200, 300, 600, 1000, OH_ITEM_NAMES)
+        timestamps=iter(range(1709251200, 1709251200+seconds+calls+1))
+        results=[measure('timeseries append', lambda: archive.append(values, next(timestamps)), seconds)]
+        results.append(measure(f'timeseries mean ({seconds} rows)', lambda: archive.mean('overall_consumption', 1709251200.5, 1709251200.5+seconds-1), calls, seconds))
+        archive.close()
+        return results
+
+def compare(results : List[BenchmarkResult], baseline_file : Path, tolerance : float) -> List[str]:
+    """Returns the names of the benchmarks with a throughput below the baseline (minus tolerance)"""
+    with open(baseline_file, 'r') as f:
+        baseline : Dict[str, Dict[str, Any]] = {result['name'] : result for result in json.load(f)['results']}
+    regressions : List[str] = []
+    for result in results:
+        if result.name not in baseline:
+            continue
+        ratio=result.items_per_sec/baseline[result.name]['items_per_sec']
+        print(f"{result.name:40}: {ratio:6.2f} x baseline{'  <-- REGRESSION' if ratio < 1-tolerance else ''}")
+        if ratio < 1-tolerance:
+            regressions.append(result.name)
+    return regressions
+
+def main() -> None:
+    parser=argparse.ArgumentParser(description="Run all benchmarks of the hot paths and write the results to a json file")
+    parser.add_argument("-o", "--output", type=Path, default=Path('benchmark_results.json'))
+    parser.add_argument("--baseline", type=Path, required=False, help="Compare the results with the results of a previous run (e.g. the last release).")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Relative throughput loss compared to the baseline that is accepted.")
+    parser.add_argument("--quick", action='store_true', help="Less iterations (for a smoke test).")
+    args=parser.parse_args()
+    scale=10 if args.quick else 1
+
+    results : List[BenchmarkResult] = [bench_read_raw(2000//scale), bench_decode(2000//scale), bench_metrics(100000//scale)]
+    results+=bench_aggregate(3600, 20//scale)
+    results+=bench_aggregate(86400, 5)
+    results.append(bench_rolling(3600, 10000//scale))
+    results.append(bench_create_from_persistence(86400, 5))
+    results.append(bench_post_to_items(500//scale))
+    results+=[bench_publish_mqtt(5000//scale, 0), bench_publish_mqtt(5000//scale, 1)]
+    results+=bench_timeseries(86400//scale, 200//scale)
+
+    try:
+        version=importlib.metadata.version('smart_meter_to_openhab')
+    except importlib.metadata.PackageNotFoundError:
+        version='development'
+    with open(args.output, 'w') as f:
+        json.dump({'version' : version, 'python' : platform.python_version(), 'machine' : platform.machine(),
+                   'timestamp' : datetime.now().astimezone().isoformat(), 'results' : [asdict(result) for result in results]}, f, indent=2)
+    print(f"Results written to {args.output}")
+    if args.baseline and compare(results, args.baseline, args.tolerance):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
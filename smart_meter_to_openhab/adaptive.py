@@ -0,0 +1,101 @@
+import math
+from dataclasses import dataclass
+from logging import Logger
+from typing import List, Optional
+from .interfaces import SmartMeterValues
+from . import metrics
+
+@dataclass(frozen=True)
+class AdaptiveSettings():
+    # bounds of the number of reads per published value
+    min_read_count : int = 5
+    max_read_count : int = 60
+    # the load is steady if the standard deviation of the overall consumption within a cycle
+    # and the change of its mean compared to the last published value are below this (W)
+    steady_std_w : float = 10
+    # the load changed sharply if the overall consumption differs more than this (W) from the last published value
+    change_w : float = 100
+    # number of consecutive reads that have to confirm a sharp change (a single outlier does not end the cycle)
+    change_reads : int = 2
+
+class AdaptiveScheduler():
+    """Adapts the number of reads per published value (see SmartMeterReader.read_avg) to the variance of the overall consumption
+
+    While the load is steady (see variation), the number of reads is doubled after each cycle (up to max_read_count), so steady loads
+    (e.g. the baseload at night) are published less often. If the load varies within a cycle, the number is halved.
+    A sharp change ends the cycle early (see observe), so it is published within change_reads reads (only the reads
+    since the change are aggregated), and the next cycles start with min_read_count reads again.
+    """
+    def __init__(self, settings : AdaptiveSettings, logger : Logger) -> None:
+        if settings.min_read_count < 1 or settings.max_read_count < settings.min_read_count:
+            raise ValueError(f"Unable to create AdaptiveScheduler: Invalid read count bounds {settings.min_read_count} to {settings.max_read_count}")
+        self._settings=settings
+        self._logger=logger
+        self.read_count=settings.min_read_count
+        # overall consumption of the last published values
+        self._reference : Optional[float] = None
+        self._change_reads=0
+        self._changed=False
+        # running variance of the overall consumption in the current cycle (Welford)
+        self._count=0
+        self._mean=0.0
+        self._m2=0.0
+        self.change_count=0
+        metrics.READ_COUNT.set(self.read_count)
+
+    def observe(self, values : SmartMeterValues) -> int:
+        """Add a good read of the current cycle. If the load changed sharply and the cycle should end now, returns
+        the number of the latest reads that belong to the new load (0 otherwise)."""
+        overall=values.overall_consumption.value
+        if overall is None:
+            return 0
+        self._count+=1
+        delta=overall-self._mean
+        self._mean+=delta/self._count
+        self._m2+=delta*(overall-self._mean)
+        if self._reference is None or abs(overall-self._reference) <= self._settings.change_w:
+            self._change_reads=0
+            return 0
+        self._change_reads+=1
+        self._changed=self._change_reads >= self._settings.change_reads
+        return self._change_reads if self._changed else 0
+
+    @property
+    def std(self) -> Optional[float]:
+        """Standard deviation of the overall consumption in the current cycle (None for less than two reads)"""
+        return math.sqrt(self._m2/(self._count-1)) if self._count > 1 else None
+
+    @property
+    def variation(self) -> Optional[float]:
+        """The standard deviation of the current cycle or the change of its mean compared to the last published value, whichever is larger"""
+        variations : List[float] = []
+        std=self.std
+        if std is not None:
+            variations.append(std)
+        if self._count and self._reference is not None:
+            variations.append(abs(self._mean-self._reference))
+        return max(variations) if variations else None
+
+    def end_cycle(self, values : SmartMeterValues) -> None:
+        """Adapt the number of reads of the next cycle. values are the published (aggregated) values of the cycle."""
+        read_count=self.read_count
+        variation=self.variation
+        if self._changed:
+            self.change_count+=1
+            read_count=self._settings.min_read_count
+        elif variation is not None and variation <= self._settings.steady_std_w:
+            read_count=min(self._settings.max_read_count, read_count*2)
+        elif variation is not None:
+            read_count=max(self._settings.min_read_count, read_count//2)
+        if read_count != self.read_count:
+            self._logger.info(f"Adapting the number of reads per value from {self.read_count} to {read_count} "
+                              f"(variation {variation if variation is not None else 0:.1f} W{', sharp change' if self._changed else ''}).")
+            self.read_count=read_count
+            metrics.READ_COUNT.set(read_count)
+        if values.overall_consumption.value is not None:
+            self._reference=values.overall_consumption.value
+        self._change_reads=0
+        self._changed=False
+        self._count=0
+        self._mean=0.0
+        self._m2=0.0
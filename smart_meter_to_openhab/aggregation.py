@@ -0,0 +1,58 @@
+from collections import deque
+from typing import Deque, Optional, Tuple
+from .interfaces import SmartMeterValues, SmartMeterOhItemNames
+from .batch import SmartMeterBatch, AggregateType
+
+class SlidingWindowAggregator():
+    """Keeps the values of a time based sliding window and aggregates them on a configurable cadence.
+
+    Parameters
+    ----------
+    window_sec : float
+        Values older than this (relative to the latest added value) are removed from the window
+    emit_interval_sec : float, optional
+        Emit an aggregate if this time has passed since the last emit
+    emit_frame_count : int, optional
+        Emit an aggregate if this number of values has been added since the last emit
+    oh_item_names : SmartMeterOhItemNames, optional
+        Items of the aggregated values (default: the items specified by the environment variables)
+    """
+    def __init__(self, window_sec : float, emit_interval_sec : Optional[float] = None, emit_frame_count : Optional[int] = None,
+                 oh_item_names : Optional[SmartMeterOhItemNames] = None) -> None:
+        if window_sec <= 0:
+            raise ValueError(f"Unable to create SlidingWindowAggregator: window_sec has to be positive")
+        if emit_interval_sec is None and emit_frame_count is None:
+            emit_interval_sec=window_sec
+        self._window_sec=window_sec
+        self._emit_interval_sec=emit_interval_sec
+        self._emit_frame_count=emit_frame_count
+        self._oh_item_names=oh_item_names
+        self._values : Deque[Tuple[float, SmartMeterValues]] = deque()
+        self._last_emit_time : Optional[float] = None
+        self._frames_since_emit=0
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def add(self, timestamp : float, values : SmartMeterValues) -> None:
+        self._values.append((timestamp, values))
+        self._frames_since_emit+=1
+        self._remove_outdated(timestamp)
+
+    def emit_due(self, timestamp : float) -> bool:
+        if self._last_emit_time is None:
+            self._last_emit_time=timestamp
+        if self._emit_frame_count is not None and self._frames_since_emit >= self._emit_frame_count:
+            return True
+        return self._emit_interval_sec is not None and timestamp-self._last_emit_time >= self._emit_interval_sec
+
+    def emit(self, timestamp : float, aggregate : AggregateType = 'mean') -> SmartMeterValues:
+        """Aggregate all values in the window and restart the emit cadence"""
+        self._remove_outdated(timestamp)
+        self._last_emit_time=timestamp
+        self._frames_since_emit=0
+        return SmartMeterBatch([value for _, value in self._values], self._oh_item_names).aggregate(aggregate)
+
+    def _remove_outdated(self, timestamp : float) -> None:
+        while self._values and self._values[0][0] < timestamp-self._window_sec:
+            self._values.popleft()
@@ -0,0 +1,151 @@
+import math
+import warnings
+from array import array
+from typing import Any, List, Literal, Optional, Sequence, Tuple, Union, get_args
+from .interfaces import SmartMeterValues, SmartMeterOhItemNames
+
+# NumPy is imported on the first large batch (see numpy_available). The import takes longer than most batches.
+np : Any = None
+_numpy_checked=False
+
+def numpy_available() -> bool:
+    """Import NumPy (optional dependency). Returns False if it is not installed."""
+    global np, _numpy_checked
+    if not _numpy_checked:
+        _numpy_checked=True
+        try:
+            import numpy
+            np=numpy
+        except ImportError:
+            pass
+    return np is not None
+
+AggregateType = Literal['mean', 'median', 'trimmed_mean', 'mad_mean']
+AGGREGATE_TYPES : Tuple[str, ...] = get_args(AggregateType)
+
+# scales the median absolute deviation to the standard deviation of normal distributed values
+_MAD_SCALE=1.4826
+_CHANNEL_COUNT=5
+# the call overhead of NumPy outweighs the vectorization for small batches (e.g. the few reads of read_avg)
+_NUMPY_MIN_COUNT=1000
+
+class SmartMeterBatch():
+    """Column wise statistics of a batch of SmartMeterValues (N reads x 5 channels)
+
+    Missing values (None) are masked per channel. The statistics of large batches are computed with NumPy if it is installed
+    (optional dependency), otherwise with a pure Python fallback. Channels without any value result in None.
+
+    Parameters
+    ----------
+    values : Sequence[SmartMeterValues]
+        The reads of the batch
+    user_specified_oh_item_names : SmartMeterOhItemNames, optional
+        Item names of the returned SmartMeterValues
+    use_numpy : bool, optional
+        Force (or prevent) the use of NumPy. Default: use NumPy if it is installed and the batch is large.
+    """
+    def __init__(self, values : Sequence[SmartMeterValues], user_specified_oh_item_names : Optional[SmartMeterOhItemNames] = None,
+                 use_numpy : Optional[bool] = None) -> None:
+        if use_numpy and not numpy_available():
+            raise ImportError("Unable to create SmartMeterBatch: NumPy is not installed")
+        self._oh_item_names=user_specified_oh_item_names
+        self._use_numpy=len(values) >= _NUMPY_MIN_COUNT and numpy_available() if use_numpy is None else use_numpy
+        # the values are stored with NaN as "no value", so they can be concatenated without conversion
+        flat=array('d')
+        for value in values:
+            flat.extend(value._values)
+        self._count=len(values)
+        if self._use_numpy:
+            self._data=np.frombuffer(flat, dtype=np.float64).reshape(self._count, _CHANNEL_COUNT)
+        else:
+            self._columns=[[value for value in flat[channel::_CHANNEL_COUNT] if value == value] for channel in range(_CHANNEL_COUNT)]
+
+    def __len__(self) -> int:
+        return self._count
+
+    def mean(self) -> SmartMeterValues:
+        if self._use_numpy:
+            return self._create(self._masked_mean(self._data))
+        return self._create([math.fsum(column)/len(column) if column else None for column in self._columns])
+
+    def median(self) -> SmartMeterValues:
+        if self._use_numpy:
+            return self._create(self._nanmedian(self._data))
+        return self._create([_median(sorted(column)) if column else None for column in self._columns])
+
+    def trimmed_mean(self, proportion : float = 0.1) -> SmartMeterValues:
+        """Mean of each channel without the smallest and the largest proportion of its values"""
+        if not 0 <= proportion < 0.5:
+            raise ValueError(f"Unable to calculate trimmed mean: proportion has to be in [0, 0.5)")
+        if self._use_numpy:
+            # NaN is sorted to the end of each channel
+            sorted_data=np.sort(self._data, axis=0)
+            counts=np.count_nonzero(~np.isnan(self._data), axis=0)
+            cut=(counts*proportion).astype(np.int64)
+            rows=np.arange(self._count).reshape(-1, 1)
+            return self._create(self._masked_mean(np.where((rows >= cut) & (rows < counts-cut), sorted_data, np.nan)))
+        means : List[Optional[float]] = []
+        for column in self._columns:
+            cut=int(len(column)*proportion)
+            trimmed=sorted(column)[cut:len(column)-cut]
+            means.append(math.fsum(trimmed)/len(trimmed) if trimmed else None)
+        return self._create(means)
+
+    def reject_outliers(self, threshold : float = 3.5) -> 'SmartMeterBatch':
+        """Returns a batch without the values that deviate more than threshold (scaled) median absolute deviations
+        from the median of their channel. Channels with a MAD of 0 are not filtered."""
+        batch=SmartMeterBatch.__new__(SmartMeterBatch)
+        batch._oh_item_names=self._oh_item_names
+        batch._use_numpy=self._use_numpy
+        batch._count=self._count
+        if self._use_numpy:
+            median=self._nanmedian(self._data)
+            deviation=np.abs(self._data-median)
+            mad=self._nanmedian(deviation)*_MAD_SCALE
+            outlier=(deviation > threshold*mad) & (mad > 0)
+            batch._data=np.where(outlier, np.nan, self._data)
+        else:
+            batch._columns=[]
+            for column in self._columns:
+                if not column:
+                    batch._columns.append(column)
+                    continue
+                median=_median(sorted(column))
+                mad=_median(sorted(abs(value-median) for value in column))*_MAD_SCALE
+                batch._columns.append([value for value in column if mad == 0 or abs(value-median) <= threshold*mad])
+        return batch
+
+    def aggregate(self, aggregate : AggregateType = 'mean') -> SmartMeterValues:
+        if aggregate == 'median':
+            return self.median()
+        if aggregate == 'trimmed_mean':
+            return self.trimmed_mean()
+        if aggregate == 'mad_mean':
+            return self.reject_outliers().mean()
+        return self.mean()
+
+    def _create(self, channel_values : Sequence[Union[float, None]]) -> SmartMeterValues:
+        values=[None if value is None or value != value else float(value) for value in channel_values]
+        return SmartMeterValues(values[0], values[1], values[2], values[3], values[4], self._oh_item_names)
+
+    @staticmethod
+    def _masked_mean(data):
+        mask=np.isnan(data)
+        counts=np.count_nonzero(~mask, axis=0)
+        sums=np.where(mask, 0, data).sum(axis=0)
+        return np.divide(sums, counts, out=np.full(_CHANNEL_COUNT, np.nan), where=counts > 0)
+
+    @staticmethod
+    def _nanmedian(data):
+        if not len(data):
+            return np.full(_CHANNEL_COUNT, np.nan)
+        with warnings.catch_warnings():
+            # channels without any value result in NaN (with a RuntimeWarning)
+            warnings.simplefilter('ignore', RuntimeWarning)
+            return np.nanmedian(data, axis=0)
+
+def _median(sorted_values : List[float]) -> float:
+    middle=len(sorted_values)//2
+    if len(sorted_values) % 2:
+        return sorted_values[middle]
+    return (sorted_values[middle-1]+sorted_values[middle])/2
@@ -0,0 +1,78 @@
+import threading
+from logging import Logger
+from time import monotonic
+from typing import Callable, Literal
+
+CircuitState = Literal['closed', 'open', 'half_open']
+
+class CircuitBreaker():
+    """Fails fast after consecutive errors of a remote service (e.g. openHAB is down)
+
+    closed: all requests are allowed. After failure_threshold consecutive failures the circuit opens.
+    open: no requests are allowed for reset_timeout_sec. Then the circuit is half open.
+    half_open: a single probe request is allowed. Its success closes the circuit, its failure opens it again.
+
+    Parameters
+    ----------
+    failure_threshold : int
+        Number of consecutive failures that open the circuit
+    reset_timeout_sec : float
+        Time until a probe request is allowed
+    clock : Callable[[], float]
+        Monotonic time in seconds (for tests)
+    """
+    def __init__(self, logger : Logger, name : str, failure_threshold : int = 5, reset_timeout_sec : float = 30,
+                 clock : Callable[[], float] = monotonic) -> None:
+        if failure_threshold < 1:
+            raise ValueError(f"Unable to create CircuitBreaker: failure_threshold has to be at least 1")
+        self._logger=logger
+        self._name=name
+        self._failure_threshold=failure_threshold
+        self._reset_timeout_sec=reset_timeout_sec
+        self._clock=clock
+        self._lock=threading.Lock()
+        self._state : CircuitState = 'closed'
+        self._failures=0
+        self._opened_at=0.0
+        self._probe_active=False
+        self.rejected_count=0
+
+    @property
+    def state(self) -> CircuitState:
+        with self._lock:
+            if self._state == 'open' and self._clock()-self._opened_at >= self._reset_timeout_sec:
+                return 'half_open'
+            return self._state
+
+    def allow_request(self) -> bool:
+        """Returns False if the request must not be sent. Each allowed request has to be followed by record_success or record_failure."""
+        with self._lock:
+            if self._state == 'closed':
+                return True
+            if self._state == 'open' and self._clock()-self._opened_at >= self._reset_timeout_sec:
+                self._state='half_open'
+            if self._state == 'half_open' and not self._probe_active:
+                self._probe_active=True
+                return True
+            self.rejected_count+=1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != 'closed':
+                self._logger.info(f"{self._name} is reachable again. Closed circuit after {self.rejected_count} rejected requests.")
+            self._state='closed'
+            self._failures=0
+            self._probe_active=False
+            self.rejected_count=0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures+=1
+            if self._state == 'half_open' or (self._state == 'closed' and self._failures >= self._failure_threshold):
+                if self._state == 'closed':
+                    self._logger.warning(f"{self._name} failed {self._failures} times in a row. "
+                                         f"Opened circuit: requests fail fast for {self._reset_timeout_sec} sec.")
+                self._state='open'
+                self._opened_at=self._clock()
+                self._probe_active=False
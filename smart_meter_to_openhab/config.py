@@ -0,0 +1,53 @@
+import os
+from dataclasses import dataclass
+from typing import Mapping, Optional, Tuple
+
+# NOTE: Use a tuple (immutable type) here to prevent changing the values
+SmartMeterOhItemNames = Tuple[str, str, str, str, str]
+
+# environment variables of the items (in the order of SmartMeterValues)
+OH_ITEM_ENV_VARIABLES=('PHASE_1_CONSUMPTION_WATT_OH_ITEM', 'PHASE_2_CONSUMPTION_WATT_OH_ITEM', 'PHASE_3_CONSUMPTION_WATT_OH_ITEM',
+                       'OVERALL_CONSUMPTION_WATT_OH_ITEM', 'ELECTRICITY_METER_KWH_OH_ITEM')
+
+@dataclass(frozen=True)
+class Config():
+    """Connection to openHAB (or the MQTT broker) and the items of the smart meter"""
+    oh_host : str = ''
+    oh_user : str = ''
+    oh_passwd : str = ''
+    oh_item_names : SmartMeterOhItemNames = ('', '', '', '', '')
+    mqtt_user : str = ''
+    mqtt_passwd : str = ''
+
+    @staticmethod
+    def from_env(environ : Mapping[str, str] = os.environ, require_oh_host : bool = True, require_oh_items : bool = True) -> 'Config':
+        """Create the configuration from the environment variables (e.g. of the .env file)
+
+        Raises
+        ------
+        ValueError
+            If a required variable is missing: OH_HOST (require_oh_host) or OVERALL_CONSUMPTION_WATT_OH_ITEM (require_oh_items)
+        """
+        if require_oh_host and 'OH_HOST' not in environ:
+            raise ValueError(f"Failed to initialize smart_meter_to_openhab. Required env variable 'OH_HOST' not found")
+        # TODO: nothing is required
+        if require_oh_items and 'OVERALL_CONSUMPTION_WATT_OH_ITEM' not in environ:
+            raise ValueError(f"Failed to initialize smart_meter_to_openhab. Required env variable 'OVERALL_CONSUMPTION_WATT_OH_ITEM' not found")
+        return Config(environ.get('OH_HOST', ''), environ.get('OH_USER', ''), environ.get('OH_PASSWD', ''),
+                      tuple(environ.get(variable, '') for variable in OH_ITEM_ENV_VARIABLES), # type: ignore
+                      environ.get('MQTT_USER', ''), environ.get('MQTT_PASSWD', ''))
+
+_config : Optional[Config] = None
+
+def configure(config : Optional[Config]) -> None:
+    """Set the configuration used by default (e.g. the items of SmartMeterValues). None resets it to the environment variables."""
+    global _config
+    _config=config
+
+def get_config() -> Config:
+    """The configuration set by configure. Otherwise it is created from the environment variables on the first call."""
+    global _config
+    if _config is None:
+        # the items are required only (not the openHAB connection)
+        _config=Config.from_env(require_oh_host=False)
+    return _config
@@ -1,11 +1,11 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import List, Any, Union, Tuple, ClassVar, Iterator, Callable
-from statistics import mean, median
+from typing import List, Any, Union, Tuple, ClassVar, Iterator, Callable, Dict, Iterable
+from array import array
 from abc import ABC, abstractmethod
-from functools import cache
-import os
+import math
 from .utils import PersistenceValuesType
+from .config import SmartMeterOhItemNames, get_config
 
 @dataclass(frozen=True, eq=False)
 class OhItem():
@@ -23,44 +23,121 @@ class OhItem():
     def __bool__(self) -> bool:
         return bool(self.oh_item)
 
-@dataclass(init=False)
+_NO_VALUE=math.nan
+
+def _to_storage(value : Union[float, None]) -> float:
+    return _NO_VALUE if value is None else value
+
+def _from_storage(value : float) -> Union[float, None]:
+    # NaN is the only value that is not equal to itself
+    return None if value != value else value
+
 class OhItemAndValue():
+    """Value of an openHAB item
+
+    The items are interned in a class-wide registry, values only store the index of their item.
+    A value is either standalone or a view into the value storage of an OhItemAndValueContainer.
+    """
+    __slots__ = ('_oh_item_index', '_storage', '_pos')
     _shared_oh_items : ClassVar[List[OhItem]] = []
-    
-    _oh_item_index : int
-    value : Union[float, None] = None
+    _oh_item_indices : ClassVar[Dict[str, int]] = {}
 
     def __init__(self, oh_item_name : str, value : Union[float, None] = None) -> None:
-        if oh_item_name not in OhItemAndValue._shared_oh_items:
+        self._oh_item_index=OhItemAndValue._intern(oh_item_name)
+        self._storage=array('d', (_to_storage(value),))
+        self._pos=0
+
+    @staticmethod
+    def _intern(oh_item_name : str) -> int:
+        oh_item_index=OhItemAndValue._oh_item_indices.get(oh_item_name)
+        if oh_item_index is None:
+            oh_item_index=len(OhItemAndValue._shared_oh_items)
             OhItemAndValue._shared_oh_items.append(OhItem(oh_item_name))
-        for oh_item_index, oh_item in enumerate(OhItemAndValue._shared_oh_items):
-            if oh_item == oh_item_name:
-                self._oh_item_index = oh_item_index
-                self.value = value
-                break
+            OhItemAndValue._oh_item_indices[oh_item_name]=oh_item_index
+        return oh_item_index
+
+    @staticmethod
+    def _view(oh_item_index : int, storage : array, pos : int) -> OhItemAndValue:
+        view=OhItemAndValue.__new__(OhItemAndValue)
+        view._oh_item_index=oh_item_index
+        view._storage=storage
+        view._pos=pos
+        return view
 
     @property
     def oh_item(self) -> OhItem:
         return OhItemAndValue._shared_oh_items[self._oh_item_index]
 
+    @property
+    def value(self) -> Union[float, None]:
+        return _from_storage(self._storage[self._pos])
+
+    @value.setter
+    def value(self, value : Union[float, None]) -> None:
+        self._storage[self._pos]=_to_storage(value)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, OhItemAndValue):
+            return self._oh_item_index == other._oh_item_index and self.value == other.value
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"OhItemAndValue(oh_item={self.oh_item.oh_item!r}, value={self.value!r})"
+
+class _ContainerLayout():
+    """Item indices of a container, shared by all containers with the same item names"""
+    __slots__ = ('oh_item_indices', 'used_positions', 'all_used', 'positions')
+    _layouts : ClassVar[Dict[Tuple[str, ...], _ContainerLayout]] = {}
+
+    def __init__(self, oh_item_names : Tuple[str, ...]) -> None:
+        self.oh_item_indices=tuple(OhItemAndValue._intern(name) for name in oh_item_names)
+        # consider only the values that really will be used (oh_item name not empty)
+        self.used_positions=tuple(pos for pos, name in enumerate(oh_item_names) if name)
+        self.all_used=len(self.used_positions) == len(oh_item_names)
+        self.positions : Dict[int, int] = {}
+        for pos, oh_item_index in enumerate(self.oh_item_indices):
+            self.positions.setdefault(oh_item_index, pos)
+
+    @staticmethod
+    def get(oh_item_names : Tuple[str, ...]) -> _ContainerLayout:
+        layout=_ContainerLayout._layouts.get(oh_item_names)
+        if layout is None:
+            layout=_ContainerLayout._layouts[oh_item_names]=_ContainerLayout(oh_item_names)
+        return layout
+
 ContainerValuesType = Union[Tuple[Union[float, None], ...], None]
 class OhItemAndValueContainer(ABC):
+    __slots__ = ('_layout', '_values')
+
     def __init__(self, oh_item_names : Tuple[str, ...], values : ContainerValuesType = None) -> None:
         if values is not None and len(oh_item_names) != len(values):
             # TODO: move this to __post_init__ and raise an exception there
             raise ValueError(f"Unable to create OhItemAndValueContainer: Value size mismatch")
-        self._oh_items_and_values=[OhItemAndValue(oh_item_names[i], values[i] if values is not None else None) for i in range(len(oh_item_names))]
+        self._layout=_ContainerLayout.get(oh_item_names)
+        if values is None:
+            self._values=array('d', (_NO_VALUE,))*len(oh_item_names)
+        elif None in values:
+            self._values=array('d', [_NO_VALUE if value is None else value for value in values])
+        else:
+            self._values=array('d', values) # type: ignore
+
+    @property
+    def _oh_items_and_values(self) -> List[OhItemAndValue]:
+        return [OhItemAndValue._view(oh_item_index, self._values, pos) for pos, oh_item_index in enumerate(self._layout.oh_item_indices)]
+
+    def _item_value(self, pos : int) -> OhItemAndValue:
+        return OhItemAndValue._view(self._layout.oh_item_indices[pos], self._values, pos)
 
     def reset(self) -> None:
-        for oh_item_value in self._oh_items_and_values:
-            oh_item_value.value = None
+        for pos in range(len(self._values)):
+            self._values[pos]=_NO_VALUE
 
-    def assign_values(self, new_values : List[OhItemAndValue]) -> None:
+    def assign_values(self, new_values : Iterable[OhItemAndValue]) -> None:
+        positions=self._layout.positions
         for new_value in new_values:
-            for this_value in self._oh_items_and_values:
-                if this_value.oh_item == new_value.oh_item:
-                    this_value.value = new_value.value
-                    break
+            pos=positions.get(new_value._oh_item_index)
+            if pos is not None:
+                self._values[pos]=new_value._storage[new_value._pos]
 
     def __iter__(self) -> Iterator[OhItemAndValue]:
         return iter(self._oh_items_and_values)
@@ -75,51 +152,50 @@ class OhItemAndValueContainer(ABC):
     
     def value_list(self) -> List[Any]:
         # consider only the values that really will be used (oh_item name not empty)
-        return [oh_item_value.value for oh_item_value in self._oh_items_and_values  if oh_item_value.oh_item]
+        values=self._values.tolist() if self._layout.all_used else [self._values[pos] for pos in self._layout.used_positions]
+        return [value if value == value else None for value in values]
     
     def __eq__(self, other) -> bool:
         if isinstance(other, OhItemAndValueContainer):
             return self.value_list() == other.value_list()
         return False
     
-# NOTE: Use a tuple (immutable type) here to prevent changing the values 
-SmartMeterOhItemNames = Tuple[str, str, str, str, str]
-def _read_smart_meter_env() -> SmartMeterOhItemNames:
-    return (os.getenv('PHASE_1_CONSUMPTION_WATT_OH_ITEM', default=''),
-            os.getenv('PHASE_2_CONSUMPTION_WATT_OH_ITEM', default=''),
-            os.getenv('PHASE_3_CONSUMPTION_WATT_OH_ITEM', default=''),
-            os.getenv('OVERALL_CONSUMPTION_WATT_OH_ITEM', default=''),
-            os.getenv('ELECTRICITY_METER_KWH_OH_ITEM', default=''))
-
 class SmartMeterValues(OhItemAndValueContainer):
-    _oh_item_names : SmartMeterOhItemNames = _read_smart_meter_env()
+    __slots__ = ()
     
     def __init__(self, phase_1_consumption : Union[float, None] = None, phase_2_consumption : Union[float, None] = None, 
                  phase_3_consumption : Union[float, None] = None, overall_consumption : Union[float, None] = None, 
                  electricity_meter : Union[float, None] = None, 
                  user_specified_oh_item_names : Union[SmartMeterOhItemNames, None] = None) -> None:
-        oh_items = user_specified_oh_item_names if user_specified_oh_item_names is not None else SmartMeterValues._oh_item_names
+        oh_items = user_specified_oh_item_names if user_specified_oh_item_names is not None else get_config().oh_item_names
         super().__init__(oh_items, (phase_1_consumption, phase_2_consumption, phase_3_consumption, overall_consumption, electricity_meter))
 
     @property
     def phase_1_consumption(self) -> OhItemAndValue:
-        return self._oh_items_and_values[0]
+        return self._item_value(0)
     @property
     def phase_2_consumption(self) -> OhItemAndValue:
-        return self._oh_items_and_values[1]
+        return self._item_value(1)
     @property
     def phase_3_consumption(self) -> OhItemAndValue:
-        return self._oh_items_and_values[2]
+        return self._item_value(2)
     @property
     def overall_consumption(self) -> OhItemAndValue:
-        return self._oh_items_and_values[3]
+        return self._item_value(3)
     @property
     def electricity_meter(self) -> OhItemAndValue:
-        return self._oh_items_and_values[4]
+        return self._item_value(4)
     
     def is_invalid(self) -> bool:
-        number_values=[value for value in self.value_list() if value is not None]
-        return (not number_values) or any(value < 0 for value in number_values)
+        values=self._values
+        has_number_value=False
+        for pos in self._layout.used_positions:
+            value=values[pos]
+            if value < 0:
+                return True
+            # NaN (no value) is neither smaller nor equal to anything
+            has_number_value=has_number_value or value == value
+        return not has_number_value
     
     def is_valid(self) -> bool:
         return not self.is_invalid()
@@ -128,19 +204,20 @@ class SmartMeterValues(OhItemAndValueContainer):
         return not self.is_consistent(prev_values)
 
     def is_consistent(self, prev_values : SmartMeterValues) -> bool:
-        if self.electricity_meter.value is None or prev_values.electricity_meter.value is None:
+        e_meter, prev_e_meter=self._values[4], prev_values._values[4]
+        if e_meter != e_meter or prev_e_meter != prev_e_meter:
             return True
-        e_meter_unexpected_high = prev_values.electricity_meter.value > 1 and self.electricity_meter.value > prev_values.electricity_meter.value*2
-        return self.electricity_meter.value >= prev_values.electricity_meter.value and not e_meter_unexpected_high
+        e_meter_unexpected_high = prev_e_meter > 1 and e_meter > prev_e_meter*2
+        return e_meter >= prev_e_meter and not e_meter_unexpected_high
 
     def __repr__(self) -> str:
         return f"L1={self.phase_1_consumption.value} L2={self.phase_2_consumption.value} "\
             f"L3={self.phase_3_consumption.value} Overall={self.overall_consumption.value} E={self.electricity_meter.value}"
 
     @staticmethod
-    @cache
     def oh_item_names() -> SmartMeterOhItemNames:
-        return SmartMeterValues._oh_item_names
+        """The items of the configuration (see config.get_config)"""
+        return get_config().oh_item_names
 
     @staticmethod    
     def create(values : List[OhItemAndValue], user_specified_oh_item_names : Union[SmartMeterOhItemNames, None] = None) -> SmartMeterValues:
@@ -150,11 +227,13 @@ class SmartMeterValues(OhItemAndValueContainer):
 
     @staticmethod
     def create_mean(values : List[SmartMeterValues], user_specified_oh_item_names : Union[SmartMeterOhItemNames, None] = None) -> SmartMeterValues:
-        return SmartMeterValues.create_avg(values, mean, user_specified_oh_item_names)
+        from .batch import SmartMeterBatch
+        return SmartMeterBatch(values, user_specified_oh_item_names).mean()
     
     @staticmethod
     def create_median(values : List[SmartMeterValues], user_specified_oh_item_names : Union[SmartMeterOhItemNames, None] = None) -> SmartMeterValues:
-        return SmartMeterValues.create_avg(values, median, user_specified_oh_item_names)
+        from .batch import SmartMeterBatch
+        return SmartMeterBatch(values, user_specified_oh_item_names).median()
     
     @staticmethod
     def create_avg(values : List[SmartMeterValues], operator : Callable[[List[float]], float], 
@@ -181,44 +260,63 @@ class SmartMeterValues(OhItemAndValueContainer):
     # This could be some data optimization in openhab or similar. Whatever the reason is, we have to support it.
     @staticmethod
     def check_if_updated(pers_values : PersistenceValuesType) -> bool:
-        # no consumption is good and considered as updated.
-        electricity_meter_values=SmartMeterValues.all_values_for_item(4, pers_values)
-        if len(electricity_meter_values) > 1 and all(value == electricity_meter_values[0] for value in electricity_meter_values):
-            return True
-        
-        # for all other cases, at least one value has to be different
-        for values in pers_values:
-            if any(value != values[0] for value in values):
-                return True
-        return False
+        return PersistenceValuesView(pers_values).is_updated()
     
     @staticmethod
     def all_values_for_item(oh_item_index : int, pers_values : PersistenceValuesType) -> List[float]:
-        if not SmartMeterValues.oh_item_names()[oh_item_index]:
-            return []
+        return PersistenceValuesView(pers_values).column(oh_item_index)
 
-        pers_value_index=0
-        for i in range(oh_item_index):
-            if SmartMeterValues.oh_item_names()[i]:
-                pers_value_index+=1
-        return pers_values[pers_value_index] if pers_value_index < len(pers_values) else []
+class PersistenceValuesView():
+    """Columnar view of persistence values without copying them
+
+    The persistence values contain one column per used item (item name not empty) in the order of SmartMeterValues.
+    Rows (SmartMeterValues) are only created on access.
+    """
+    __slots__ = ('_columns', '_oh_item_names', '_column_indices')
+
+    def __init__(self, pers_values : PersistenceValuesType, user_specified_oh_item_names : Union[SmartMeterOhItemNames, None] = None) -> None:
+        self._columns=pers_values
+        self._oh_item_names=user_specified_oh_item_names if user_specified_oh_item_names is not None else SmartMeterValues.oh_item_names()
+        column_indices : List[Union[int, None]] = []
+        column_index=0
+        for name in self._oh_item_names:
+            column_indices.append(column_index if name and column_index < len(pers_values) else None)
+            column_index+=1 if name else 0
+        self._column_indices=tuple(column_indices)
+
+    def __len__(self) -> int:
+        return len(self._columns[0]) if self._columns else 0
+
+    def __getitem__(self, index : int) -> SmartMeterValues:
+        values=[self._columns[column_index][index] if column_index is not None else None for column_index in self._column_indices]
+        return SmartMeterValues(values[0], values[1], values[2], values[3], values[4], self._oh_item_names)
+
+    def __iter__(self) -> Iterator[SmartMeterValues]:
+        # NOTE: rows are accessed by index, columns of unequal size raise an IndexError
+        return (self[index] for index in range(len(self)))
+
+    def column(self, oh_item_index : int) -> List[float]:
+        column_index=self._column_indices[oh_item_index]
+        return self._columns[column_index] if column_index is not None else []
+
+    def is_updated(self) -> bool:
+        # no consumption is good and considered as updated.
+        electricity_meter_values=self.column(4)
+        if len(electricity_meter_values) > 1 and electricity_meter_values.count(electricity_meter_values[0]) == len(electricity_meter_values):
+            return True
+        
+        # for all other cases, at least one value has to be different
+        return any(values and values.count(values[0]) != len(values) for values in self._columns)
 
 def create_from_persistence_values(list_values : PersistenceValuesType) -> List[SmartMeterValues]:
-    smart_meter_values : List[SmartMeterValues] = []
-    valid_items=[item for item in SmartMeterValues.oh_item_names() if item]
-    for value_index in range(len(list_values[0]) if list_values else 0):
-        item_value_list : List[OhItemAndValue] = []
-        for item_index, item in enumerate(valid_items):
-            item_value_list.append(OhItemAndValue(item, list_values[item_index][value_index]))
-        smart_meter_values.append(SmartMeterValues.create(item_value_list))
-    return smart_meter_values
+    return list(PersistenceValuesView(list_values))
 
 def convert_to_persistence_values(values : List[SmartMeterValues]) -> PersistenceValuesType:
-    list_values : PersistenceValuesType = []
-    for i in range(len(SmartMeterValues().value_list())):
-        list_values.append([])
+    # transpose the value storage of all containers at once instead of converting value by value
+    flat=array('d')
     for value_set in values:
-        for index_value, value in enumerate(value_set.value_list()):
-            if SmartMeterValues.oh_item_names()[index_value] and value is not None:
-                list_values[index_value].append(value)
-    return list_values
\ No newline at end of file
+        flat.extend(value_set._values)
+    oh_item_names=SmartMeterValues.oh_item_names()
+    item_count=len(oh_item_names)
+    # one column per used item (see PersistenceValuesView)
+    return [[value for value in flat[pos::item_count] if value == value] for pos in _ContainerLayout.get(oh_item_names).used_positions]
@@ -0,0 +1,210 @@
+import base64
+import http.client
+import json
+import socket
+import threading
+from logging import Logger
+from time import monotonic
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+from . import metrics
+
+# events of openHAB that contain the new state of an item (ItemStateUpdatedEvent since openHAB 4)
+ITEM_STATE_EVENT_TYPES=('ItemStateEvent', 'ItemStateUpdatedEvent', 'ItemStateChangedEvent')
+_EVENT_TOPICS='openhab/items/*/state,openhab/items/*/stateupdated,openhab/items/*/statechanged'
+
+def parse_event_stream(lines : Iterable[str]) -> Iterator[Tuple[str, str]]:
+    """Parse the lines of a server-sent event stream (without line breaks)
+
+    Returns
+    -------
+    Iterator[Tuple[str, str]]
+        The event type ('message' if not set) and the data of each event
+    """
+    event_type=''
+    data : List[str] = []
+    for line in lines:
+        if not line:
+            # an empty line dispatches the event
+            if data:
+                yield event_type or 'message', '\n'.join(data)
+            event_type=''
+            data=[]
+            continue
+        if line.startswith(':'):
+            # comment (e.g. keep-alive)
+            continue
+        field, _, value=line.partition(':')
+        if value.startswith(' '):
+            value=value[1:]
+        if field == 'event':
+            event_type=value
+        elif field == 'data':
+            data.append(value)
+
+def parse_item_state_event(data : str) -> Optional[Tuple[str, str]]:
+    """Returns the item and its new state of an openHAB event (data of /rest/events), None for other events"""
+    try:
+        event=json.loads(data)
+        if event.get('type') not in ITEM_STATE_EVENT_TYPES:
+            return None
+        # topic: openhab/items/<item>/<state|stateupdated|statechanged>
+        item=event['topic'].split('/')[2]
+        return item, str(json.loads(event['payload'])['value'])
+    except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+        return None
+
+def _same_state(posted : str, state : str) -> bool:
+    # the state of items with a unit contains the unit (e.g. '230.5 W')
+    try:
+        return float(posted) == float(state.split()[0])
+    except (ValueError, IndexError):
+        return posted == state
+
+class DeliveryTracker():
+    """Tracks the posted values until openHAB confirms the new state of the item (see ItemEventSubscriber)
+
+    Only the latest posted value of an item is tracked. Values that are not confirmed within timeout_sec are
+    reported by overdue_items.
+    """
+    def __init__(self, timeout_sec : float, clock : Callable[[], float] = monotonic) -> None:
+        self._timeout_sec=timeout_sec
+        self._clock=clock
+        self._lock=threading.Lock()
+        self._pending : Dict[str, Tuple[str, float]] = {}
+        self.confirmed_count=0
+        self.timeout_count=0
+
+    def expect(self, oh_item : str, value : str) -> None:
+        """Track the value. Call it before posting, the event may arrive before the response."""
+        with self._lock:
+            self._pending[oh_item]=(value, self._clock())
+
+    def cancel(self, oh_item : str, value : str) -> None:
+        """Stop tracking the value (e.g. the post failed)"""
+        with self._lock:
+            if self._pending.get(oh_item, ('', 0))[0] == value:
+                del self._pending[oh_item]
+
+    def confirm(self, oh_item : str, state : str) -> Optional[float]:
+        """Returns the delivery latency in seconds if the state confirms the tracked value of the item"""
+        with self._lock:
+            pending=self._pending.get(oh_item)
+            if pending is None or not _same_state(pending[0], state):
+                return None
+            del self._pending[oh_item]
+            self.confirmed_count+=1
+        latency=self._clock()-pending[1]
+        metrics.DELIVERY_SECONDS.observe(latency)
+        return latency
+
+    def overdue_items(self) -> Dict[str, str]:
+        """Returns (and stops tracking) the items and values that have not been confirmed within the timeout"""
+        now=self._clock()
+        with self._lock:
+            overdue={item : value for item, (value, posted) in self._pending.items() if now-posted > self._timeout_sec}
+            for item in overdue:
+                del self._pending[item]
+            self.timeout_count+=len(overdue)
+        if overdue:
+            metrics.DELIVERY_TIMEOUTS.inc(amount=len(overdue))
+        return overdue
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+class ItemEventSubscriber():
+    """Subscribes to the event stream of openHAB (/rest/events) in a background thread and confirms the item states
+    of the tracker. The connection is kept open and re-established after failures.
+
+    Parameters
+    ----------
+    oh_host : str
+        openHAB URL incl. http(s)
+    reconnect_sec : float
+        Wait time before reconnecting (doubled after each failure, up to 60 seconds)
+    read_timeout_sec : float
+        Reconnect if nothing has been received for this time (e.g. a half-open connection). openHAB sends an alive
+        event every 10 seconds, so this covers a few of them.
+    """
+    def __init__(self, oh_host : str, oh_user : str, oh_passwd : str, tracker : DeliveryTracker, logger : Logger,
+                 reconnect_sec : float = 1, read_timeout_sec : float = 60) -> None:
+        self._url=urlsplit(oh_host)
+        self._headers={'Accept' : 'text/event-stream'}
+        if oh_user:
+            self._headers['Authorization']='Basic '+base64.b64encode(f"{oh_user}:{oh_passwd}".encode()).decode()
+        self._tracker=tracker
+        self._logger=logger
+        self._reconnect_sec=reconnect_sec
+        self._read_timeout_sec=read_timeout_sec
+        self._stop=threading.Event()
+        self._lock=threading.Lock()
+        self._connection : Any = None
+        self.connected=threading.Event()
+        self._thread=threading.Thread(target=self._subscribe, name='oh-events', daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        self._stop.set()
+        with self._lock:
+            if self._connection is not None and self._connection.sock is not None:
+                # unblocks the reading thread
+                try:
+                    self._connection.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        self._thread.join()
+
+    def _subscribe(self) -> None:
+        wait_sec=self._reconnect_sec
+        failed=False
+        while not self._stop.is_set():
+            try:
+                for event_type, data in parse_event_stream(self._read_lines()):
+                    wait_sec=self._reconnect_sec
+                    if failed:
+                        self._logger.info("Receiving openHAB events again.")
+                        failed=False
+                    item_state=parse_item_state_event(data)
+                    if item_state:
+                        self._tracker.confirm(*item_state)
+            except (OSError, ValueError, http.client.HTTPException) as e:
+                if not self._stop.is_set() and not failed:
+                    self._logger.warning(f"Caught Exception while reading openHAB events: {e}. Reconnecting.")
+                    failed=True
+            finally:
+                self.connected.clear()
+                with self._lock:
+                    if self._connection is not None:
+                        self._connection.close()
+                    self._connection=None
+            self._stop.wait(wait_sec)
+            wait_sec=min(wait_sec*2, 60)
+
+    def _read_lines(self) -> Iterator[str]:
+        # a plain http.client connection, its socket can be shut down to stop reading (see close)
+        import ssl
+        with self._lock:
+            if self._stop.is_set():
+                return
+            if self._url.scheme == 'https':
+                # ssl verification is disabled (like for the other requests to openHAB)
+                self._connection=http.client.HTTPSConnection(self._url.netloc, timeout=10, context=ssl._create_unverified_context())
+            else:
+                self._connection=http.client.HTTPConnection(self._url.netloc, timeout=10)
+            connection=self._connection
+        connection.request('GET', f"{self._url.path.rstrip('/')}/rest/events?topics={_EVENT_TOPICS}", headers=self._headers)
+        response=connection.getresponse()
+        if response.status != 200:
+            raise ValueError(f"Subscribing to {self._url.netloc} failed. Return code: {response.status}")
+        connection.sock.settimeout(self._read_timeout_sec)
+        self.connected.set()
+        while True:
+            try:
+                line=response.readline()
+            except socket.timeout as e:
+                raise TimeoutError(f"No data received for {self._read_timeout_sec} sec") from e
+            if not line:
+                raise ConnectionError("Connection closed by openHAB")
+            yield line.decode('utf-8').rstrip('\r\n')
@@ -0,0 +1,207 @@
+import threading
+from bisect import bisect_left
+from time import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+OPENMETRICS_CONTENT_TYPE='application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+def _escape(label_value : str) -> str:
+    return label_value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+def _format_labels(label_names : Sequence[str], label_values : Sequence[str]) -> str:
+    if not label_names:
+        return ''
+    return '{'+','.join(f'{name}="{_escape(value)}"' for name, value in zip(label_names, label_values))+'}'
+
+def _format_value(value : float) -> str:
+    if value != value:
+        return 'NaN'
+    if value in (float('inf'), float('-inf')):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class _Metric():
+    _type=''
+
+    def __init__(self, name : str, documentation : str, label_names : Sequence[str] = ()) -> None:
+        self.name=name
+        self.documentation=documentation
+        self.label_names=tuple(label_names)
+        self._lock=threading.Lock()
+
+    def render(self) -> List[str]:
+        return [f"# TYPE {self.name} {self._type}", f"# HELP {self.name} {self.documentation}"]+self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError()
+
+class Counter(_Metric):
+    """Monotonically increasing value (e.g. number of received frames). Pass the label values to inc (one per label name)."""
+    _type='counter'
+
+    def __init__(self, name : str, documentation : str, label_names : Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, label_names)
+        self._values : Dict[Tuple[str, ...], float] = {} if label_names else {() : 0}
+
+    def inc(self, *label_values : str, amount : float = 1) -> None:
+        with self._lock:
+            self._values[label_values]=self._values.get(label_values, 0)+amount
+
+    def get(self, *label_values : str) -> float:
+        return self._values.get(label_values, 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values=sorted(self._values.items())
+        return [f"{self.name}_total{_format_labels(self.label_names, labels)} {_format_value(value)}" for labels, value in values]
+
+class Gauge(_Metric):
+    """Value that can go up and down (e.g. the queue depth). The value is either set or provided by a function on each scrape."""
+    _type='gauge'
+
+    def __init__(self, name : str, documentation : str) -> None:
+        super().__init__(name, documentation)
+        self._value : Optional[float] = None
+        self._function : Optional[Callable[[], float]] = None
+
+    def set(self, value : float) -> None:
+        self._value=value
+
+    def set_to_current_time(self) -> None:
+        self._value=time()
+
+    def set_function(self, function : Optional[Callable[[], float]]) -> None:
+        self._function=function
+
+    def get(self) -> Optional[float]:
+        return self._function() if self._function else self._value
+
+    def _samples(self) -> List[str]:
+        value=self.get()
+        # a gauge without value (e.g. no success so far) has no sample
+        return [f"{self.name} {_format_value(value)}"] if value is not None else []
+
+class Histogram(_Metric):
+    """Distribution of observed values (e.g. latencies in seconds) in cumulative buckets"""
+    _type='histogram'
+
+    def __init__(self, name : str, documentation : str, buckets : Sequence[float]) -> None:
+        super().__init__(name, documentation)
+        self._upper_bounds=sorted(buckets)
+        # the last bucket is +Inf
+        self._counts=[0]*(len(self._upper_bounds)+1)
+        self._sum=0.0
+
+    def observe(self, value : float) -> None:
+        index=bisect_left(self._upper_bounds, value)
+        with self._lock:
+            self._counts[index]+=1
+            self._sum+=value
+
+    @property
+    def count(self) -> int:
+        return sum(self._counts)
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            counts=list(self._counts)
+            total=self._sum
+        samples : List[str] = []
+        cumulative=0
+        for upper_bound, count in zip(self._upper_bounds+[float('inf')], counts):
+            cumulative+=count
+            samples.append(f'{self.name}_bucket{{le="{_format_value(upper_bound)}"}} {cumulative}')
+        samples.append(f"{self.name}_count {cumulative}")
+        samples.append(f"{self.name}_sum {_format_value(total)}")
+        return samples
+
+class MetricsRegistry():
+    def __init__(self) -> None:
+        self._metrics : Dict[str, _Metric] = {}
+
+    def counter(self, name : str, documentation : str, label_names : Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, label_names)) # type: ignore
+
+    def gauge(self, name : str, documentation : str) -> Gauge:
+        return self._register(Gauge(name, documentation)) # type: ignore
+
+    def histogram(self, name : str, documentation : str, buckets : Sequence[float]) -> Histogram:
+        return self._register(Histogram(name, documentation, buckets)) # type: ignore
+
+    def render(self) -> str:
+        """All metrics in the OpenMetrics text format"""
+        lines : List[str] = []
+        for metric in self._metrics.values():
+            lines+=metric.render()
+        lines.append('# EOF')
+        return '\n'.join(lines)+'\n'
+
+    def _register(self, metric : _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Unable to register metric: {metric.name} is already registered")
+        self._metrics[metric.name]=metric
+        return metric
+
+# metrics of the hot paths. They are always collected (the overhead is measured by benchmarks.bench_metrics)
+# and exposed via MetricsServer.
+REGISTRY=MetricsRegistry()
+FRAME_READ_SECONDS=REGISTRY.histogram('sml_frame_read_seconds', "Time to read a complete SML frame from the smart meter.",
+                                      (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10))
+FRAME_DECODE_SECONDS=REGISTRY.histogram('sml_frame_decode_seconds', "Time to decode an SML frame.",
+                                        (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 5e-3))
+FRAMES_RECEIVED=REGISTRY.counter('sml_frames_received', "Number of complete SML frames received from the smart meter.")
+FRAMES_REJECTED=REGISTRY.counter('sml_frames_rejected', "Number of rejected reads by reason (corrupt, invalid or inconsistent).", ('reason',))
+VALUES_REJECTED=REGISTRY.counter('sml_values_rejected', "Number of outliers removed from reads by channel (the other channels of the read are kept).", ('channel',))
+READ_ERRORS=REGISTRY.counter('sml_read_errors', "Number of failed reads from the smart meter by reason (timeout or transport).", ('reason',))
+LAST_READ_SUCCESS=REGISTRY.gauge('sml_last_read_success_timestamp_seconds', "Time of the last valid read from the smart meter.")
+POST_SECONDS=REGISTRY.histogram('openhab_post_seconds', "Latency of posting a value to an openHAB item.",
+                                (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+HTTP_RETRIES=REGISTRY.counter('openhab_http_retries', "Number of retried HTTP requests to openHAB.")
+HTTP_ERRORS=REGISTRY.counter('openhab_http_errors', "Number of failed HTTP requests to openHAB by request (post, put or get).", ('request',))
+DELIVERY_SECONDS=REGISTRY.histogram('openhab_delivery_seconds', "Time from posting a value until openHAB confirms the item state (event stream).",
+                                    (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+DELIVERY_TIMEOUTS=REGISTRY.counter('openhab_delivery_timeouts', "Number of posted values whose item state has not been confirmed by openHAB within the timeout.")
+LAST_POST_SUCCESS=REGISTRY.gauge('openhab_last_post_success_timestamp_seconds', "Time when all values have been posted to openHAB the last time.")
+MQTT_PENDING=REGISTRY.gauge('mqtt_pending_messages', "Number of messages waiting to be published or acknowledged (MQTT backend).")
+CYCLE_SECONDS=REGISTRY.histogram('cycle_seconds', "Duration of reading and publishing values (of the read stage only in pipeline mode).",
+                                 (0.1, 0.5, 1, 2, 5, 10, 30, 60))
+QUEUE_DEPTH=REGISTRY.gauge('pipeline_queue_depth', "Number of values waiting to be published (pipeline mode).")
+READ_COUNT=REGISTRY.gauge('read_count', "Number of reads per published value (adapted to the load with --adaptive_max_read_count).")
+
+class MetricsServer():
+    """Serves the metrics at http://host:port/metrics in a background thread. Port 0 selects a free port (see port)."""
+    def __init__(self, port : int, host : str = '127.0.0.1', registry : MetricsRegistry = REGISTRY) -> None:
+        # the HTTP server is imported only if the metrics are served (it takes a while to import)
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+        class _MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body=registry.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', OPENMETRICS_CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args) -> None:
+                pass
+
+        self._server=ThreadingHTTPServer((host, port), _MetricsHandler)
+        self._server.daemon_threads=True
+        self._thread=threading.Thread(target=self._server.serve_forever, name='metrics-server', daemon=True)
+        self._thread.start()
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
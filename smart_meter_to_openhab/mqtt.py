@@ -0,0 +1,309 @@
+import json
+import select
+import socket
+import struct
+import threading
+from collections import deque
+from dataclasses import dataclass
+from logging import Logger
+from time import monotonic, time
+from typing import Deque, Dict, Iterable, List, Literal, NamedTuple, Optional, Set, Tuple, Union
+from .interfaces import OhItemAndValue
+from . import metrics
+
+# minimal MQTT 3.1.1 client (publishing only): http://docs.oasis-open.org/mqtt/mqtt/v3.1.1/os/mqtt-v3.1.1-os.html
+CONNECT, CONNACK, PUBLISH, PUBACK, PINGREQ, PINGRESP, DISCONNECT=1, 2, 3, 4, 12, 13, 14
+QoS = Literal[0, 1]
+
+def encode_string(value : Union[str, bytes]) -> bytes:
+    data=value.encode() if isinstance(value, str) else value
+    return struct.pack('!H', len(data))+data
+
+def encode_packet(packet_type : int, flags : int, body : bytes) -> bytes:
+    header=bytearray([packet_type << 4 | flags])
+    # remaining length: 7 bits per byte, the highest bit marks a following byte
+    length=len(body)
+    while True:
+        byte=length & 0x7f
+        length >>= 7
+        header.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(header)+body
+
+def _read_exactly(sock : socket.socket, size : int) -> bytes:
+    data=bytearray()
+    while len(data) < size:
+        chunk=sock.recv(size-len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed by peer")
+        data+=chunk
+    return bytes(data)
+
+def read_packet(sock : socket.socket) -> Tuple[int, int, bytes]:
+    """Returns the type, the flags and the body of the next packet
+
+    Raises
+    ------
+    ConnectionError
+        If the connection has been closed
+    """
+    first=_read_exactly(sock, 1)[0]
+    length, shift=0, 0
+    while True:
+        byte=_read_exactly(sock, 1)[0]
+        length|=(byte & 0x7f) << shift
+        shift+=7
+        if not byte & 0x80:
+            break
+    return first >> 4, first & 0x0f, _read_exactly(sock, length) if length else b''
+
+def encode_connect(client_id : str, keepalive_sec : int, user : str = '', passwd : str = '') -> bytes:
+    # clean session: messages that have not been acknowledged are sent again by the client (see MqttConnection)
+    flags=0x02
+    payload=encode_string(client_id)
+    if user:
+        flags|=0x80
+        payload+=encode_string(user)
+        if passwd:
+            flags|=0x40
+            payload+=encode_string(passwd)
+    return encode_packet(CONNECT, 0, encode_string('MQTT')+struct.pack('!BBH', 4, flags, keepalive_sec)+payload)
+
+def encode_publish(topic : str, payload : bytes, qos : int = 0, retain : bool = False, packet_id : int = 0, dup : bool = False) -> bytes:
+    flags=(dup << 3) | (qos << 1) | retain
+    return encode_packet(PUBLISH, flags, encode_string(topic)+(struct.pack('!H', packet_id) if qos else b'')+payload)
+
+def decode_publish(flags : int, body : bytes) -> Tuple[str, bytes, int, bool, int]:
+    """Returns the topic, payload, QoS, retain flag and packet id (0 for QoS 0) of a PUBLISH packet"""
+    qos=(flags >> 1) & 0x03
+    topic_length=struct.unpack_from('!H', body)[0]
+    topic=body[2:2+topic_length].decode()
+    offset=2+topic_length
+    packet_id=0
+    if qos:
+        packet_id=struct.unpack_from('!H', body, offset)[0]
+        offset+=2
+    return topic, body[offset:], qos, bool(flags & 0x01), packet_id
+
+@dataclass(frozen=True)
+class MqttSettings():
+    client_id : str = 'smart_meter_to_openhab'
+    # the value of each item is published to <topic_prefix>/<item>
+    topic_prefix : str = 'smart_meter'
+    # additionally publish all values of a reading as one JSON object to this topic. None: no packed topic
+    packed_topic : Optional[str] = None
+    qos : QoS = 0
+    retain : bool = True
+    keepalive_sec : int = 60
+    # time to wait for the acknowledgement of QoS 1 messages (per post_to_items)
+    ack_timeout_sec : float = 5
+    connect_timeout_sec : float = 5
+    # minimum time between connection attempts
+    reconnect_sec : float = 5
+    # maximum number of messages kept while the broker is not reachable and of messages that have not been acknowledged (QoS 1).
+    # The oldest messages are dropped.
+    buffer_size : int = 1000
+
+class _Message(NamedTuple):
+    topic : str
+    payload : bytes
+    # the items of the values in the message
+    items : Tuple[str, ...]
+
+class MqttConnection():
+    """Publishes the values to an MQTT broker (e.g. for the MQTT binding of openHAB) over one persistent connection.
+
+    Has the same role as OpenhabConnection: post_to_items publishes the values of a reading as one batch (a single write),
+    the value of each item to a retained topic and optionally all values to a packed JSON topic. While the broker is not
+    reachable, the messages are buffered and published after reconnecting (before new messages). With QoS 1, messages that
+    have not been acknowledged are published again after reconnecting. The connection is closed if the broker does not respond
+    to PINGREQ within keepalive_sec.
+    """
+    def __init__(self, host : str, port : int, user : str, passwd : str, logger : Logger, settings : MqttSettings = MqttSettings()) -> None:
+        self._address=(host, port)
+        self._user=user
+        self._passwd=passwd
+        self._logger=logger
+        self._settings=settings
+        self._condition=threading.Condition()
+        self._sock : Optional[socket.socket] = None
+        self._reader : Optional[threading.Thread] = None
+        self._last_connect_attempt=-settings.reconnect_sec
+        self._buffer : Deque[_Message] = deque()
+        # messages that have not been acknowledged by packet id (in the order of publishing)
+        self._inflight : Dict[int, _Message] = {}
+        self._next_packet_id=1
+        self._last_send=monotonic()
+        # time of the PINGREQ that has not been answered (PINGRESP)
+        self._ping_sent : Optional[float] = None
+        self.last_failed_items : Set[str] = set()
+        self.dropped_count=0
+        metrics.MQTT_PENDING.set_function(lambda: len(self._buffer)+len(self._inflight))
+
+    @property
+    def connected(self) -> bool:
+        return self._sock is not None
+
+    def post_to_items(self, value_container : Iterable[OhItemAndValue]) -> bool:
+        """Publish all values (that are not None). Returns True if all values have been published
+        (and acknowledged with QoS 1). The items that failed are provided in last_failed_items."""
+        values={str(v.oh_item): str(v.value) for v in value_container if v.value is not None and v.oh_item}
+        if not values:
+            self.last_failed_items=set()
+            return True
+        messages=[_Message(f"{self._settings.topic_prefix}/{item}", value.encode(), (item,)) for item, value in values.items()]
+        if self._settings.packed_topic:
+            messages.append(_Message(self._settings.packed_topic, json.dumps({'timestamp' : time(), 'values' : values}).encode(), tuple(values)))
+        with self._condition:
+            if self._sock is None and monotonic()-self._last_connect_attempt >= self._settings.reconnect_sec:
+                self._connect()
+            packet_ids=self._send(messages)
+            if packet_ids is None:
+                self._buffer_messages(messages)
+                failed={item for message in messages for item in message.items}
+            else:
+                if packet_ids:
+                    # stop waiting if the connection is lost
+                    self._condition.wait_for(lambda: self._sock is None or self._inflight.keys().isdisjoint(packet_ids), 
+                                             self._settings.ack_timeout_sec)
+                failed={item for packet_id in packet_ids if packet_id in self._inflight for item in self._inflight[packet_id].items}
+        self.last_failed_items=failed
+        if not failed:
+            metrics.LAST_POST_SUCCESS.set_to_current_time()
+        return not failed
+
+    def close(self) -> None:
+        with self._condition:
+            sock=self._sock
+            if sock is not None:
+                try:
+                    sock.sendall(encode_packet(DISCONNECT, 0, b''))
+                except OSError:
+                    pass
+                self._disconnect()
+        if self._reader is not None:
+            self._reader.join()
+        lost=len(self._buffer)+len(self._inflight)
+        if lost:
+            self._logger.warning(f"{lost} messages have not been published to the MQTT broker.")
+        metrics.MQTT_PENDING.set_function(None)
+
+    def _connect(self) -> None:
+        # called with the lock held
+        self._last_connect_attempt=monotonic()
+        try:
+            sock=socket.create_connection(self._address, self._settings.connect_timeout_sec)
+        except OSError as e:
+            self._logger.warning(f"Unable to connect to MQTT broker {self._address[0]}:{self._address[1]}: {e}")
+            return
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.sendall(encode_connect(self._settings.client_id, self._settings.keepalive_sec, self._user, self._passwd))
+            packet_type, _, body=read_packet(sock)
+            if packet_type != CONNACK or len(body) != 2 or body[1] != 0:
+                raise ConnectionRefusedError(f"Connection refused (CONNACK return code {body[1] if len(body) == 2 else None})")
+        except OSError as e:
+            self._logger.warning(f"Unable to connect to MQTT broker {self._address[0]}:{self._address[1]}: {e}")
+            sock.close()
+            return
+        self._logger.info(f"Connected to MQTT broker {self._address[0]}:{self._address[1]}.")
+        self._sock=sock
+        self._last_send=monotonic()
+        self._ping_sent=None
+        self._reader=threading.Thread(target=self._read, args=(sock,), name='mqtt-reader', daemon=True)
+        self._reader.start()
+        # messages that have not been acknowledged and buffered messages are published first (in order)
+        resend=list(self._inflight.values())+list(self._buffer)
+        self._inflight.clear()
+        self._buffer.clear()
+        if len(resend) > self._settings.buffer_size:
+            self.dropped_count+=len(resend)-self._settings.buffer_size
+            resend=resend[-self._settings.buffer_size:]
+        if resend:
+            self._logger.info(f"Publishing {len(resend)} buffered messages.")
+            if self._send(resend) is None:
+                self._buffer_messages(resend)
+
+    def _send(self, messages : List[_Message]) -> Optional[List[int]]:
+        """Publish the messages in a single write. Returns the packet ids (QoS 1) or None if not connected."""
+        # called with the lock held
+        if self._sock is None:
+            return None
+        qos=self._settings.qos
+        if qos:
+            # the oldest messages that have not been acknowledged are dropped (but not the messages of this call)
+            while self._inflight and len(self._inflight)+len(messages) > self._settings.buffer_size:
+                del self._inflight[next(iter(self._inflight))]
+                self.dropped_count+=1
+        packet_ids : List[int] = []
+        packets : List[bytes] = []
+        for message in messages:
+            packet_id=0
+            if qos:
+                packet_id=self._next_packet_id
+                self._next_packet_id=self._next_packet_id % 0xffff+1
+                self._inflight[packet_id]=message
+                packet_ids.append(packet_id)
+            packets.append(encode_publish(message.topic, message.payload, qos, self._settings.retain, packet_id))
+        try:
+            self._sock.sendall(b''.join(packets))
+        except OSError as e:
+            self._logger.warning(f"Caught Exception while publishing to MQTT broker: {e}")
+            for packet_id in packet_ids:
+                del self._inflight[packet_id]
+            self._disconnect()
+            return None
+        self._last_send=monotonic()
+        return packet_ids
+
+    def _buffer_messages(self, messages : List[_Message]) -> None:
+        # called with the lock held
+        for message in messages:
+            if len(self._buffer) >= self._settings.buffer_size:
+                self._buffer.popleft()
+                self.dropped_count+=1
+            self._buffer.append(message)
+
+    def _disconnect(self) -> None:
+        # called with the lock held. Messages that have not been acknowledged are published again after reconnecting.
+        if self._sock is None:
+            return
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+        self._sock=None
+        self._condition.notify_all()
+
+    def _read(self, sock : socket.socket) -> None:
+        keepalive_sec=self._settings.keepalive_sec
+        ping_interval=keepalive_sec/2
+        try:
+            while True:
+                readable, _, _=select.select([sock], [], [], ping_interval)
+                if not readable:
+                    with self._condition:
+                        if self._sock is not sock:
+                            return
+                        if self._ping_sent is not None and monotonic()-self._ping_sent >= keepalive_sec:
+                            raise TimeoutError(f"No PINGRESP within {keepalive_sec} sec")
+                        if monotonic()-self._last_send >= ping_interval:
+                            sock.sendall(encode_packet(PINGREQ, 0, b''))
+                            self._last_send=monotonic()
+                            if self._ping_sent is None:
+                                self._ping_sent=self._last_send
+                    continue
+                packet_type, _, body=read_packet(sock)
+                if packet_type == PUBACK:
+                    with self._condition:
+                        self._inflight.pop(struct.unpack('!H', body)[0], None)
+                        self._condition.notify_all()
+                elif packet_type == PINGRESP:
+                    with self._condition:
+                        self._ping_sent=None
+        except (OSError, ValueError, struct.error) as e:
+            with self._condition:
+                if self._sock is sock:
+                    self._logger.warning(f"Lost connection to MQTT broker: {e}")
+                    self._disconnect()
@@ -0,0 +1,141 @@
+import configparser
+import selectors
+from dataclasses import dataclass
+from logging import Logger
+from pathlib import Path
+from time import monotonic, sleep
+from typing import Iterator, List, Optional, Tuple
+from .interfaces import SmartMeterValues, SmartMeterOhItemNames
+from .aggregation import SlidingWindowAggregator
+from .batch import AggregateType
+from .sml_iskra_mt175 import SmlIskraMt175OneWay
+from .outlier_filter import OutlierFilterSettings
+from .transport import Transport, SerialTransport, ReplayTransport, load_sml_dumps
+from . import profiling
+
+# keys of the item names in the meter configuration (in the order of SmartMeterValues)
+_OH_ITEM_KEYS=('phase_1_consumption', 'phase_2_consumption', 'phase_3_consumption', 'overall_consumption', 'electricity_meter')
+_TRANSPORT_KEYS=('serial_port', 'replay', 'replay_speedup')
+
+@dataclass(frozen=True)
+class MeterConfig():
+    name : str
+    oh_item_names : SmartMeterOhItemNames
+    serial_port : Optional[str] = None
+    # replay of .sml dumps instead of a serial port (see ReplayTransport)
+    replay : Optional[Path] = None
+    replay_speedup : float = 1
+
+    def create_transport(self) -> Transport:
+        if self.replay:
+            return ReplayTransport(load_sml_dumps(self.replay), self.replay_speedup)
+        return SerialTransport(self.serial_port) # type: ignore
+
+def load_meter_configs(config_file : Path) -> List[MeterConfig]:
+    """Load the smart meters from an ini file
+
+    Each section configures one smart meter: its serial port (or a replay of .sml dumps) and its openHAB items, e.g.:
+
+    [heat_pump]
+    serial_port = /dev/ttyUSB1
+    overall_consumption = heat_pump_overall_consumption
+    electricity_meter = heat_pump_electricity_meter
+    """
+    parser=configparser.ConfigParser()
+    with open(config_file, 'r') as f:
+        parser.read_file(f)
+    configs : List[MeterConfig] = []
+    for name in parser.sections():
+        section=parser[name]
+        unknown_keys=set(section.keys())-set(_OH_ITEM_KEYS)-set(_TRANSPORT_KEYS)
+        if unknown_keys:
+            raise ValueError(f"Unknown smart meter settings {unknown_keys} in section {name} of {config_file}")
+        if ('serial_port' in section) == ('replay' in section):
+            raise ValueError(f"Either serial_port or replay has to be specified in section {name} of {config_file}")
+        oh_item_names=tuple(section.get(key, '') for key in _OH_ITEM_KEYS)
+        if not any(oh_item_names):
+            raise ValueError(f"No openHAB item specified in section {name} of {config_file}")
+        configs.append(MeterConfig(name, oh_item_names, section.get('serial_port'), # type: ignore
+                                   Path(section['replay']) if 'replay' in section else None, section.getfloat('replay_speedup', 1)))
+    return configs
+
+class _Meter():
+    def __init__(self, config : MeterConfig, reader : SmlIskraMt175OneWay, aggregator : SlidingWindowAggregator) -> None:
+        self.config=config
+        self.reader=reader
+        self.aggregator=aggregator
+
+class MultiMeterReader():
+    """Reads several smart meters in one thread
+
+    All transports are multiplexed with a selector. Transports without a file descriptor (e.g. replays) are polled.
+    Each smart meter has its own reader state (e.g. previous values for the consistency check) and sliding window.
+
+    Parameters
+    ----------
+    configs : List[MeterConfig]
+        The smart meters
+    window_sec, emit_interval_sec, emit_frame_count, aggregate
+        Sliding window of each smart meter, see SmartMeterReader.read_stream
+    poll_interval_sec : float
+        Interval to poll transports without file descriptor (and to check the emit cadence)
+    raw_data_dump_dir, timeseries_dir : Path, optional
+        The archives of each smart meter are in a sub directory (name of the smart meter)
+    outlier_filter_settings : OutlierFilterSettings, optional
+        Settings of the outlier filter of each smart meter
+    """
+    def __init__(self, configs : List[MeterConfig], logger : Logger, window_sec : float, emit_interval_sec : Optional[float] = None,
+                 emit_frame_count : Optional[int] = None, aggregate : AggregateType = 'mean', raw_data_dump_dir : Optional[Path] = None,
+                 poll_interval_sec : float = 0.1, timeseries_dir : Optional[Path] = None,
+                 outlier_filter_settings : Optional[OutlierFilterSettings] = None) -> None:
+        if len({config.name for config in configs}) != len(configs):
+            raise ValueError(f"Unable to create MultiMeterReader: Names of the smart meters are not unique")
+        self._logger=logger
+        self._aggregate=aggregate
+        self._poll_interval_sec=poll_interval_sec
+        self._meters : List[_Meter] = []
+        for config in configs:
+            reader=SmlIskraMt175OneWay(config.create_transport(), logger, raw_data_dump_dir / config.name if raw_data_dump_dir else None,
+                                       config.oh_item_names, timeseries_dir / config.name if timeseries_dir else None, outlier_filter_settings)
+            self._meters.append(_Meter(config, reader, reader.create_aggregator(window_sec, emit_interval_sec, emit_frame_count)))
+
+    def read(self) -> Iterator[Tuple[str, SmartMeterValues]]:
+        """Continuously read all smart meters and yield the name of the smart meter and its aggregated values"""
+        with selectors.DefaultSelector() as selector:
+            polled_meters=self._register(selector)
+            while True:
+                with profiling.stage('serial'):
+                    if selector.get_map():
+                        ready={key.data for key, _ in selector.select(self._poll_interval_sec)}
+                    else:
+                        sleep(self._poll_interval_sec)
+                        ready=set()
+                timestamp=monotonic()
+                for meter in self._meters:
+                    # meters without new data only check the emit cadence of their window
+                    frames : List[Tuple[Optional[SmartMeterValues], Optional[bytes]]] = []
+                    if meter in ready or meter in polled_meters:
+                        frames.extend(meter.reader.read_available())
+                    # the frame of each values is dumped (not the latest frame of the batch)
+                    for values, raw_frame in frames or [(None, None)]:
+                        avg_value=meter.reader.add_to_window(meter.aggregator, values, timestamp, self._aggregate, raw_frame)
+                        if avg_value is not None:
+                            yield meter.config.name, avg_value
+
+    def close(self) -> None:
+        for meter in self._meters:
+            meter.reader.close()
+
+    def _register(self, selector : selectors.BaseSelector) -> List[_Meter]:
+        polled_meters : List[_Meter] = []
+        for meter in self._meters:
+            transport=meter.reader.transport
+            if not transport.is_open:
+                transport.open()
+            fileno=transport.fileno()
+            if fileno is None:
+                polled_meters.append(meter)
+            else:
+                selector.register(fileno, selectors.EVENT_READ, meter)
+        self._logger.info(f"Reading {len(self._meters)} smart meters ({len(polled_meters)} of them polled).")
+        return polled_meters
@@ -1,39 +1,233 @@
 import requests
 import http
 import datetime
+from dataclasses import dataclass
+from time import perf_counter, monotonic, sleep
 from logging import Logger
 from requests.auth import HTTPBasicAuth
-from requests.adapters import HTTPAdapter, Retry
-from typing import List, Tuple
+from requests.adapters import HTTPAdapter
+from typing import List, Tuple, Iterable, Set, Optional, Any
 from .interfaces import *
+from .publisher import CoalescingPublisher
+from .persistence_cache import PersistenceWindowCache
+from .circuit_breaker import CircuitBreaker
+from .item_events import DeliveryTracker, ItemEventSubscriber
+from . import metrics
 
 # disable warnings about insecure requests because ssl verification is disabled
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+_RETRY_STATUS_CODES=frozenset((500, 502, 503, 504))
+# like urllib3.Retry: requests of other methods (POST) are only retried if they have not been sent
+_IDEMPOTENT_METHODS=frozenset(('DELETE', 'GET', 'HEAD', 'OPTIONS', 'PUT', 'TRACE'))
+
+def _is_connect_error(error : requests.exceptions.RequestException) -> bool:
+    """Returns True if the connection failed, i.e. the request has not been sent"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    # the adapter (without retries) wraps connection failures in MaxRetryError, errors after sending (e.g. connection reset) are raised directly
+    reason=error.args[0] if error.args else None
+    return isinstance(reason, urllib3.exceptions.MaxRetryError) and isinstance(reason.reason, urllib3.exceptions.NewConnectionError)
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """The request has not been sent, since openHAB failed too often (see CircuitBreaker)"""
+
+class DeadlineExceededError(requests.exceptions.Timeout):
+    """The request (incl. retries) did not finish within the time budget"""
+
+@dataclass(frozen=True)
+class ConnectionSettings():
+    # time budget of post_to_items (all items incl. retries). None: no budget
+    budget_sec : Optional[float] = 10
+    # timeout of a single request (connect and read)
+    request_timeout_sec : float = 5
+    # retries of connection errors and server errors (5xx), with exponential backoff.
+    # POST is only retried if the connection failed (i.e. the request has not been sent)
+    max_retries : int = 8
+    backoff_factor : float = 0.1
+    # size of the connection pool (default: the number of publisher workers, at least 10)
+    pool_maxsize : Optional[int] = None
+    keep_alive : bool = True
+    # the circuit opens after failure_threshold consecutive failed requests. A probe request is sent after reset_timeout_sec.
+    failure_threshold : int = 5
+    reset_timeout_sec : float = 30
+    # confirm the posted values by the event stream of openHAB (see check_if_delivered). None: no confirmation
+    delivery_timeout_sec : Optional[float] = None
+
 class OpenhabConnection():
-    def __init__(self, oh_host : str, oh_user : str, oh_passwd : str, logger : Logger) -> None:
+    def __init__(self, oh_host : str, oh_user : str, oh_passwd : str, logger : Logger, max_workers : int = 5,
+                 settings : ConnectionSettings = ConnectionSettings()) -> None:
         self._oh_host=oh_host
+        self._settings=settings
         self._session=requests.Session()
         if oh_user:
             self._session.auth=HTTPBasicAuth(oh_user, oh_passwd)
-        retries=Retry(total=8,
-                backoff_factor=0.1,
-                status_forcelist=[ 500, 502, 503, 504 ])
-        self._session.mount('http://', HTTPAdapter(max_retries=retries))
-        self._session.mount('https://', HTTPAdapter(max_retries=retries))
+        # NOTE: retries are done by _request (within the deadline), not by the adapter
+        # the pool has to provide a connection for each worker of the publisher
+        pool_maxsize=settings.pool_maxsize or max(max_workers, 10)
+        self._session.mount('http://', HTTPAdapter(max_retries=0, pool_maxsize=pool_maxsize))
+        self._session.mount('https://', HTTPAdapter(max_retries=0, pool_maxsize=pool_maxsize))
         self._session.headers={'Content-Type': 'text/plain'}
+        if not settings.keep_alive:
+            self._session.headers['Connection']='close'
         self._logger=logger
+        self._circuit_breaker=CircuitBreaker(logger, f"openHAB ({oh_host})", settings.failure_threshold, settings.reset_timeout_sec)
+        self._post_deadline : Optional[float] = None
+        self._publisher=CoalescingPublisher(self._post_to_item, logger, max_workers)
+        self.last_failed_items : Set[str] = set()
+        self._persistence_cache=PersistenceWindowCache(self._fetch_persistence_values, max_workers)
+        self._delivery_tracker : Optional[DeliveryTracker] = None
+        self._event_subscriber : Optional[ItemEventSubscriber] = None
+        if settings.delivery_timeout_sec is not None:
+            self._delivery_tracker=DeliveryTracker(settings.delivery_timeout_sec)
+            self._event_subscriber=ItemEventSubscriber(oh_host, oh_user, oh_passwd, self._delivery_tracker, logger)
 
-    def post_to_items(self, value_container : OhItemAndValueContainer) -> None:
-        for v in value_container:
-            if v.value is not None and v.oh_item:
-                try:
-                    with self._session.post(url=f"{self._oh_host}/rest/items/{v.oh_item}", data=str(v.value), verify=False) as response:
-                        if response.status_code != http.HTTPStatus.OK:
-                            self._logger.warning(f"Failed to post value to openhab item {v.oh_item}. Return code: {response.status_code}. text: {response.text})")
-                except requests.exceptions.RequestException as e:
-                    self._logger.warning("Caught Exception while posting to openHAB: " + str(e))
+    @property
+    def delivery_tracker(self) -> Optional[DeliveryTracker]:
+        return self._delivery_tracker
+
+    @property
+    def circuit_breaker(self) -> CircuitBreaker:
+        return self._circuit_breaker
+
+    def post_to_items(self, value_container : Iterable[OhItemAndValue]) -> bool:
+        """Post all values (that are not None) to their items in parallel. Returns True if all values have been posted.
+        The items that failed (or did not finish within the time budget) are provided in last_failed_items."""
+        values={str(v.oh_item): str(v.value) for v in value_container if v.value is not None and v.oh_item}
+        budget_sec=self._settings.budget_sec
+        # the workers of the publisher stop retrying at the deadline
+        self._post_deadline=monotonic()+budget_sec if budget_sec is not None else None
+        success=self._publisher.publish(values, budget_sec)
+        self.last_failed_items=self._publisher.failed_items(set(values)) if not success else set()
+        if success:
+            metrics.LAST_POST_SUCCESS.set_to_current_time()
+        return success
+
+    def put_persistence_values(self, oh_item : str, values : List[Tuple[datetime.datetime, float]], deadline : Optional[float] = None,
+                               service_id : Optional[str] = None) -> int:
+        """Store the values in order in the persistence of the item (without changing the item state).
+        Gives up at the deadline (monotonic time). Returns the number of values that have been stored (the first ones)."""
+        # the cached persistence window does not know about values written into the past
+        self._persistence_cache.invalidate(oh_item)
+        for stored, (time, state) in enumerate(values):
+            params={'time': time.isoformat(timespec='milliseconds'), 'state': str(state)}
+            if service_id:
+                params['serviceId']=service_id
+            try:
+                with self._request('PUT', f"/rest/persistence/items/{oh_item}", deadline, params=params) as response:
+                    if response.status_code != http.HTTPStatus.OK:
+                        self._logger.warning(f"Failed to put persistence value of openhab item {oh_item}. Return code: {response.status_code}. text: {response.text})")
+                        metrics.HTTP_ERRORS.inc('put')
+                        return stored
+            except requests.exceptions.RequestException as e:
+                self._log_request_exception("Caught Exception while putting persistence data to openHAB: ", e)
+                metrics.HTTP_ERRORS.inc('put')
+                return stored
+        return len(values)
+
+    def check_if_delivered(self) -> bool:
+        """Returns False if openHAB did not confirm the new state of posted items within ConnectionSettings.delivery_timeout_sec.
+        The states are confirmed by the event stream, i.e. nothing is downloaded (unlike check_if_persistence_values_updated).
+
+        Raises
+        ------
+        ValueError
+            If ConnectionSettings.delivery_timeout_sec is not set
+        """
+        if self._delivery_tracker is None:
+            raise ValueError("Unable to check delivery: ConnectionSettings.delivery_timeout_sec is not set")
+        overdue=self._delivery_tracker.overdue_items()
+        if overdue:
+            self._logger.warning(f"openHAB did not confirm the state of items {overdue} within {self._settings.delivery_timeout_sec} sec.")
+        return not overdue
+
+    def close(self) -> None:
+        if self._event_subscriber is not None:
+            self._event_subscriber.close()
+        self._publisher.close()
+        self._persistence_cache.close()
+        self._session.close()
+
+    def _request(self, method : str, path : str, deadline : Optional[float] = None, **kwargs : Any) -> requests.Response:
+        """Send the request to openHAB. Connection errors and server errors (5xx) are retried with exponential backoff.
+        Requests that are not idempotent (POST) are only retried if the connection failed, since openHAB may have processed them.
+
+        Parameters
+        ----------
+        deadline : float, optional
+            Monotonic time when the request (incl. retries) is given up
+
+        Raises
+        ------
+        requests.exceptions.RequestException
+            If the request failed. CircuitOpenError if the request has not been sent, since openHAB failed too often.
+            DeadlineExceededError if the deadline has been reached.
+        """
+        retry=0
+        idempotent=method in _IDEMPOTENT_METHODS
+        while True:
+            if not self._circuit_breaker.allow_request():
+                raise CircuitOpenError(f"Skipped {method} {path}: openHAB is not reachable (circuit open)")
+            timeout=self._settings.request_timeout_sec
+            if deadline is not None:
+                timeout=min(timeout, deadline-monotonic())
+                if timeout <= 0:
+                    # the breaker expects a result of each allowed request
+                    self._circuit_breaker.record_failure()
+                    raise DeadlineExceededError(f"Gave up {method} {path} after {retry} retries: Deadline exceeded")
+            error : Optional[requests.exceptions.RequestException] = None
+            try:
+                response=self._session.request(method, f"{self._oh_host}{path}", timeout=timeout, verify=False, **kwargs)
+            except requests.exceptions.RequestException as e:
+                error=e
+            else:
+                if response.status_code not in _RETRY_STATUS_CODES:
+                    self._circuit_breaker.record_success()
+                    return response
+            self._circuit_breaker.record_failure()
+            backoff=self._settings.backoff_factor*2**retry
+            retryable=idempotent or (error is not None and _is_connect_error(error))
+            if not retryable or retry >= self._settings.max_retries or (deadline is not None and monotonic()+backoff >= deadline):
+                if error is not None:
+                    raise error
+                # the caller handles the server error
+                return response
+            if error is None:
+                response.close()
+            retry+=1
+            metrics.HTTP_RETRIES.inc()
+            sleep(backoff)
+
+    def _log_request_exception(self, message : str, e : requests.exceptions.RequestException) -> None:
+        if isinstance(e, CircuitOpenError):
+            # the circuit breaker logs when openHAB is not reachable
+            self._logger.debug(message+str(e))
+        else:
+            self._logger.warning(message+str(e))
+
+    def _post_to_item(self, oh_item : str, value : str) -> bool:
+        start=perf_counter()
+        success=False
+        if self._delivery_tracker is not None:
+            # the event may arrive before the response
+            self._delivery_tracker.expect(oh_item, value)
+        try:
+            with self._request('POST', f"/rest/items/{oh_item}", self._post_deadline, data=value) as response:
+                if response.status_code != http.HTTPStatus.OK:
+                    self._logger.warning(f"Failed to post value to openhab item {oh_item}. Return code: {response.status_code}. text: {response.text})")
+                    metrics.HTTP_ERRORS.inc('post')
+                    return False
+                success=True
+                return True
+        except requests.exceptions.RequestException as e:
+            self._log_request_exception("Caught Exception while posting to openHAB: ", e)
+            metrics.HTTP_ERRORS.inc('post')
+            return False
+        finally:
+            metrics.POST_SECONDS.observe(perf_counter()-start)
+            if not success and self._delivery_tracker is not None:
+                self._delivery_tracker.cancel(oh_item, value)
 
     def get_item_value_list_from_items(self, oh_item_names : Tuple[str, ...]) -> List[OhItemAndValue]:
         values : List[OhItemAndValue] = []
@@ -41,39 +235,40 @@ class OpenhabConnection():
             if item:
                 oh_item_value=OhItemAndValue(item)
                 try:
-                    with self._session.get(url=f"{self._oh_host}/rest/items/{item}/state", verify=False) as response:
+                    with self._request('GET', f"/rest/items/{item}/state") as response:
                         if response.status_code != http.HTTPStatus.OK:
                             self._logger.warning(f"Failed to get value from openhab item {item}. Return code: {response.status_code}. text: {response.text})")
+                            metrics.HTTP_ERRORS.inc('get')
                         else:
                             oh_item_value=OhItemAndValue(item, float(response.text.split()[0]))
                 except requests.exceptions.RequestException as e:
-                    self._logger.warning("Caught Exception while getting from openHAB: " + str(e))
+                    self._log_request_exception("Caught Exception while getting from openHAB: ", e)
+                    metrics.HTTP_ERRORS.inc('get')
                 values.append(oh_item_value)
         return values
 
     def get_values_from_items(self) -> SmartMeterValues:
         return SmartMeterValues.create(self.get_item_value_list_from_items(SmartMeterValues.oh_item_names()))
 
+    def _fetch_persistence_values(self, oh_item : str, start_time : datetime.datetime, end_time : datetime.datetime) -> Optional[List[Tuple[int, float]]]:
+        try:
+            with self._request('GET', f"/rest/persistence/items/{oh_item}", 
+                               params={'starttime': start_time.isoformat(), 'endtime': end_time.isoformat()}) as response:
+                if response.status_code != http.HTTPStatus.OK:
+                    self._logger.warning(f"Failed to get persistence values from openhab item {oh_item}. Return code: {response.status_code}. text: {response.text})")
+                    metrics.HTTP_ERRORS.inc('get')
+                    return None
+                return [(int(data['time']), float(data['state'])) for data in response.json()['data']]
+        except requests.exceptions.RequestException as e:
+            self._log_request_exception("Caught Exception while getting persistence data from openHAB: ", e)
+            metrics.HTTP_ERRORS.inc('get')
+            return None
+
     # NOTE: This can potentially return values, although no new values have been posted. Depending on the config: 
     # https://www.openhab.org/docs/configuration/persistence.html
     def _get_persistence_values(self, oh_item_names : Tuple[str, ...], start_time : datetime.datetime, end_time : datetime.datetime) -> PersistenceValuesType:
-        pers_values = []
-        for item in oh_item_names:
-            if item:
-                values=[]
-                try:
-                    with self._session.get(
-                        url=f"{self._oh_host}/rest/persistence/items/{item}", 
-                        params={'starttime': start_time.isoformat(), 'endtime': end_time.isoformat()},
-                        verify=False) as response:
-                        if response.status_code != http.HTTPStatus.OK:
-                            self._logger.warning(f"Failed to get persistence values from openhab item {item}. Return code: {response.status_code}. text: {response.text})")
-                        else:
-                            values=[float(data['state']) for data in response.json()['data']]
-                except requests.exceptions.RequestException as e:
-                    self._logger.warning("Caught Exception while getting persistence data from openHAB: " + str(e))
-                pers_values.append(values)
-        return pers_values
+        # items are fetched in parallel, repeated checks of overlapping windows only fetch the new values
+        return self._persistence_cache.get_values(oh_item_names, start_time, end_time)
 
     def check_if_persistence_values_updated(self, start_time : datetime.datetime, end_time : datetime.datetime) -> bool:
         pers_values=self._get_persistence_values(SmartMeterValues.oh_item_names(), start_time, end_time)
@@ -0,0 +1,120 @@
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+from logging import Logger
+from pathlib import Path
+from time import monotonic, perf_counter
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from .interfaces import OhItemAndValue
+
+# writes the (time, state) values in order to the persistence of the item (1st argument) and gives up at the deadline
+# (3rd argument, monotonic time, None: no deadline). Returns the number of values that have been written (the first ones).
+PersistenceWriteFunction = Callable[[str, List[Tuple[datetime, float]], Optional[float]], int]
+
+class PersistenceOutbox():
+    """Durable store of values that could not be posted to openHAB
+
+    The values are stored with their timestamp in a SQLite database, so they survive restarts of the process.
+    The outbox is bounded by the number of stored values and their age (the oldest values are dropped).
+    Stored values are replayed into the openHAB persistence (not as item state) to fill the gaps in the history.
+    The replay can take a while (a request per value), so it is usually run in a thread (see replay_in_background).
+    """
+    def __init__(self, db_file : Path, logger : Logger, max_entries : int = 100000, max_age : timedelta = timedelta(days=7)) -> None:
+        self._logger=logger
+        self._max_entries=max_entries
+        self._max_age=max_age
+        self._lock=threading.Lock()
+        # NOTE: The outbox is used by the reading or the publishing thread. The lock serializes the access.
+        self._db=sqlite3.connect(db_file, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, time_ms INTEGER NOT NULL, item TEXT NOT NULL, state REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS outbox_time ON outbox (time_ms)")
+        self._db.commit()
+        self._count=self._db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+        self.append_latency_sec=0.0
+        self.replay_values_per_sec=0.0
+        self._replay_thread : Optional[threading.Thread] = None
+        if self._count:
+            self._logger.info(f"Outbox {db_file} contains {self._count} values to replay.")
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, timestamp : datetime, values : Iterable[OhItemAndValue]) -> None:
+        time_ms=int(timestamp.timestamp()*1000)
+        rows=[(time_ms, str(value.oh_item), value.value) for value in values if value.value is not None and value.oh_item]
+        if not rows:
+            return
+        start=perf_counter()
+        with self._lock:
+            self._db.executemany("INSERT INTO outbox (time_ms, item, state) VALUES (?, ?, ?)", rows)
+            self._count+=len(rows)
+            self._enforce_bounds(time_ms)
+            self._db.commit()
+        self.append_latency_sec=perf_counter()-start
+
+    def replay(self, write : PersistenceWriteFunction, batch_size : int = 500, budget_sec : Optional[float] = None) -> int:
+        """Replay the oldest values (up to batch_size) per item into the persistence
+
+        Parameters
+        ----------
+        budget_sec : float, optional
+            The replay is given up after this time, the remaining values stay in the outbox. None: no time budget
+
+        Returns
+        -------
+        int
+            Number of replayed values. Only the values that have been written are removed from the outbox.
+        """
+        start=perf_counter()
+        deadline=monotonic()+budget_sec if budget_sec is not None else None
+        with self._lock:
+            rows=self._db.execute("SELECT id, time_ms, item, state FROM outbox ORDER BY id LIMIT ?", (batch_size,)).fetchall()
+        values_per_item : Dict[str, List[Tuple[int, datetime, float]]] = {}
+        for id, time_ms, item, state in rows:
+            values_per_item.setdefault(item, []).append((id, datetime.fromtimestamp(time_ms/1000, timezone.utc).astimezone(), state))
+
+        replayed_ids : List[Tuple[int]] = []
+        for item, values in values_per_item.items():
+            if deadline is not None and monotonic() >= deadline:
+                self._logger.warning(f"Stopped replaying values from outbox: Time budget of {budget_sec} sec exceeded.")
+                break
+            written=write(item, [(time, state) for _, time, state in values], deadline)
+            replayed_ids.extend((id,) for id, _, _ in values[:written])
+            if written < len(values):
+                self._logger.warning(f"Failed to replay {len(values)-written} of {len(values)} values of item {item} from outbox.")
+        if replayed_ids:
+            with self._lock:
+                # the values may have been dropped meanwhile (see _enforce_bounds)
+                self._count-=self._db.executemany("DELETE FROM outbox WHERE id = ?", replayed_ids).rowcount
+                self._db.commit()
+            duration=perf_counter()-start
+            self.replay_values_per_sec=len(replayed_ids)/duration if duration > 0 else 0
+            self._logger.info(f"Replayed {len(replayed_ids)} values from outbox ({self.replay_values_per_sec:.1f} values/sec). "
+                              f"{self._count} values left.")
+        return len(replayed_ids)
+
+    def replay_in_background(self, write : PersistenceWriteFunction, batch_size : int = 500, budget_sec : Optional[float] = None) -> bool:
+        """Replay the values (see replay) in a thread, so the caller (e.g. reading the smart meter) is not delayed.
+        Returns False if the previous replay is still running (nothing is started)."""
+        if self._replay_thread is not None and self._replay_thread.is_alive():
+            return False
+        self._replay_thread=threading.Thread(target=self.replay, args=(write, batch_size, budget_sec), name="outbox-replay", daemon=True)
+        self._replay_thread.start()
+        return True
+
+    def close(self) -> None:
+        if self._replay_thread is not None:
+            self._replay_thread.join()
+        with self._lock:
+            self._db.close()
+
+    def _enforce_bounds(self, time_ms : int) -> None:
+        dropped=self._db.execute("DELETE FROM outbox WHERE time_ms < ?", (time_ms-int(self._max_age.total_seconds()*1000),)).rowcount
+        if self._count-dropped > self._max_entries:
+            dropped+=self._db.execute("DELETE FROM outbox WHERE id IN (SELECT id FROM outbox ORDER BY id LIMIT ?)",
+                                      (self._count-dropped-self._max_entries,)).rowcount
+        if dropped:
+            self._count-=dropped
+            self._logger.warning(f"Dropped {dropped} of the oldest values from outbox (too old or outbox full).")
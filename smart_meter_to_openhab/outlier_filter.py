@@ -0,0 +1,143 @@
+from dataclasses import dataclass
+from time import monotonic
+from typing import Dict, List, Optional, Tuple
+from .interfaces import SmartMeterValues
+from .batch import _MAD_SCALE
+from .rolling import RollingWindow
+
+# channels of SmartMeterValues (the electricity meter is the last one)
+CHANNELS=('phase_1_consumption', 'phase_2_consumption', 'phase_3_consumption', 'overall_consumption', 'electricity_meter')
+_NO_VALUE=float('nan')
+_SECONDS_PER_HOUR=3600
+
+@dataclass(frozen=True)
+class OutlierFilterSettings():
+    # Hampel filter of the power channels: values that deviate more than threshold (scaled) median absolute deviations,
+    # but at least min_deviation_w, from the median of the latest window reads are outliers
+    window : int = 15
+    threshold : float = 5
+    min_deviation_w : float = 50
+    # number of reads before the power channels are filtered
+    min_count : int = 3
+    # consecutive outliers of a power channel that are close to each other are a new level (e.g. a device was switched on)
+    level_shift_count : int = 2
+    # electricity meter: the counter must not decrease and increase at most by max_power_w (plus the tolerance)
+    max_power_w : float = 50000
+    meter_tolerance_kwh : float = 0.001
+    # consecutive rejected counter values that are plausible among each other become the new reference
+    # (e.g. the first value was an outlier or the smart meter was replaced)
+    reanchor_count : int = 3
+
+class HampelFilter():
+    """Streaming Hampel filter of a channel: rolling median and median absolute deviation (see RollingWindow)
+
+    The deviations are taken from the median at the time each value was added, so the MAD is updated incrementally as well.
+    """
+    def __init__(self, window : int, threshold : float, min_deviation : float, min_count : int = 3, level_shift_count : int = 2) -> None:
+        self._window=window
+        self._threshold=threshold
+        self._min_deviation=min_deviation
+        self._min_count=min_count
+        self._level_shift_count=level_shift_count
+        self._values=RollingWindow(window)
+        self._deviations=RollingWindow(window)
+        # consecutive outliers
+        self._outliers : List[float] = []
+
+    def accept(self, value : float) -> bool:
+        """Add the value. Returns False if it is an outlier."""
+        median=self._values.median()
+        if median is None or self._values.count < self._min_count:
+            self._add(value, median)
+            return True
+        deviation=abs(value-median)
+        mad=self._deviations.median()
+        limit=max(self._threshold*mad*_MAD_SCALE if mad is not None else 0, self._min_deviation)
+        if deviation <= limit:
+            self._outliers.clear()
+            self._add(value, median)
+            return True
+        if self._outliers and abs(value-self._outliers[-1]) > limit:
+            self._outliers.clear()
+        self._outliers.append(value)
+        if len(self._outliers) < self._level_shift_count:
+            # the window keeps the outliers, so a lasting change is accepted when it is the median
+            self._add(value, median)
+            return False
+        # new level: restart the window with the values of the new level
+        self._values=RollingWindow(self._window)
+        self._deviations=RollingWindow(self._window)
+        for outlier in self._outliers:
+            self._add(outlier, self._values.median())
+        self._outliers.clear()
+        return True
+
+    def _add(self, value : float, median : Optional[float]) -> None:
+        self._values.push(value)
+        if median is not None:
+            self._deviations.push(abs(value-median))
+
+class MonotonicCounterFilter():
+    """Filter of an energy counter (kWh): it must not decrease and increase at most by max_power_w in the elapsed time"""
+    def __init__(self, max_power_w : float, tolerance_kwh : float, reanchor_count : int = 3) -> None:
+        self._max_power_kw=max_power_w/1000
+        self._tolerance_kwh=tolerance_kwh
+        self._reanchor_count=reanchor_count
+        # (timestamp, value) of the latest accepted value
+        self._reference : Optional[Tuple[float, float]] = None
+        self._candidate : Optional[Tuple[float, float]] = None
+        self._candidate_count=0
+
+    def accept(self, value : float, timestamp : float) -> bool:
+        """Add the value read at timestamp (seconds, e.g. monotonic()). Returns False if it is an outlier."""
+        if self._reference is None or self._plausible(self._reference, value, timestamp):
+            self._reference=(timestamp, value)
+            self._candidate=None
+            return True
+        if self._candidate is not None and self._plausible(self._candidate, value, timestamp):
+            self._candidate_count+=1
+        else:
+            self._candidate_count=1
+        self._candidate=(timestamp, value)
+        if self._candidate_count < self._reanchor_count:
+            return False
+        self._reference=self._candidate
+        self._candidate=None
+        return True
+
+    def _plausible(self, reference : Tuple[float, float], value : float, timestamp : float) -> bool:
+        reference_time, reference_value=reference
+        max_increase=self._max_power_kw*max(timestamp-reference_time, 0)/_SECONDS_PER_HOUR+self._tolerance_kwh
+        return reference_value <= value <= reference_value+max_increase
+
+class StreamingOutlierFilter():
+    """Per channel outlier filter of the reads of a smart meter
+
+    The power channels are filtered by a HampelFilter, the electricity meter by a MonotonicCounterFilter.
+    Outliers are removed from the read (set to None), the other channels of the read are kept.
+    The cost per read is O(log window) (see RollingWindow).
+    """
+    def __init__(self, settings : OutlierFilterSettings = OutlierFilterSettings()) -> None:
+        self._power_filters=[HampelFilter(settings.window, settings.threshold, settings.min_deviation_w, settings.min_count,
+                                          settings.level_shift_count) for _ in CHANNELS[:-1]]
+        self._meter_filter=MonotonicCounterFilter(settings.max_power_w, settings.meter_tolerance_kwh, settings.reanchor_count)
+        self.rejected_counts : Dict[str, int] = {channel : 0 for channel in CHANNELS}
+
+    def filter(self, values : SmartMeterValues, timestamp : Optional[float] = None) -> Dict[str, float]:
+        """Remove the outliers from the values (in place). Returns the removed values by channel."""
+        now=monotonic() if timestamp is None else timestamp
+        storage=values._values
+        outliers : Dict[str, float] = {}
+        for channel, power_filter in enumerate(self._power_filters):
+            value=storage[channel]
+            if value == value and not power_filter.accept(value):
+                outliers[CHANNELS[channel]]=value
+                storage[channel]=_NO_VALUE
+        meter=len(CHANNELS)-1
+        value=storage[meter]
+        if value == value and not self._meter_filter.accept(value, now):
+            outliers[CHANNELS[meter]]=value
+            storage[meter]=_NO_VALUE
+        for name in outliers:
+            self.rejected_counts[name]+=1
+        return outliers
@@ -0,0 +1,111 @@
+import bisect
+import threading
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from .utils import PersistenceValuesType
+
+# returns the (time in ms, state) values of the item (1st argument) between start and end time or None on failure
+PersistenceFetchFunction = Callable[[str, datetime.datetime, datetime.datetime], Optional[List[Tuple[int, float]]]]
+
+def _to_ms(time : datetime.datetime) -> int:
+    return int(time.timestamp()*1000)
+
+class _ItemWindow():
+    def __init__(self, start_ms : int, end_ms : int, values : List[Tuple[int, float]]) -> None:
+        self.start_ms=start_ms
+        self.end_ms=end_ms
+        values=sorted(values)
+        self.times=[time for time, _ in values]
+        self.states=[state for _, state in values]
+
+    def copy(self) -> '_ItemWindow':
+        window=_ItemWindow(self.start_ms, self.end_ms, [])
+        window.times=self.times.copy()
+        window.states=self.states.copy()
+        return window
+
+    def extend(self, end_ms : int, values : List[Tuple[int, float]]) -> None:
+        # the delta overlaps with the latest known value, skip the values that are already known
+        last_time=self.times[-1] if self.times else -1
+        for time, state in sorted(values):
+            if time > last_time:
+                self.times.append(time)
+                self.states.append(state)
+        self.end_ms=max(self.end_ms, end_ms)
+
+    def trim(self, start_ms : int) -> None:
+        index=bisect.bisect_left(self.times, start_ms)
+        del self.times[:index]
+        del self.states[:index]
+        self.start_ms=max(self.start_ms, start_ms)
+
+    def states_between(self, start_ms : int, end_ms : int) -> List[float]:
+        return self.states[bisect.bisect_left(self.times, start_ms):bisect.bisect_right(self.times, end_ms)]
+
+class PersistenceWindowCache():
+    """Fetches the persistence values of several items in parallel and caches the fetched window per item.
+
+    Subsequent requests of overlapping windows only fetch the values since the latest known value of each item.
+    Values before the start of the requested window are dropped from the cache (the window is expected to move forward).
+    Cached windows are not modified: an updated copy replaces the window, unless the cache has been invalidated meanwhile.
+    """
+    def __init__(self, fetch : PersistenceFetchFunction, max_workers : int = 5) -> None:
+        self._fetch=fetch
+        self._executor=ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='oh-persistence')
+        self._lock=threading.Lock()
+        self._windows : Dict[str, _ItemWindow] = {}
+        # incremented by invalidate. Windows fetched before are not cached.
+        self._generation=0
+        self.fetch_count=0
+        self.fetched_value_count=0
+
+    def get_values(self, oh_item_names : Tuple[str, ...], start_time : datetime.datetime, end_time : datetime.datetime) -> PersistenceValuesType:
+        """Returns the values for all specified items (empty items are skipped) between start and end time.
+        The values of items that could not be fetched are empty."""
+        items=[item for item in oh_item_names if item]
+        return list(self._executor.map(lambda item: self._get_item_values(item, start_time, end_time), items))
+
+    def invalidate(self, oh_item : Optional[str] = None) -> None:
+        """Drop the cached window of the item (default: all items), e.g. after values have been written into the past"""
+        with self._lock:
+            self._generation+=1
+            if oh_item is None:
+                self._windows.clear()
+            else:
+                self._windows.pop(oh_item, None)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def _get_item_values(self, oh_item : str, start_time : datetime.datetime, end_time : datetime.datetime) -> List[float]:
+        start_ms, end_ms=_to_ms(start_time), _to_ms(end_time)
+        with self._lock:
+            cached=self._windows.get(oh_item)
+            generation=self._generation
+        if cached is None or start_ms < cached.start_ms or end_ms < cached.end_ms:
+            values=self._fetch_counted(oh_item, start_time, end_time)
+            if values is None:
+                return []
+            window=_ItemWindow(start_ms, end_ms, values)
+        else:
+            window=cached.copy()
+            if end_ms > window.end_ms:
+                delta_start_ms=window.times[-1] if window.times else window.end_ms
+                values=self._fetch_counted(oh_item, datetime.datetime.fromtimestamp(delta_start_ms/1000, start_time.tzinfo), end_time)
+                if values is None:
+                    return []
+                window.extend(end_ms, values)
+        window.trim(start_ms)
+        with self._lock:
+            # another thread may have replaced the window, or values have been written into the past meanwhile
+            if self._generation == generation and self._windows.get(oh_item) is cached:
+                self._windows[oh_item]=window
+        return window.states_between(start_ms, end_ms)
+
+    def _fetch_counted(self, oh_item : str, start_time : datetime.datetime, end_time : datetime.datetime) -> Optional[List[Tuple[int, float]]]:
+        values=self._fetch(oh_item, start_time, end_time)
+        with self._lock:
+            self.fetch_count+=1
+            self.fetched_value_count+=len(values) if values else 0
+        return values
@@ -0,0 +1,110 @@
+import threading
+from collections import deque
+from logging import Logger
+from typing import Callable, Deque, Optional, Any, Literal, get_args
+from .interfaces import SmartMeterValues
+from . import metrics
+
+# drop_oldest: a full queue drops its oldest values
+# coalesce: a full queue merges the new values into the newest queued values (latest value per item wins)
+BackpressurePolicy = Literal['drop_oldest', 'coalesce']
+BACKPRESSURE_POLICIES : tuple = get_args(BackpressurePolicy)
+
+class BoundedValueQueue():
+    """Queue of SmartMeterValues that never blocks the producer"""
+    def __init__(self, max_size : int, policy : BackpressurePolicy = 'drop_oldest') -> None:
+        if max_size < 1:
+            raise ValueError(f"Unable to create BoundedValueQueue: max_size has to be at least 1")
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Unable to create BoundedValueQueue: Unknown backpressure policy {policy}")
+        self._values : Deque[SmartMeterValues] = deque()
+        self._max_size=max_size
+        self._policy=policy
+        self._condition=threading.Condition()
+        self._closed=False
+        self.dropped_count=0
+        self.coalesced_count=0
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def put(self, values : SmartMeterValues) -> None:
+        with self._condition:
+            if len(self._values) >= self._max_size:
+                # values of different items (e.g. of another smart meter) can not be merged
+                if self._policy == 'drop_oldest' or self._values[-1]._layout is not values._layout:
+                    self._values.popleft()
+                    self.dropped_count+=1
+                else:
+                    self._values[-1].assign_values([value for value in values if value.value is not None])
+                    self.coalesced_count+=1
+                    return
+            self._values.append(values)
+            self._condition.notify()
+
+    def get(self, timeout : Optional[float] = None) -> Optional[SmartMeterValues]:
+        """Returns the oldest values. Returns None if the timeout expired or the queue is closed and empty."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._values or self._closed, timeout)
+            return self._values.popleft() if self._values else None
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed=True
+            self._condition.notify_all()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+class AcquisitionPipeline():
+    """Decouples reading the smart meter from publishing the values.
+
+    The reading stage runs in the calling thread and feeds the values into a bounded queue.
+    The publishing stage drains the queue in a separate thread. So the read cadence does not depend on the publishing latency.
+    """
+    def __init__(self, read : Callable[[], SmartMeterValues], publish : Callable[[SmartMeterValues], Any], logger : Logger,
+                 queue_size : int = 10, policy : BackpressurePolicy = 'drop_oldest') -> None:
+        self._read=read
+        self._publish=publish
+        self._logger=logger
+        self.queue=BoundedValueQueue(queue_size, policy)
+
+    def run(self, check_exit : Callable[[SmartMeterValues], Optional[bool]], shutdown_timeout : float = 30) -> bool:
+        """Read and publish until check_exit returns a result (not None) for the latest values.
+
+        Values that are queued when exiting are still published (within the shutdown_timeout).
+
+        Returns
+        -------
+        bool
+            The result of check_exit
+        """
+        publish_thread=threading.Thread(target=self._publish_values, name='oh-publish-stage', daemon=True)
+        publish_thread.start()
+        metrics.QUEUE_DEPTH.set_function(lambda: len(self.queue))
+        try:
+            while True:
+                values=self._read()
+                self.queue.put(values)
+                result=check_exit(values)
+                if result is not None:
+                    return result
+        finally:
+            self.queue.close()
+            publish_thread.join(shutdown_timeout)
+            metrics.QUEUE_DEPTH.set_function(None)
+            if publish_thread.is_alive():
+                self._logger.warning(f"Publishing of the remaining {len(self.queue)} values did not finish within {shutdown_timeout} sec.")
+            if self.queue.dropped_count or self.queue.coalesced_count:
+                self._logger.info(f"Backpressure: dropped {self.queue.dropped_count} and coalesced {self.queue.coalesced_count} values.")
+
+    def _publish_values(self) -> None:
+        while True:
+            values=self.queue.get()
+            if values is None:
+                return
+            try:
+                self._publish(values)
+            except Exception as e:
+                self._logger.exception("Caught Exception while publishing values: " + str(e))
@@ -0,0 +1,196 @@
+import sys
+import threading
+from array import array
+from contextlib import nullcontext
+from logging import Logger
+from pathlib import Path
+from time import perf_counter, thread_time
+from typing import Any, Dict, List, Optional, ContextManager
+from . import metrics
+
+# stages of a cycle. Everything else (e.g. aggregation, logging, the publish filter) is reported as 'other'.
+#   serial: waiting for and reading the data of the smart meter
+#   decode: decoding the SML frames
+#   sleep: sleeps between the reads (read_avg)
+#   publish: posting the values to openHAB (incl. HTTP retries)
+STAGES=('serial', 'decode', 'sleep', 'publish')
+_STAGE_INDICES={name : index for index, name in enumerate(STAGES)}
+# layout of a cycle record in the ring buffer: wall and cpu time of the cycle, wall and cpu time per stage, HTTP retries
+_WALL, _CPU, _STAGE_OFFSET=0, 1, 2
+_RETRIES=_STAGE_OFFSET+2*len(STAGES)
+_RECORD_SIZE=_RETRIES+1
+
+class _Stage():
+    __slots__=('_profiler', '_index', '_wall', '_cpu')
+
+    def __init__(self, profiler : 'CycleProfiler', index : int) -> None:
+        self._profiler=profiler
+        self._index=index
+
+    def __enter__(self) -> None:
+        self._wall=perf_counter()
+        self._cpu=thread_time()
+
+    def __exit__(self, *args) -> None:
+        current=self._profiler._current
+        current[_STAGE_OFFSET+2*self._index]+=perf_counter()-self._wall
+        current[_STAGE_OFFSET+2*self._index+1]+=thread_time()-self._cpu
+
+class StackSampler():
+    """Sampling profiler of a thread. The samples are written in the collapsed stack format of flamegraph.pl (and speedscope etc.)."""
+    def __init__(self, thread_id : int, interval_sec : float = 0.005) -> None:
+        self._thread_id=thread_id
+        self._interval_sec=interval_sec
+        self._stop=threading.Event()
+        self.samples : Dict[str, int] = {}
+        self._thread=threading.Thread(target=self._sample, name='stack-sampler', daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, file : Path) -> None:
+        with open(file, 'w') as f:
+            for stack, count in sorted(self.samples.items()):
+                f.write(f"{stack} {count}\n")
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self._interval_sec):
+            frame=sys._current_frames().get(self._thread_id)
+            names : List[str] = []
+            while frame is not None:
+                code=frame.f_code
+                names.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+                frame=frame.f_back
+            if names:
+                stack=';'.join(reversed(names))
+                self.samples[stack]=self.samples.get(stack, 0)+1
+
+class CycleProfiler():
+    """Records the wall and CPU time per stage (see STAGES) of each cycle of the main loop
+
+    A cycle is reading and publishing one value (reading only in pipeline mode). The latest cycles are kept in a ring buffer.
+    Only the stages of the thread that started the cycle are recorded (e.g. not the publish stage of the pipeline).
+
+    Parameters
+    ----------
+    capacity : int
+        Number of cycles kept in the ring buffer
+    budget_sec : float, optional
+        Log a warning with the time per stage if a cycle takes longer
+    flamegraph_file : Path, optional
+        Sample the stacks of the first flamegraph_cycles cycles and write them to this file (collapsed stack format)
+    """
+    def __init__(self, logger : Logger, capacity : int = 3600, budget_sec : Optional[float] = None,
+                 flamegraph_file : Optional[Path] = None, flamegraph_cycles : int = 10) -> None:
+        self._logger=logger
+        self._capacity=capacity
+        self._budget_sec=budget_sec
+        self._records=array('d', bytes(8*_RECORD_SIZE*capacity))
+        self._count=0
+        self._current=array('d', bytes(8*_RECORD_SIZE))
+        self._stages=[_Stage(self, index) for index in range(len(STAGES))]
+        self._thread_id=threading.get_ident()
+        self._flamegraph_file=flamegraph_file
+        self._flamegraph_cycles=flamegraph_cycles
+        self._sampler : Optional[StackSampler] = None
+        self.start_cycle()
+
+    def start_cycle(self) -> None:
+        """Start recording a cycle in the calling thread"""
+        self._thread_id=threading.get_ident()
+        for i in range(_RECORD_SIZE):
+            self._current[i]=0
+        self._cycle_wall=perf_counter()
+        self._cycle_cpu=thread_time()
+        self._cycle_retries=metrics.HTTP_RETRIES.get()
+        if self._flamegraph_file and self._sampler is None and self._count < self._flamegraph_cycles:
+            self._sampler=StackSampler(self._thread_id)
+            self._sampler.start()
+
+    def end_cycle(self) -> None:
+        current=self._current
+        current[_WALL]=perf_counter()-self._cycle_wall
+        current[_CPU]=thread_time()-self._cycle_cpu
+        current[_RETRIES]=metrics.HTTP_RETRIES.get()-self._cycle_retries
+        offset=(self._count % self._capacity)*_RECORD_SIZE
+        self._records[offset:offset+_RECORD_SIZE]=current
+        self._count+=1
+        if self._budget_sec is not None and current[_WALL] > self._budget_sec:
+            self._logger.warning(f"Cycle took {current[_WALL]:.3f} sec (budget {self._budget_sec:.3f} sec): {self._format(current)}")
+        if self._sampler is not None and self._count >= self._flamegraph_cycles:
+            self._write_flamegraph()
+
+    def stage(self, name : str) -> ContextManager[Any]:
+        """Context manager recording the time of the stage in the current cycle"""
+        if threading.get_ident() != self._thread_id:
+            return nullcontext()
+        return self._stages[_STAGE_INDICES[name]]
+
+    @property
+    def cycle_count(self) -> int:
+        return self._count
+
+    def records(self) -> List[Dict[str, float]]:
+        """The cycles of the ring buffer (oldest first) with the wall and cpu time in seconds of the cycle and each stage"""
+        first=max(0, self._count-self._capacity)
+        records : List[Dict[str, float]] = []
+        for cycle in range(first, self._count):
+            offset=(cycle % self._capacity)*_RECORD_SIZE
+            records.append(self._to_dict(self._records[offset:offset+_RECORD_SIZE]))
+        return records
+
+    def summary(self) -> str:
+        records=self.records()
+        if not records:
+            return "No cycles recorded."
+        def _percentiles(key : str) -> str:
+            values=sorted(record[key] for record in records)
+            return f"p50 {values[len(values)//2]:.3f} / p99 {values[min(len(values)-1, int(len(values)*0.99))]:.3f} / max {values[-1]:.3f}"
+        lines=[f"Profile of the latest {len(records)} cycles (wall time in sec):", f"  cycle: {_percentiles('wall')}"]
+        for name in STAGES+('other',):
+            lines.append(f"  {name}: {_percentiles(name)}")
+        lines.append(f"  cpu: {_percentiles('cpu')}")
+        return '\n'.join(lines)
+
+    def close(self) -> None:
+        if self._sampler is not None:
+            self._write_flamegraph()
+
+    def _write_flamegraph(self) -> None:
+        self._sampler.stop() # type: ignore
+        self._sampler.write(self._flamegraph_file) # type: ignore
+        self._logger.info(f"Stack samples of {self._count} cycles written to {self._flamegraph_file}.")
+        self._flamegraph_file=None
+        self._sampler=None
+
+    def _to_dict(self, record : Any) -> Dict[str, float]:
+        result={'wall' : record[_WALL], 'cpu' : record[_CPU], 'http_retries' : record[_RETRIES]}
+        for index, name in enumerate(STAGES):
+            result[name]=record[_STAGE_OFFSET+2*index]
+            result[f'{name}_cpu']=record[_STAGE_OFFSET+2*index+1]
+        result['other']=max(0.0, record[_WALL]-sum(result[name] for name in STAGES))
+        return result
+
+    def _format(self, record : Any) -> str:
+        result=self._to_dict(record)
+        stages=', '.join(f"{name} {result[name]:.3f}" for name in STAGES+('other',))
+        return f"{stages} (cpu {result['cpu']:.3f}, HTTP retries {int(result['http_retries'])})"
+
+# the profiler of the main loop (see activate)
+_active : Optional[CycleProfiler] = None
+_NO_STAGE=nullcontext()
+
+def activate(profiler : Optional[CycleProfiler]) -> None:
+    """Record the stages (see stage) with this profiler. None disables the recording."""
+    global _active
+    _active=profiler
+
+def stage(name : str) -> ContextManager[Any]:
+    """Context manager recording the time of the stage with the active profiler (does nothing if no profiler is active)"""
+    if _active is None:
+        return _NO_STAGE
+    return _active.stage(name)
@@ -0,0 +1,103 @@
+import configparser
+from dataclasses import dataclass, fields
+from pathlib import Path
+from time import monotonic
+from typing import Collection, Dict, Iterable, List, Optional, Tuple
+from .interfaces import OhItemAndValue
+
+@dataclass(frozen=True)
+class PublishFilterConfig():
+    # changes within the deadband are not published. The deadband is the maximum of both.
+    absolute_deadband : float = 0
+    relative_deadband : float = 0
+    # minimum time between two published values
+    min_interval_sec : float = 0
+    # publish the value again after this time, even if it did not change (heartbeat)
+    max_silence_sec : Optional[float] = None
+
+def load_publish_filter_config(config_file : Path) -> Tuple[Optional[PublishFilterConfig], Dict[str, PublishFilterConfig]]:
+    """Load the publish filter configuration from an ini file
+
+    Each section configures the openHAB item with the same name. The DEFAULT section applies to all items.
+    Keys are the fields of PublishFilterConfig, e.g.:
+
+    [DEFAULT]
+    max_silence_sec = 300
+    [smart_meter_overall_consumption]
+    absolute_deadband = 5
+
+    Returns
+    -------
+    Tuple[Optional[PublishFilterConfig], Dict[str, PublishFilterConfig]]
+        The default configuration (None if there is no DEFAULT section) and the configuration per item
+    """
+    parser=configparser.ConfigParser()
+    with open(config_file, 'r') as f:
+        parser.read_file(f)
+    def _create(section : configparser.SectionProxy) -> PublishFilterConfig:
+        unknown_keys=set(section.keys())-{field.name for field in fields(PublishFilterConfig)}
+        if unknown_keys:
+            raise ValueError(f"Unknown publish filter settings {unknown_keys} in section {section.name} of {config_file}")
+        return PublishFilterConfig(**{key : float(value) for key, value in section.items()}) # type: ignore
+    default_config=_create(parser[parser.default_section]) if parser.defaults() else None
+    return default_config, {section : _create(parser[section]) for section in parser.sections()}
+
+class PublishFilter():
+    """Suppresses values that do not need to be published (deadband, minimum interval) per openHAB item
+
+    Items without a configuration (and without a default configuration) are never suppressed.
+    The filter compares with the values that have actually been published, so call commit after posting the filtered values.
+    """
+    def __init__(self, item_configs : Dict[str, PublishFilterConfig], default_config : Optional[PublishFilterConfig] = None) -> None:
+        self._item_configs=item_configs
+        self._default_config=default_config
+        self._last_published : Dict[str, Tuple[float, float]] = {}
+        # (time, value) returned by the latest filter call, see commit
+        self._pending : Dict[str, Tuple[float, float]] = {}
+        self.published_counts : Dict[str, int] = {}
+        self.suppressed_counts : Dict[str, int] = {}
+
+    def filter(self, values : Iterable[OhItemAndValue], timestamp : Optional[float] = None) -> List[OhItemAndValue]:
+        """Returns the values to publish. Suppressed values are set to None."""
+        now=timestamp if timestamp is not None else monotonic()
+        self._pending.clear()
+        filtered_values : List[OhItemAndValue] = []
+        for value in values:
+            oh_item=str(value.oh_item)
+            if value.value is None or not oh_item:
+                filtered_values.append(OhItemAndValue(oh_item, value.value))
+                continue
+            if self._publish(oh_item, value.value, now):
+                self._pending[oh_item]=(now, value.value)
+                self.published_counts[oh_item]=self.published_counts.get(oh_item, 0)+1
+                filtered_values.append(OhItemAndValue(oh_item, value.value))
+            else:
+                self.suppressed_counts[oh_item]=self.suppressed_counts.get(oh_item, 0)+1
+                filtered_values.append(OhItemAndValue(oh_item))
+        return filtered_values
+
+    def commit(self, failed_items : Collection[str] = ()) -> None:
+        """Record the values of the latest filter call as published, except the values of failed_items (e.g. last_failed_items of the connection).
+        The failed values are not suppressed by the deadband next time."""
+        for oh_item, published in self._pending.items():
+            if oh_item not in failed_items:
+                self._last_published[oh_item]=published
+        self._pending.clear()
+
+    def summary(self) -> str:
+        return ', '.join(f"{item}: {self.suppressed_counts.get(item, 0)} of {self.suppressed_counts.get(item, 0)+count} suppressed"
+                         for item, count in self.published_counts.items())
+
+    def _publish(self, oh_item : str, value : float, now : float) -> bool:
+        config=self._item_configs.get(oh_item, self._default_config)
+        last_published=self._last_published.get(oh_item)
+        if config is None or last_published is None:
+            return True
+        last_time, last_value=last_published
+        elapsed=now-last_time
+        if config.max_silence_sec is not None and elapsed >= config.max_silence_sec:
+            return True
+        if elapsed < config.min_interval_sec:
+            return False
+        deadband=max(config.absolute_deadband, config.relative_deadband*abs(last_value))
+        return abs(value-last_value) > deadband
@@ -0,0 +1,78 @@
+import threading
+from logging import Logger
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Set, Optional
+
+# posts the value (2nd argument) to the item (1st argument). Returns True on success.
+PostFunction = Callable[[str, str], bool]
+
+class CoalescingPublisher():
+    """Posts values of items in parallel using a bounded pool of worker threads.
+
+    Values of the same item are posted one after another (at most one worker per item).
+    If a new value of an item arrives while an older one is still waiting to be posted, the older one is dropped
+    (latest value wins).
+    """
+    def __init__(self, post : PostFunction, logger : Logger, max_workers : int = 5) -> None:
+        self._post=post
+        self._logger=logger
+        self._executor=ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='oh-publisher')
+        self._condition=threading.Condition()
+        self._pending : Dict[str, str] = {}
+        self._active : Set[str] = set()
+        self._results : Dict[str, bool] = {}
+        self.coalesced_count=0
+
+    def submit(self, oh_item : str, value : str) -> None:
+        with self._condition:
+            if oh_item in self._pending:
+                self.coalesced_count+=1
+            self._pending[oh_item]=value
+            if oh_item in self._active:
+                # the worker of this item picks up the new value
+                return
+            self._active.add(oh_item)
+        self._executor.submit(self._drain, oh_item)
+
+    def wait(self, oh_items : Optional[Set[str]] = None, timeout : Optional[float] = None) -> bool:
+        """Wait until the latest submitted values of the items (default: all items) have been posted.
+
+        Returns
+        -------
+        bool
+            True if the latest values of all items have been posted successfully within the timeout
+        """
+        with self._condition:
+            items=oh_items if oh_items is not None else set(self._results) | self._active
+            if not self._condition.wait_for(lambda: self._active.isdisjoint(items), timeout):
+                return False
+            return all(self._results.get(item, False) for item in items)
+
+    def failed_items(self, oh_items : Set[str]) -> Set[str]:
+        """Returns the items whose latest post failed (or did not finish yet)"""
+        with self._condition:
+            return {item for item in oh_items if not self._results.get(item, False) or item in self._active}
+
+    def publish(self, values : Dict[str, str], timeout : Optional[float] = None) -> bool:
+        for oh_item, value in values.items():
+            self.submit(oh_item, value)
+        return self.wait(set(values), timeout)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def _drain(self, oh_item : str) -> None:
+        while True:
+            with self._condition:
+                if oh_item not in self._pending:
+                    self._active.discard(oh_item)
+                    self._condition.notify_all()
+                    return
+                value=self._pending.pop(oh_item)
+            try:
+                success=self._post(oh_item, value)
+            except Exception as e:
+                self._logger.warning(f"Caught Exception while posting value of item {oh_item}: {e}")
+                success=False
+            with self._condition:
+                self._results[oh_item]=success
@@ -0,0 +1,256 @@
+import gzip
+import json
+import os
+import queue
+import struct
+import threading
+from dataclasses import dataclass, asdict, field
+from datetime import datetime
+from logging import Logger
+from pathlib import Path
+from time import time, monotonic
+from typing import BinaryIO, Dict, Iterator, List, Literal, Optional, Tuple
+
+try:
+    # Python 3.14+
+    from compression import zstd # type: ignore
+except ImportError:
+    zstd = None
+
+CompressionType = Literal['gzip', 'zstd']
+CLASSIFICATIONS=('valid', 'invalid', 'inconsistent', 'corrupt')
+INDEX_FILE_NAME='index.json'
+_SEGMENT_SUFFIXES : Dict[str, str] = {'gzip' : '.sml.gz', 'zstd' : '.sml.zst'}
+# record header: unix timestamp (double), classification (index of CLASSIFICATIONS), frame length
+_RECORD_HEADER=struct.Struct('<dBI')
+
+@dataclass
+class SegmentInfo():
+    """Entry of the archive index"""
+    file_name : str
+    first_timestamp : float
+    last_timestamp : float
+    frame_count : int = 0
+    # number of frames per classification
+    classification_counts : Dict[str, int] = field(default_factory=dict)
+
+def _open_segment_file(path : Path, mode : str) -> BinaryIO:
+    if path.name.endswith(_SEGMENT_SUFFIXES['zstd']):
+        if zstd is None:
+            raise ImportError(f"Unable to open {path}: zstd requires Python 3.14 or newer")
+        return zstd.open(path, mode) # type: ignore
+    return gzip.open(path, mode) # type: ignore
+
+def _segment_files(directory : Path) -> List[Path]:
+    # the names start with the creation time
+    return sorted(path for suffix in _SEGMENT_SUFFIXES.values() for path in directory.glob(f'raw_frames_*{suffix}'))
+
+def _read_segment(path : Path) -> Iterator[Tuple[float, str, bytes]]:
+    with _open_segment_file(path, 'rb') as f:
+        try:
+            while True:
+                header=f.read(_RECORD_HEADER.size)
+                if len(header) < _RECORD_HEADER.size:
+                    return
+                timestamp, classification, length=_RECORD_HEADER.unpack(header)
+                frame=f.read(length)
+                if len(frame) < length:
+                    return
+                yield timestamp, CLASSIFICATIONS[classification], frame
+        except (EOFError, OSError):
+            # truncated segment
+            return
+
+def read_raw_archive(directory : Path) -> Iterator[Tuple[float, str, bytes]]:
+    """Read all frames of the archive (oldest first)
+
+    Returns
+    -------
+    Iterator[Tuple[float, str, bytes]]
+        The unix timestamp, the classification and the raw frame.
+        Segments that have not been closed properly (e.g. power loss) are read up to the last complete frame.
+    """
+    for path in _segment_files(directory):
+        yield from _read_segment(path)
+
+def load_archive_index(directory : Path) -> List[SegmentInfo]:
+    try:
+        with open(directory / INDEX_FILE_NAME, 'r') as f:
+            return [SegmentInfo(**segment) for segment in json.load(f)]
+    except FileNotFoundError:
+        return []
+
+class RawFrameArchive():
+    """Archive of raw SML frames with their timestamp and classification
+
+    Frames are appended to a queue and written by a background thread, so the read loop does not wait for the file system.
+    The frames are stored binary in compressed segment files, which are rotated by size. Closed segments are listed in an index
+    (index.json) with their time range and number of frames. Segments are named by their creation time, so they are never
+    overwritten after a restart.
+
+    Parameters
+    ----------
+    directory : Path
+        Directory of the segments and the index
+    max_segment_bytes : int
+        A new segment is started when the (compressed) segment reaches this size
+    max_segments : int, optional
+        The oldest segments are deleted when there are more segments
+    compression : str
+        gzip or zstd (requires Python 3.14)
+    queue_size : int
+        Maximum number of frames waiting to be written. Further frames are dropped (see dropped_count).
+    flush_interval_sec : float
+        Written frames are flushed to the segment file at least this often
+    """
+    def __init__(self, directory : Path, logger : Logger, max_segment_bytes : int = 1 << 20, max_segments : Optional[int] = 100,
+                 compression : CompressionType = 'gzip', queue_size : int = 1000, flush_interval_sec : float = 10) -> None:
+        if compression == 'zstd' and zstd is None:
+            raise ImportError("Unable to create RawFrameArchive: zstd requires Python 3.14 or newer")
+        self._directory=directory
+        self._logger=logger
+        self._max_segment_bytes=max_segment_bytes
+        self._max_segments=max_segments
+        self._suffix=_SEGMENT_SUFFIXES[compression]
+        self._flush_interval_sec=flush_interval_sec
+        os.makedirs(directory, exist_ok=True)
+        self._index=load_archive_index(directory)
+        self._recover_segments()
+        self._queue : queue.Queue = queue.Queue(queue_size)
+        self._file : Optional[BinaryIO] = None
+        self._raw_file : Optional[BinaryIO] = None
+        self._segment : Optional[SegmentInfo] = None
+        self.dropped_count=0
+        self.written_count=0
+        self._thread=threading.Thread(target=self._write_frames, name='raw-frame-archive', daemon=True)
+        self._thread.start()
+
+    def append(self, classification : str, frame : bytes, timestamp : Optional[float] = None) -> bool:
+        """Queue the frame to be archived (without blocking). Returns False if the frame has been dropped (queue full)."""
+        try:
+            self._queue.put_nowait((time() if timestamp is None else timestamp, CLASSIFICATIONS.index(classification), frame))
+            return True
+        except queue.Full:
+            self.dropped_count+=1
+            return False
+
+    def flush(self, timeout : Optional[float] = None) -> None:
+        """Wait until all queued frames are written and flushed to the segment file"""
+        done=threading.Event()
+        self._queue.put(done, timeout=timeout)
+        done.wait(timeout)
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+        if self.dropped_count:
+            self._logger.warning(f"Dropped {self.dropped_count} frames of the raw frame archive (writing too slow).")
+
+    @property
+    def index(self) -> List[SegmentInfo]:
+        """The closed segments"""
+        return list(self._index)
+
+    def _write_frames(self) -> None:
+        last_flush=monotonic()
+        while True:
+            try:
+                item=self._queue.get(timeout=self._flush_interval_sec)
+            except queue.Empty:
+                item=threading.Event()
+            try:
+                if item is None:
+                    self._close_segment()
+                elif isinstance(item, threading.Event):
+                    if self._file is not None:
+                        self._file.flush()
+                    last_flush=monotonic()
+                else:
+                    self._write(*item)
+                    if self._file is not None and monotonic()-last_flush > self._flush_interval_sec:
+                        self._file.flush()
+                        last_flush=monotonic()
+            except OSError as e:
+                # e.g. disk full. The archive must not stop the reading of the smart meter.
+                self._logger.warning(f"Caught Exception while writing raw frame archive: {e}")
+                try:
+                    self._close_segment()
+                except OSError:
+                    self._file=self._raw_file=self._segment=None
+            finally:
+                if isinstance(item, threading.Event):
+                    item.set()
+            if item is None:
+                return
+
+    def _write(self, timestamp : float, classification : int, frame : bytes) -> None:
+        if self._file is None:
+            self._open_segment(timestamp)
+        self._file.write(_RECORD_HEADER.pack(timestamp, classification, len(frame))) # type: ignore
+        self._file.write(frame) # type: ignore
+        segment=self._segment
+        segment.last_timestamp=timestamp # type: ignore
+        segment.frame_count+=1 # type: ignore
+        name=CLASSIFICATIONS[classification]
+        segment.classification_counts[name]=segment.classification_counts.get(name, 0)+1 # type: ignore
+        self.written_count+=1
+        if self._raw_file.tell() >= self._max_segment_bytes: # type: ignore
+            self._close_segment()
+
+    def _open_segment(self, timestamp : float) -> None:
+        name=datetime.fromtimestamp(timestamp).strftime('raw_frames_%Y%m%d_%H%M%S_%f')
+        path=self._directory / f"{name}{self._suffix}"
+        counter=0
+        while path.exists():
+            counter+=1
+            path=self._directory / f"{name}_{counter}{self._suffix}"
+        # the size of the compressed segment is taken from the underlying file
+        self._raw_file=open(path, 'wb')
+        self._file=gzip.GzipFile(fileobj=self._raw_file, mode='wb') if self._suffix == _SEGMENT_SUFFIXES['gzip'] \
+            else zstd.ZstdFile(self._raw_file, 'wb') # type: ignore
+        self._segment=SegmentInfo(path.name, timestamp, timestamp)
+
+    def _recover_segments(self) -> None:
+        """Add the segments to the index that have not been closed (e.g. the process has been killed)"""
+        indexed={segment.file_name for segment in self._index}
+        recovered=False
+        for path in _segment_files(self._directory):
+            if path.name in indexed:
+                continue
+            segment : Optional[SegmentInfo] = None
+            for timestamp, classification, _ in _read_segment(path):
+                if segment is None:
+                    segment=SegmentInfo(path.name, timestamp, timestamp)
+                segment.last_timestamp=timestamp
+                segment.frame_count+=1
+                segment.classification_counts[classification]=segment.classification_counts.get(classification, 0)+1
+            self._index.append(segment or SegmentInfo(path.name, 0, 0))
+            recovered=True
+        if recovered:
+            self._index.sort(key=lambda segment: segment.file_name)
+            self._logger.info(f"Recovered segments of the raw frame archive {self._directory}.")
+            self._update_index()
+
+    def _close_segment(self) -> None:
+        if self._file is None:
+            return
+        segment=self._segment
+        self._file.close()
+        self._raw_file.close() # type: ignore
+        self._file=self._raw_file=self._segment=None
+        self._index.append(segment) # type: ignore
+        self._update_index()
+
+    def _update_index(self) -> None:
+        if self._max_segments is not None:
+            while len(self._index) > self._max_segments:
+                oldest=self._index.pop(0)
+                try:
+                    os.remove(self._directory / oldest.file_name)
+                except FileNotFoundError:
+                    pass
+        # replace the index atomically
+        tmp_file=self._directory / f"{INDEX_FILE_NAME}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump([asdict(segment) for segment in self._index], f, indent=1)
+        os.replace(tmp_file, self._directory / INDEX_FILE_NAME)
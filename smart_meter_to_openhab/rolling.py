@@ -0,0 +1,208 @@
+import heapq
+import math
+from array import array
+from collections import deque
+from typing import Deque, List, Optional, Tuple, Union
+from .interfaces import SmartMeterValues, SmartMeterOhItemNames
+from .batch import AggregateType
+
+_NO_VALUE=math.nan
+_CHANNEL_COUNT=5
+# side of a value in the median heaps
+_LOW=0
+_HIGH=1
+
+class RollingWindow():
+    """The latest capacity values of a channel with incremental statistics
+
+    The values are kept in a ring buffer, so a push does not copy the window (unlike appending to a list and slicing it).
+    Mean, min and max take O(1) per push: a running sum and monotonic deques of the candidates for min and max.
+    The median takes O(log n) per push: two heaps (the lower and the upper half of the values), outdated values are
+    removed from the heaps when they reach the top (or when the heaps are compacted).
+    Missing values (None or NaN) take a place in the window, but are not part of the statistics.
+
+    Parameters
+    ----------
+    capacity : int
+        Number of values in the window. Each push removes the oldest value once the window is full.
+    """
+    def __init__(self, capacity : int) -> None:
+        if capacity < 1:
+            raise ValueError(f"Unable to create RollingWindow: capacity has to be positive")
+        self._capacity=capacity
+        self._values=array('d', (_NO_VALUE,))*capacity
+        # heap of each value in the window (see _LOW and _HIGH)
+        self._sides=bytearray(capacity)
+        # number of pushed values. The value with sequence number seq is at position seq % capacity.
+        self._seq=0
+        self._count=0
+        self._sum=0.0
+        # (-value, seq) of the lower half (max-heap) and (value, seq) of the upper half (min-heap)
+        self._low : List[Tuple[float, int]] = []
+        self._high : List[Tuple[float, int]] = []
+        self._low_size=0
+        self._high_size=0
+        # (seq, value) with ascending values (min) and descending values (max)
+        self._min : Deque[Tuple[int, float]] = deque()
+        self._max : Deque[Tuple[int, float]] = deque()
+
+    def __len__(self) -> int:
+        """Number of values in the window (incl. missing values)"""
+        return min(self._seq, self._capacity)
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def count(self) -> int:
+        """Number of values in the window (without missing values)"""
+        return self._count
+
+    def push(self, value : Union[float, None]) -> None:
+        seq=self._seq
+        self._seq=seq+1
+        pos=seq % self._capacity
+        if seq >= self._capacity:
+            self._remove(seq-self._capacity, self._values[pos])
+        if value is None or value != value:
+            self._values[pos]=_NO_VALUE
+        else:
+            self._values[pos]=value
+            self._add(seq, pos, value)
+        if self._seq % self._capacity == 0:
+            # the running sum accumulates rounding errors of the removed values
+            self._sum=math.fsum(value for value in self._values if value == value)
+
+    def mean(self) -> Optional[float]:
+        return self._sum/self._count if self._count else None
+
+    def median(self) -> Optional[float]:
+        if not self._count:
+            return None
+        if self._low_size > self._high_size:
+            return -self._low[0][0]
+        return (-self._low[0][0]+self._high[0][0])/2
+
+    def min(self) -> Optional[float]:
+        return self._min[0][1] if self._min else None
+
+    def max(self) -> Optional[float]:
+        return self._max[0][1] if self._max else None
+
+    def values(self) -> List[Optional[float]]:
+        """The values of the window from the oldest to the latest"""
+        start=self._seq-len(self)
+        return [self._from_storage(self._values[seq % self._capacity]) for seq in range(start, self._seq)]
+
+    @staticmethod
+    def _from_storage(value : float) -> Optional[float]:
+        return None if value != value else value
+
+    def _add(self, seq : int, pos : int, value : float) -> None:
+        self._count+=1
+        self._sum+=value
+        while self._min and self._min[-1][1] >= value:
+            self._min.pop()
+        self._min.append((seq, value))
+        while self._max and self._max[-1][1] <= value:
+            self._max.pop()
+        self._max.append((seq, value))
+        if not self._low_size or value <= -self._low[0][0]:
+            heapq.heappush(self._low, (-value, seq))
+            self._sides[pos]=_LOW
+            self._low_size+=1
+        else:
+            heapq.heappush(self._high, (value, seq))
+            self._sides[pos]=_HIGH
+            self._high_size+=1
+        self._rebalance()
+
+    def _remove(self, seq : int, value : float) -> None:
+        if value != value:
+            return
+        self._count-=1
+        self._sum-=value
+        if self._min[0][0] == seq:
+            self._min.popleft()
+        if self._max[0][0] == seq:
+            self._max.popleft()
+        if self._sides[seq % self._capacity] == _LOW:
+            self._low_size-=1
+        else:
+            self._high_size-=1
+        self._rebalance()
+
+    def _rebalance(self) -> None:
+        # the lower half has as many values as the upper half or one more. The tops of both heaps are in the window.
+        oldest=self._seq-self._capacity
+        low, high=self._low, self._high
+        while True:
+            while low and low[0][1] < oldest:
+                heapq.heappop(low)
+            while high and high[0][1] < oldest:
+                heapq.heappop(high)
+            if self._low_size > self._high_size+1:
+                negated_value, seq=heapq.heappop(low)
+                heapq.heappush(high, (-negated_value, seq))
+                self._sides[seq % self._capacity]=_HIGH
+                self._low_size-=1
+                self._high_size+=1
+            elif self._high_size > self._low_size:
+                value, seq=heapq.heappop(high)
+                heapq.heappush(low, (-value, seq))
+                self._sides[seq % self._capacity]=_LOW
+                self._high_size-=1
+                self._low_size+=1
+            else:
+                break
+        if len(low)+len(high) > 2*self._capacity:
+            # outdated values below the tops are removed only here (amortized O(1) per push)
+            self._low=[entry for entry in low if entry[1] >= oldest]
+            self._high=[entry for entry in high if entry[1] >= oldest]
+            heapq.heapify(self._low)
+            heapq.heapify(self._high)
+
+class SmartMeterRollingWindow():
+    """The latest capacity reads of SmartMeterValues with incremental statistics per channel (see RollingWindow)
+
+    Parameters
+    ----------
+    capacity : int
+        Number of reads in the window
+    oh_item_names : SmartMeterOhItemNames, optional
+        Item names of the returned SmartMeterValues (default: the items specified by the environment variables)
+    """
+    def __init__(self, capacity : int, oh_item_names : Optional[SmartMeterOhItemNames] = None) -> None:
+        self._oh_item_names=oh_item_names
+        self.channels=[RollingWindow(capacity) for _ in range(_CHANNEL_COUNT)]
+
+    def __len__(self) -> int:
+        return len(self.channels[0])
+
+    def push(self, values : SmartMeterValues) -> None:
+        for channel, value in zip(self.channels, values._values):
+            channel.push(value)
+
+    def mean(self) -> SmartMeterValues:
+        return self._create([channel.mean() for channel in self.channels])
+
+    def median(self) -> SmartMeterValues:
+        return self._create([channel.median() for channel in self.channels])
+
+    def min(self) -> SmartMeterValues:
+        return self._create([channel.min() for channel in self.channels])
+
+    def max(self) -> SmartMeterValues:
+        return self._create([channel.max() for channel in self.channels])
+
+    def aggregate(self, aggregate : AggregateType = 'mean') -> SmartMeterValues:
+        """Mean or median of the window. The other aggregates need all values of the window (see SmartMeterBatch)."""
+        if aggregate == 'mean':
+            return self.mean()
+        if aggregate == 'median':
+            return self.median()
+        raise ValueError(f"Unable to aggregate rolling window: {aggregate} is not supported (use SmartMeterBatch)")
+
+    def _create(self, channel_values : List[Optional[float]]) -> SmartMeterValues:
+        return SmartMeterValues(channel_values[0], channel_values[1], channel_values[2], channel_values[3], channel_values[4], self._oh_item_names)
@@ -0,0 +1,120 @@
+from typing import Optional, Protocol
+
+# SML transport protocol version 1:
+# A frame starts with the escape sequence followed by 01010101 and ends with the escape sequence followed by 1a,
+# the number of padding bytes and the CRC16 (2 bytes). Escape sequences within the data are escaped by a second escape sequence.
+SML_ESCAPE=b'\x1b\x1b\x1b\x1b'
+SML_START=SML_ESCAPE+b'\x01\x01\x01\x01'
+SML_END_MARKER=0x1a
+# escape sequence (4 bytes) + end marker + padding count + CRC16
+SML_END_SIZE=8
+
+class ByteSource(Protocol):
+    @property
+    def in_waiting(self) -> int: ...
+    def read(self, size : int = 1) -> bytes: ...
+
+class SmlFrameAssembler():
+    """Assembles SML frames from a raw byte stream.
+
+    Incoming bytes are appended to a reusable buffer. Only bytes that have not been scanned yet are searched
+    for escape sequences, so the cost per frame is linear in the frame size.
+    Complete frames (including start and end sequence) are handed out as memoryview into the buffer.
+    A returned frame is only valid until the next call of feed, read_from, next_frame or reset.
+    """
+    def __init__(self, max_frame_size : int = 8192) -> None:
+        self._buffer=bytearray()
+        self._synchronized=False
+        self._scan_pos=0
+        self._consumed=0
+        self._frame : Optional[memoryview]=None
+        self._max_frame_size=max_frame_size
+        self.dropped_bytes=0
+
+    def reset(self) -> None:
+        self._release_frame()
+        self.dropped_bytes+=len(self._buffer)
+        self._buffer.clear()
+        self._synchronized=False
+        self._scan_pos=0
+
+    def feed(self, data : bytes) -> None:
+        self._release_frame()
+        self._buffer+=data
+
+    def read_from(self, source : ByteSource) -> int:
+        """Read all bytes the source offers right now (at least one byte, which may block)"""
+        data=source.read(source.in_waiting or 1)
+        self.feed(data)
+        return len(data)
+
+    def next_frame(self) -> Optional[memoryview]:
+        self._release_frame()
+        buffer=self._buffer
+        while True:
+            if not self._synchronized:
+                pos=buffer.find(SML_START, self._scan_pos)
+                if pos == -1:
+                    # keep the bytes that could be the beginning of a start sequence only
+                    self._drop(max(len(buffer)-len(SML_START)+1, 0))
+                    self._scan_pos=0
+                    return None
+                self._drop(pos)
+                self._synchronized=True
+                self._scan_pos=len(SML_START)
+
+            # NOTE: Escape sequences should be aligned to blocks of 4 bytes within a frame. This is not checked on purpose:
+            # Frames corrupted by lost or inserted bytes are handed out anyway (rejected later by the CRC check)
+            # instead of swallowing the following frame as well.
+            pos=buffer.find(SML_ESCAPE, self._scan_pos)
+            if pos == -1:
+                if len(buffer) > self._max_frame_size:
+                    self._resynchronize(len(SML_START))
+                    continue
+                self._scan_pos=max(len(SML_START), len(buffer)-len(SML_ESCAPE)+1)
+                return None
+            if len(buffer) < pos+SML_END_SIZE:
+                # the escape sequence is not complete yet
+                self._scan_pos=pos
+                return None
+
+            if buffer[pos+4] == SML_END_MARKER:
+                if pos+SML_END_SIZE > self._max_frame_size:
+                    self._resynchronize(pos+SML_END_SIZE)
+                    continue
+                self._synchronized=False
+                self._scan_pos=0
+                self._consumed=pos+SML_END_SIZE
+                self._frame=memoryview(buffer)[:self._consumed]
+                return self._frame
+            if buffer.startswith(SML_ESCAPE, pos+4):
+                # escaped data
+                self._scan_pos=pos+8
+            elif buffer.startswith(SML_START, pos):
+                # start of a new frame before the end of the current one
+                self._resynchronize(pos)
+            else:
+                # unknown escape sequence
+                self._resynchronize(pos+4)
+
+    def _resynchronize(self, drop_count : int) -> None:
+        self._drop(drop_count)
+        self._synchronized=False
+        self._scan_pos=0
+
+    def _drop(self, count : int) -> None:
+        if count > 0:
+            del self._buffer[:count]
+            self.dropped_bytes+=count
+
+    def _release_frame(self) -> None:
+        if self._frame is None:
+            return
+        self._frame.release()
+        self._frame=None
+        try:
+            del self._buffer[:self._consumed]
+        except BufferError:
+            # the caller still holds views into the buffer. Leave the old buffer to the caller and continue with a copy.
+            self._buffer=bytearray(self._buffer[self._consumed:])
+        self._consumed=0
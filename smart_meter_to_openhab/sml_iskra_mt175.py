@@ -1,116 +1,212 @@
-import serial
-import os
 import logging
 from datetime import timedelta, datetime
 from logging import Logger
-from typing import List, Optional
+from typing import List, Optional, Tuple, Union, Iterator, Callable
 from pathlib import Path
-from time import sleep
+from time import sleep, monotonic, perf_counter
 from abc import ABC, abstractmethod
-from .interfaces import SmartMeterValues
+from .interfaces import SmartMeterValues, SmartMeterOhItemNames
+from .aggregation import SlidingWindowAggregator
+from .batch import SmartMeterBatch, AggregateType
+from .sml_frame import SmlFrameAssembler
+from .transport import Transport, SerialTransport
+from .raw_archive import RawFrameArchive
+from .timeseries import TimeSeriesArchive
+from .outlier_filter import StreamingOutlierFilter, OutlierFilterSettings
+from .sml_parser import read_list_entries, SmlParseError, SML_UNIT_WATT_HOUR
+from . import metrics, profiling
 
 class SmartMeterReader(ABC):
-    _prev_avg_values : SmartMeterValues = SmartMeterValues()
-
-    def __init__(self, logger : Logger, raw_data_dump_dir : Optional[Path] = None) -> None:
+    def __init__(self, logger : Logger, raw_data_dump_dir : Optional[Path] = None, 
+                 oh_item_names : Optional[SmartMeterOhItemNames] = None, timeseries_dir : Optional[Path] = None,
+                 outlier_filter_settings : Optional[OutlierFilterSettings] = None) -> None:
+        """oh_item_names are the items of this smart meter (default: the items specified by the environment variables).
+        All good reads are archived in timeseries_dir (see TimeSeriesArchive). Outliers are removed from the reads per channel
+        (see StreamingOutlierFilter)."""
         self._logger=logger
-        self._latest_raw_data=''
-        self._raw_data_dump_dir=raw_data_dump_dir
-        self._raw_data_dump_invalid_counter=0
-        self._raw_data_dump_inconsistent_counter=0
-        self._raw_data_dump_valid_counter=0
-        if self._raw_data_dump_dir:
-            os.makedirs(self._raw_data_dump_dir, exist_ok=True)
-            self._logger.info(f"Using directory {self._raw_data_dump_dir} for raw data dumps.")
-
-    def read_avg(self, read_count : int) -> SmartMeterValues:
+        self._oh_item_names=oh_item_names
+        # NOTE: the state is kept per reader (smart meter)
+        self._prev_avg_values=SmartMeterValues(user_specified_oh_item_names=oh_item_names)
+        self._latest_raw_data=b''
+        # raw data is archived in the background (see RawFrameArchive)
+        self._raw_frame_archive=RawFrameArchive(raw_data_dump_dir, logger) if raw_data_dump_dir else None
+        if raw_data_dump_dir:
+            self._logger.info(f"Using directory {raw_data_dump_dir} for raw data dumps.")
+        self._timeseries=TimeSeriesArchive(timeseries_dir, logger) if timeseries_dir else None
+        self._outlier_filter=StreamingOutlierFilter(outlier_filter_settings or OutlierFilterSettings())
+
+    def read_avg(self, read_count : int, aggregate : AggregateType = 'mean', 
+                 stop_early : Optional[Callable[[SmartMeterValues], int]] = None) -> SmartMeterValues:
         """Read average data from the smart meter
 
         Parameters
         ----------
         read_count : int
             specifies the number of performed reads that are averaged. Between each read is a sleep of 1 sec
+        aggregate : str
+            Aggregation of the reads, see SmartMeterBatch. The median is used as long as there are no valid previous values.
+        stop_early : Callable[[SmartMeterValues], int], optional
+            Called with each good read. If it returns n > 0, no further reads are done and only the latest n good reads are aggregated
+            (e.g. the reads since the load changed, see AdaptiveScheduler.observe).
             
         Returns
         -------
         SmartMeterValues
             Contains the data read from the smart meter
         """
-        all_values : List[SmartMeterValues] = []
-        for i in range(read_count):
-            all_values.append(self._read_raw())
-            sleep(1)
-
         good_values : List[SmartMeterValues] = []
-        for values in all_values:
-            if values.is_invalid():
-                self._logger.warning(f"Detected invalid values during read. Ignoring following values: {values}")
-                if self._raw_data_dump_dir:
-                    with open(self._raw_data_dump_dir / f"raw_data_dump_invalid_{self._raw_data_dump_invalid_counter}.sml", 'w') as f:
-                        f.write(self._latest_raw_data)
-                    self._raw_data_dump_invalid_counter+=1
-            elif values.is_inconsistent(SmartMeterReader._prev_avg_values):
-                self._logger.warning(f"Detected inconsistent values during read. Ignoring following values: {values}")
-                if self._raw_data_dump_dir:
-                    with open(self._raw_data_dump_dir / f"raw_data_dump_inconsistent_{self._raw_data_dump_inconsistent_counter}.sml", 'w') as f:
-                        f.write(self._latest_raw_data)
-                    self._raw_data_dump_inconsistent_counter+=1
-            else:
-                if self._raw_data_dump_dir and self._logger.level == logging.DEBUG:
-                    with open(self._raw_data_dump_dir / f"raw_data_dump_valid_{self._raw_data_dump_valid_counter}.sml", 'w') as f:
-                        f.write(self._latest_raw_data)
-                    self._raw_data_dump_valid_counter+=1
+        for i in range(read_count):
+            values=self._read_raw()
+            if self._is_good(values, monotonic()):
                 good_values.append(values)
+                stop_reads=stop_early(values) if stop_early is not None else 0
+                if stop_reads:
+                    # the previous reads describe the load before the change
+                    good_values=good_values[-stop_reads:]
+                    self._logger.info(f"Stopped after {i+1} of {read_count} reads. Aggregating the latest {len(good_values)} reads.")
+                    break
+            with profiling.stage('sleep'):
+                sleep(1)
+        else:
+            if len(good_values) < read_count:
+                self._logger.warning(f"Expected {read_count} valid values but only received {len(good_values)}. Returning average value anyway.")
 
-        if len(good_values) < read_count:
-            self._logger.warning(f"Expected {read_count} valid values but only received {len(good_values)}. Returning average value anyway.")
-
-        if SmartMeterReader._prev_avg_values.is_invalid():
-            # Creating initial previous values. Implication: Consistency check (above) always returns True. 
+        if self._prev_avg_values.is_invalid():
+            # Creating initial previous values. Implication: The outlier filter (above) has seen too few reads to filter the power values. 
             # In this case it is best to return the median. This should most likely ignore possible inconsistent outlier in the first run (call of this method).
-            avg_value=SmartMeterValues.create_median(good_values)
+            avg_value=SmartMeterBatch(good_values, self._oh_item_names).median()
         else:
-            # When having a valid previous value, it is better to return the mean value since the inconsistent outliers have been removed already.
-            avg_value=SmartMeterValues.create_mean(good_values)
-        SmartMeterReader._prev_avg_values=avg_value
+            # When having a valid previous value, it is better to return the mean value since the outliers have been removed already.
+            avg_value=SmartMeterBatch(good_values, self._oh_item_names).aggregate(aggregate)
+        self._prev_avg_values=avg_value
+        return avg_value
+
+    def read_stream(self, window_sec : float, emit_interval_sec : Optional[float] = None, emit_frame_count : Optional[int] = None,
+                    aggregate : AggregateType = 'mean') -> Iterator[SmartMeterValues]:
+        """Continuously read all data the smart meter sends and yield aggregated values of a sliding window
+
+        Parameters
+        ----------
+        window_sec : float
+            Time period of the sliding window. All valid reads within this period are aggregated.
+        emit_interval_sec : float, optional
+            Yield the aggregated values every emit_interval_sec (default: window_sec if emit_frame_count is not specified as well)
+        emit_frame_count : int, optional
+            Yield the aggregated values every emit_frame_count reads
+        aggregate : str
+            Aggregation of the window, see SmartMeterBatch. Like read_avg, the median is used as long as there are no valid previous values.
+            
+        Returns
+        -------
+        Iterator[SmartMeterValues]
+            Contains the aggregated data read from the smart meter. Invalid (all values None) if the window does not contain valid reads.
+        """
+        aggregator=self.create_aggregator(window_sec, emit_interval_sec, emit_frame_count)
+        while True:
+            avg_value=self.add_to_window(aggregator, self._read_raw(), monotonic(), aggregate)
+            if avg_value is not None:
+                yield avg_value
+
+    def create_aggregator(self, window_sec : float, emit_interval_sec : Optional[float] = None, 
+                          emit_frame_count : Optional[int] = None) -> SlidingWindowAggregator:
+        return SlidingWindowAggregator(window_sec, emit_interval_sec, emit_frame_count, self._oh_item_names)
+
+    def add_to_window(self, aggregator : SlidingWindowAggregator, values : Optional[SmartMeterValues], timestamp : float, 
+                      aggregate : AggregateType = 'mean', raw_frame : Optional[bytes] = None) -> Optional[SmartMeterValues]:
+        """Add the read values to the sliding window (if they are good). Returns the aggregated values if they are due.
+        Pass None as values to check the emit cadence only. raw_frame is the frame of the values (default: the latest read frame)."""
+        if values is not None and self._is_good(values, timestamp, raw_frame):
+            aggregator.add(timestamp, values)
+        if not aggregator.emit_due(timestamp):
+            return None
+        avg_value=aggregator.emit(timestamp, 'median' if self._prev_avg_values.is_invalid() else aggregate)
+        if avg_value.is_valid():
+            self._prev_avg_values=avg_value
         return avg_value
 
+    def _is_good(self, values : SmartMeterValues, timestamp : float, raw_frame : Optional[bytes] = None) -> bool:
+        """Removes the outliers from the values. Returns False if no values are left.
+        raw_frame is the frame of the values that is dumped (default: the latest read frame)."""
+        if values.is_invalid():
+            self._logger.warning(f"Detected invalid values during read. Ignoring following values: {values}")
+            self._dump_raw_data('invalid', raw_frame)
+            metrics.FRAMES_REJECTED.inc('invalid')
+            return False
+        outliers=self._outlier_filter.filter(values, timestamp)
+        if outliers:
+            for channel in outliers:
+                metrics.VALUES_REJECTED.inc(channel)
+            self._dump_raw_data('inconsistent', raw_frame)
+            if values.is_invalid():
+                self._logger.warning(f"Detected inconsistent values during read. Ignoring following values: {outliers}")
+                metrics.FRAMES_REJECTED.inc('inconsistent')
+                return False
+            self._logger.info(f"Detected outliers during read. Ignoring following values: {outliers}")
+        metrics.LAST_READ_SUCCESS.set_to_current_time()
+        if self._timeseries:
+            self._timeseries.append(values)
+        if self._logger.level == logging.DEBUG:
+            self._dump_raw_data('valid', raw_frame)
+        return True
+
+    def close(self) -> None:
+        if self._raw_frame_archive:
+            self._raw_frame_archive.close()
+        if self._timeseries:
+            self._timeseries.close()
+
+    def _dump_raw_data(self, classification : str, raw_frame : Optional[bytes] = None) -> None:
+        if self._raw_frame_archive:
+            self._raw_frame_archive.append(classification, self._latest_raw_data if raw_frame is None else raw_frame)
+
     @abstractmethod
     def _read_raw(self) -> SmartMeterValues:
         pass
 
-# supporting OBIS code 1.8.0 only
-def _decode_sml_iskra_mt175_one_way(raw_data : str) -> SmartMeterValues:
-    def _convert_to_float(pos_begin : int, pos_end : int) -> Optional[float]:
-        try:
-            hex_number=raw_data[pos_begin:pos_end]
-            if hex_number.startswith('ff'):
-                # in case of negative energy the value is unspecified. returning 0 comes as close as possible to the real unknown value.
-                return 0
-            return int(hex_number, 16)
-        except Exception as e:
-            return None
-        
-    smart_meter_values=SmartMeterValues()
-
-    pos = raw_data.find('070100010800ff') # looking for OBIS Code: 1-0:1.8.0*255 - Energy kWh
-    smart_meter_values.electricity_meter.value = _convert_to_float(pos+36, pos+52) if pos != -1 else None
-    if smart_meter_values.electricity_meter.value is not None:
-        smart_meter_values.electricity_meter.value /= 1e4
+_OBIS_ELECTRICITY_METER=bytes.fromhex('0100010800ff') # 1-0:1.8.0*255 - Energy kWh
+_OBIS_OVERALL_CONSUMPTION=bytes.fromhex('0100100700ff') # 1-0:16.7.0*255 - Sum Power L1,L2,L3
+_OBIS_PHASE_1_CONSUMPTION=bytes.fromhex('0100240700ff') # 1-0:36.7.0*255 - current Power L1
+_OBIS_PHASE_2_CONSUMPTION=bytes.fromhex('0100380700ff') # 1-0:56.7.0*255 - current Power L2
+_OBIS_PHASE_3_CONSUMPTION=bytes.fromhex('01004c0700ff') # 1-0:76.7.0*255 - current Power L3
+_OBIS_CODES=frozenset((_OBIS_ELECTRICITY_METER, _OBIS_OVERALL_CONSUMPTION, _OBIS_PHASE_1_CONSUMPTION, _OBIS_PHASE_2_CONSUMPTION, _OBIS_PHASE_3_CONSUMPTION))
 
-    pos = raw_data.find('070100100700ff') # looking for OBIS Code: 1-0:16.7.0*255 - Sum Power L1,L2,L3
-    smart_meter_values.overall_consumption.value = _convert_to_float(pos+28, pos+36) if pos != -1 else None
+# supporting OBIS code 1.8.0 only
+def _decode_sml_iskra_mt175_one_way(frame : Union[bytes, memoryview], oh_item_names : Optional[SmartMeterOhItemNames] = None) -> SmartMeterValues:
+    """Decode a complete SML frame of the smart meter
 
-    pos = raw_data.find('070100240700ff') # looking for OBIS Code: 1-0:36.7.0*255 - current Power L1
-    smart_meter_values.phase_1_consumption.value = _convert_to_float(pos+28, pos+36) if pos != -1 else None
+    Raises
+    ------
+    SmlParseError
+        If the frame is corrupt (e.g. CRC mismatch)
+    """
+    entries=read_list_entries(frame, _OBIS_CODES)
 
-    pos = raw_data.find('070100380700ff') # looking for OBIS Code: 1-0:56.7.0*255 - current Power L2
-    smart_meter_values.phase_2_consumption.value = _convert_to_float(pos+28, pos+36) if pos != -1 else None
+    def _value(obis_code : bytes) -> Optional[float]:
+        entry=entries.get(obis_code)
+        if entry is None:
+            return None
+        # energy is provided in Wh. The openHAB item expects kWh.
+        value=entry.scaled_value(-3 if entry.unit == SML_UNIT_WATT_HOUR else 0)
+        if value is not None and value < 0:
+            # in case of negative energy the value is unspecified. returning 0 comes as close as possible to the real unknown value.
+            return 0
+        return value
 
-    pos = raw_data.find('0701004c0700ff') # looking for OBIS Code: 1-0:76.7.0*255 - current Power L3
-    smart_meter_values.phase_3_consumption.value = _convert_to_float(pos+28, pos+36) if pos != -1 else None
+    return SmartMeterValues(_value(_OBIS_PHASE_1_CONSUMPTION), _value(_OBIS_PHASE_2_CONSUMPTION), _value(_OBIS_PHASE_3_CONSUMPTION),
+                            _value(_OBIS_OVERALL_CONSUMPTION), _value(_OBIS_ELECTRICITY_METER), oh_item_names)
 
-    return smart_meter_values
+def _decode_frame(frame : Union[bytes, memoryview], oh_item_names : Optional[SmartMeterOhItemNames]) -> SmartMeterValues:
+    """_decode_sml_iskra_mt175_one_way with metrics"""
+    metrics.FRAMES_RECEIVED.inc()
+    start=perf_counter()
+    try:
+        with profiling.stage('decode'):
+            return _decode_sml_iskra_mt175_one_way(frame, oh_item_names)
+    except SmlParseError:
+        metrics.FRAMES_REJECTED.inc('corrupt')
+        raise
+    finally:
+        metrics.FRAME_DECODE_SECONDS.observe(perf_counter()-start)
 
 # The smart meter supports consumption only. No electricity feed-in support! (German: Zweirichtungszähler)
 class SmlIskraMt175OneWay(SmartMeterReader):
@@ -118,10 +214,13 @@ class SmlIskraMt175OneWay(SmartMeterReader):
     #      NOTE: Take care that this is longer then the specified transmission time of your smart meter.
     _read_raw_time_out_in_sec : int = 5
 
-    def __init__(self, serial_port : str, logger : Logger, raw_data_dump_dir : Optional[Path] = None) -> None:
-        super().__init__(logger, raw_data_dump_dir)
-        self._port=serial.Serial(baudrate=9600, bytesize=serial.EIGHTBITS, parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE)
-        self._serial_port=serial_port
+    def __init__(self, transport : Union[str, Transport], logger : Logger, raw_data_dump_dir : Optional[Path] = None,
+                 oh_item_names : Optional[SmartMeterOhItemNames] = None, timeseries_dir : Optional[Path] = None,
+                 outlier_filter_settings : Optional[OutlierFilterSettings] = None) -> None:
+        """transport is the name of the serial port (e.g. /dev/ttyUSB0) or any other Transport (e.g. a replay of SML dumps)"""
+        super().__init__(logger, raw_data_dump_dir, oh_item_names, timeseries_dir, outlier_filter_settings)
+        self._transport=SerialTransport(transport) if isinstance(transport, str) else transport
+        self._frame_assembler=SmlFrameAssembler()
 
     def _read_raw(self) -> SmartMeterValues:
         """Read raw data from the smart meter via SML
@@ -137,35 +236,80 @@ class SmlIskraMt175OneWay(SmartMeterReader):
         SmartMeterValues
             Contains the data read from the smart meter
         """
-        self._latest_raw_data = ''
-        smart_meter_values=SmartMeterValues()
+        self._latest_raw_data = b''
+        smart_meter_values=SmartMeterValues(user_specified_oh_item_names=self._oh_item_names)
         try:
-            if not self._port.is_open:
-                self._port.port=self._serial_port
-                self._port.open()
+            if not self._transport.is_open:
+                self._transport.open()
             time_out : timedelta = timedelta(seconds=self._read_raw_time_out_in_sec)
             time_start=datetime.now()
+            read_start=perf_counter()
             while (datetime.now() - time_start) <= time_out:
-                input : bytes = self._port.read()
-                self._latest_raw_data += input.hex() # Convert Bytes to Hex String to use find function for easy parsing
-
-                pos = self._latest_raw_data.find('1b1b1b1b01010101') # find start of Frame
-
-                if (pos != -1):
-                    self._latest_raw_data = self._latest_raw_data[pos:] # cut trash before start delimiter
-
-                pos = self._latest_raw_data.find('1b1b1b1b1a')              # find end of Frame
-
-                if (pos != -1) and len(self._latest_raw_data) >= pos + 16:
-                    self._latest_raw_data = self._latest_raw_data[0:pos + 16]                # cut trash after end delimiter
-                    smart_meter_values=_decode_sml_iskra_mt175_one_way(self._latest_raw_data)
+                frame=self._frame_assembler.next_frame()
+                if frame is None:
+                    with profiling.stage('serial'):
+                        self._frame_assembler.read_from(self._transport)
+                    continue
+                self._latest_raw_data = bytes(frame)
+                try:
+                    smart_meter_values=_decode_frame(frame, self._oh_item_names)
+                    metrics.FRAME_READ_SECONDS.observe(perf_counter()-read_start)
                     break
+                except SmlParseError as e:
+                    # corrupt frames are dropped. Continue with the next frame (within the time out).
+                    self._logger.info(f"Ignoring corrupt SML frame: {e}")
+                    self._dump_raw_data('corrupt')
             
             if (datetime.now() - time_start) > time_out:
                 self._logger.warning(f"Exceeded time out of {time_out} while reading from smart meter.")
-        except serial.SerialException as e:
+                metrics.READ_ERRORS.inc('timeout')
+        except OSError as e:
+            # serial.SerialException and TransportError
             self._logger.info("Caught Exception in _read_raw: " + str(e))
+            metrics.READ_ERRORS.inc('transport')
             #self._port.close() # TODO: is this needed? 
+            self._frame_assembler.reset()
             smart_meter_values.reset()
         
-        return smart_meter_values
\ No newline at end of file
+        return smart_meter_values
+
+    @property
+    def transport(self) -> Transport:
+        return self._transport
+
+    def close(self) -> None:
+        super().close()
+        self._transport.close()
+
+    def read_available(self) -> List[Tuple[SmartMeterValues, bytes]]:
+        """Read the data that has already been received (without waiting) and decode all complete frames
+
+        Returns
+        -------
+        List[Tuple[SmartMeterValues, bytes]]
+            The values and the raw frame of all complete frames (corrupt frames are dropped). Invalid values (and an empty frame) if reading failed.
+            Pass the frame to add_to_window, so the frame of the values is dumped (see raw_data_dump_dir).
+        """
+        values : List[Tuple[SmartMeterValues, bytes]] = []
+        try:
+            if not self._transport.is_open:
+                self._transport.open()
+            # NOTE: read once only. A fast source (e.g. a replay) would otherwise never stop to provide data.
+            if self._transport.in_waiting:
+                with profiling.stage('serial'):
+                    self._frame_assembler.read_from(self._transport)
+        except OSError as e:
+            self._logger.info("Caught Exception in read_available: " + str(e))
+            metrics.READ_ERRORS.inc('transport')
+            self._frame_assembler.reset()
+            return [(SmartMeterValues(user_specified_oh_item_names=self._oh_item_names), b'')]
+        frame=self._frame_assembler.next_frame()
+        while frame is not None:
+            self._latest_raw_data = bytes(frame)
+            try:
+                values.append((_decode_frame(frame, self._oh_item_names), self._latest_raw_data))
+            except SmlParseError as e:
+                self._logger.info(f"Ignoring corrupt SML frame: {e}")
+                self._dump_raw_data('corrupt')
+            frame=self._frame_assembler.next_frame()
+        return values
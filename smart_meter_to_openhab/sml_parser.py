@@ -0,0 +1,225 @@
+import binascii
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union, Any, Collection
+from .sml_frame import SML_ESCAPE, SML_START, SML_END_MARKER, SML_END_SIZE
+
+SML_UNIT_WATT=27
+SML_UNIT_WATT_HOUR=30
+
+class SmlParseError(ValueError):
+    pass
+
+# CRC-16/X-25 is the bit reflected variant of CRC-16/CCITT. binascii.crc_hqx calculates the non reflected variant (in C).
+# Reflecting the input bytes and the result gives the X-25 checksum without looping over the bytes in python.
+_REFLECTED_BYTES=bytes(int(f"{byte:08b}"[::-1], 2) for byte in range(256))
+
+def crc16_x25(data : Union[bytes, bytearray, memoryview]) -> int:
+    """CRC16 as used by SML (CRC-16/X-25)"""
+    crc=binascii.crc_hqx(bytes(data).translate(_REFLECTED_BYTES), 0xffff)
+    return ((_REFLECTED_BYTES[crc & 0xff] << 8) | _REFLECTED_BYTES[crc >> 8]) ^ 0xffff
+
+# NOTE: A NamedTuple is created faster than a (frozen) dataclass. An entry is created for each decoded value.
+class SmlListEntry(NamedTuple):
+    obj_name : bytes
+    unit : Optional[int]
+    scaler : Optional[int]
+    value : Any
+
+    def scaled_value(self, exponent_offset : int = 0) -> Optional[float]:
+        """Value with the scaler applied. Use exponent_offset for unit conversions (e.g. -3 for Wh to kWh)."""
+        if not isinstance(self.value, int) or isinstance(self.value, bool):
+            return None
+        exponent=(self.scaler or 0)+exponent_offset
+        if exponent == 0:
+            return self.value
+        # NOTE: Use an integer divisor for negative exponents. This gives the correctly rounded result (e.g. 189990194/10**4).
+        return self.value / 10**-exponent if exponent < 0 else self.value * 10**exponent
+
+def _read_element(data : bytes, pos : int) -> Tuple[Any, int]:
+    tl=data[pos]
+    element_type=tl & 0x70
+    length=tl & 0x0f
+    header_size=1
+    while tl & 0x80:
+        tl=data[pos+header_size]
+        length=(length << 4) | (tl & 0x0f)
+        header_size+=1
+
+    if element_type == 0x70:
+        # the length of a list is its number of elements
+        pos+=header_size
+        elements : List[Any] = []
+        for _ in range(length):
+            element, pos=_read_element(data, pos)
+            elements.append(element)
+        return elements, pos
+
+    # the length of all other types includes the type-length field
+    end=pos+length
+    if length < header_size or end > len(data):
+        raise SmlParseError(f"Invalid length {length} of element at position {pos}")
+    if element_type == 0x00:
+        # an empty octet string marks an optional element that is not set
+        return data[pos+header_size:end] if length > header_size else None, end
+    if length == header_size:
+        raise SmlParseError(f"Missing content of element at position {pos}")
+    if element_type == 0x60:
+        return _int_from_bytes(data[pos+header_size:end], 'big'), end
+    if element_type == 0x50:
+        return _int_from_bytes(data[pos+header_size:end], 'big', signed=True), end
+    if element_type == 0x40:
+        return data[pos+header_size] != 0, end
+    raise SmlParseError(f"Unknown type {element_type:#x} of element at position {pos}")
+_int_from_bytes=int.from_bytes
+
+def frame_payload(frame : Union[bytes, bytearray, memoryview]) -> bytes:
+    """Verify the frame (start and end sequence, CRC16) and return the SML messages it contains.
+
+    Raises
+    ------
+    SmlParseError
+        If the frame is corrupt
+    """
+    # slices of bytes are compared and checked faster than slices of a memoryview
+    frame=frame if isinstance(frame, bytes) else bytes(frame)
+    if len(frame) < len(SML_START)+SML_END_SIZE or not frame.startswith(SML_START):
+        raise SmlParseError("Missing start sequence")
+    end_pos=len(frame)-SML_END_SIZE
+    if frame[end_pos:end_pos+4] != SML_ESCAPE or frame[end_pos+4] != SML_END_MARKER:
+        raise SmlParseError("Missing end sequence")
+    expected_crc=frame[-2] | (frame[-1] << 8)
+    crc=crc16_x25(frame[:-2])
+    if crc != expected_crc:
+        raise SmlParseError(f"CRC mismatch. Expected {expected_crc:#06x} but calculated {crc:#06x}")
+    padding=frame[end_pos+5]
+    if padding > 3:
+        raise SmlParseError(f"Invalid padding count {padding}")
+    payload=frame[len(SML_START):end_pos-padding]
+    if SML_ESCAPE+SML_ESCAPE in payload:
+        return payload.replace(SML_ESCAPE+SML_ESCAPE, SML_ESCAPE)
+    return payload
+
+SML_GET_LIST_RESPONSE=0x0701
+# type-length fields of the lists of the SML structure
+_TL_MESSAGE=0x76
+_TL_MESSAGE_BODY=0x72
+_TL_GET_LIST_RESPONSE=0x77
+_TL_LIST_ENTRY=0x77
+# objName of 6 bytes (OBIS code)
+_TL_OBJ_NAME=0x07
+_END_OF_MESSAGE=0x00
+
+# size of the type-length field incl. the content and the number of list elements by type-length field.
+# Size 0: type-length field of several bytes (decoded by _read_element) or invalid length.
+_ELEMENT_SIZES=bytes((tl & 0x0f if tl < 0x70 else 1) if not tl & 0x80 else 0 for tl in range(256))
+_LIST_ELEMENTS=bytes(tl & 0x0f if 0x70 <= tl < 0x80 else 0 for tl in range(256))
+
+def _skip_elements(data : bytes, pos : int, count : int = 1) -> int:
+    """Returns the position behind the count elements at pos. The elements (incl. the elements of lists) are not decoded."""
+    # NOTE: lists are not skipped recursively, their elements are added to the count of elements to skip
+    while count:
+        tl=data[pos]
+        size=_ELEMENT_SIZES[tl]
+        if not size:
+            if not tl & 0x80:
+                raise SmlParseError(f"Invalid length 0 of element at position {pos}")
+            # type-length field of several bytes (rare)
+            pos=_read_element(data, pos)[1]
+            count-=1
+            continue
+        count+=_LIST_ELEMENTS[tl]-1
+        pos+=size
+    return pos
+
+def _read_list_length(data : bytes, pos : int) -> Tuple[int, int]:
+    """Returns the number of elements of the list at pos and the position of its first element"""
+    tl=data[pos]
+    if tl & 0x70 != 0x70:
+        raise SmlParseError(f"Expected a list at position {pos}")
+    length=tl & 0x0f
+    pos+=1
+    while tl & 0x80:
+        tl=data[pos]
+        length=(length << 4) | (tl & 0x0f)
+        pos+=1
+    return length, pos
+
+def _read_list_entry(data : bytes, pos : int, obj_name : bytes) -> Tuple[SmlListEntry, int]:
+    # SML_ListEntry: objName, status, valTime, unit, scaler, value, valueSignature (pos is behind objName)
+    pos=_skip_elements(data, pos, 2)
+    # fast path for the usual unit (unsigned8) and scaler (integer8)
+    if data[pos] == 0x62:
+        unit : Any=data[pos+1]
+        pos+=2
+    else:
+        unit, pos=_read_element(data, pos)
+    if data[pos] == 0x52:
+        scaler : Any=data[pos+1]-256 if data[pos+1] > 0x7f else data[pos+1]
+        pos+=2
+    else:
+        scaler, pos=_read_element(data, pos)
+    value, pos=_read_element(data, pos)
+    pos=_skip_elements(data, pos)
+    if not (unit is None or isinstance(unit, int)) or not (scaler is None or isinstance(scaler, int)):
+        raise SmlParseError(f"Unexpected unit or scaler of list entry {obj_name.hex()}")
+    return SmlListEntry(obj_name, unit, scaler, value), pos
+
+def _read_get_list_response(data : bytes, pos : int, obj_names : Collection[bytes], entries : Dict[bytes, SmlListEntry]) -> int:
+    # SML_GetList.Res: clientId, serverId, listName, actSensorTime, valList, listSignature, actGatewayTime
+    if data[pos] != _TL_GET_LIST_RESPONSE:
+        raise SmlParseError(f"Unexpected GetListResponse at position {pos}")
+    pos=_skip_elements(data, pos+1, 4)
+    entry_count, pos=_read_list_length(data, pos)
+    for _ in range(entry_count):
+        if data[pos] != _TL_LIST_ENTRY or data[pos+1] != _TL_OBJ_NAME:
+            raise SmlParseError(f"Unexpected list entry at position {pos}")
+        obj_name=data[pos+2:pos+8]
+        pos+=8
+        if obj_name in obj_names:
+            entries[obj_name], pos=_read_list_entry(data, pos, obj_name)
+        else:
+            # status, valTime, unit, scaler, value, valueSignature
+            pos=_skip_elements(data, pos, 6)
+    return _skip_elements(data, pos, 2)
+
+def read_list_entries(frame : Union[bytes, bytearray, memoryview], obj_names : Collection[bytes]) -> Dict[bytes, SmlListEntry]:
+    """Read the list entries of the given object names (OBIS codes) from a complete SML frame
+
+    After verifying the frame, the SML messages are walked in a single pass: the list entries of the GetListResponse messages
+    are read, all other elements are skipped by their type-length field (without decoding them).
+    Only the unit, scaler and value of the requested entries are decoded.
+
+    Raises
+    ------
+    SmlParseError
+        If the frame is corrupt
+    """
+    payload=frame_payload(frame)
+    entries : Dict[bytes, SmlListEntry] = {}
+    pos=0
+    end=len(payload)
+    try:
+        while pos < end:
+            # SML_Message: transactionId, groupNo, abortOnError, messageBody, crc16, endOfSmlMsg
+            if payload[pos] != _TL_MESSAGE:
+                raise SmlParseError(f"Unexpected SML message at position {pos}")
+            pos=_skip_elements(payload, pos+1, 3)
+            # SML_MessageBody: tag, body
+            if payload[pos] != _TL_MESSAGE_BODY:
+                raise SmlParseError(f"Unexpected SML message body at position {pos}")
+            tag, pos=_read_element(payload, pos+1)
+            if tag == SML_GET_LIST_RESPONSE:
+                pos=_read_get_list_response(payload, pos, obj_names, entries)
+                if len(entries) == len(obj_names):
+                    # the CRC of the frame has been verified, the remaining messages are not needed
+                    return entries
+            else:
+                pos=_skip_elements(payload, pos)
+            pos=_skip_elements(payload, pos)
+            if payload[pos] != _END_OF_MESSAGE:
+                raise SmlParseError(f"Missing end of SML message at position {pos}")
+            pos+=1
+    except IndexError as e:
+        raise SmlParseError(f"Unexpected SML message structure: {e}") from e
+    if pos > end:
+        raise SmlParseError("Unexpected end of SML messages")
+    return entries
@@ -0,0 +1,302 @@
+import bisect
+import mmap
+import os
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from logging import Logger
+from pathlib import Path
+from time import time
+from typing import Dict, Iterator, List, Optional, Tuple
+from .interfaces import SmartMeterValues
+
+# columns of the archive (in the order of SmartMeterValues)
+FIELDS=('phase_1_consumption', 'phase_2_consumption', 'phase_3_consumption', 'overall_consumption', 'electricity_meter')
+TIME_COLUMN='time'
+_SECONDS_PER_DAY=86400
+# summaries: count, sum, min and max per field and slot (minute or hour of the day)
+_STATS=4
+_SLOT_SIZE=len(FIELDS)*_STATS
+_SUMMARY_SLOTS : Dict[str, Tuple[int, int]] = {'minute' : (60, 1440), 'hour' : (3600, 24)}
+
+@dataclass
+class Summary():
+    """Aggregate of the values of a field in a time range"""
+    count : int = 0
+    sum : float = 0
+    min : float = float('inf')
+    max : float = float('-inf')
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.sum/self.count if self.count else None
+
+    def add(self, value : float) -> None:
+        self.count+=1
+        self.sum+=value
+        self.min=min(self.min, value)
+        self.max=max(self.max, value)
+
+    def merge(self, count : float, sum : float, min : float, max : float) -> None:
+        if count:
+            self.count+=int(count)
+            self.sum+=sum
+            self.min=self.min if self.min < min else min
+            self.max=self.max if self.max > max else max
+
+class _MappedColumn():
+    """Memory-mapped array of doubles in a file, which grows in steps of grow_size values"""
+    def __init__(self, path : Path, size : int, writable : bool, grow_size : int = 0) -> None:
+        self._path=path
+        self._writable=writable
+        self._grow_size=grow_size
+        self._file=open(path, 'r+b' if writable else 'rb')
+        file_size=os.fstat(self._file.fileno()).st_size
+        if writable and file_size < size*8:
+            self._file.truncate(size*8)
+            file_size=size*8
+        self.size=file_size//8
+        self._mmap : Optional[mmap.mmap] = None
+        self.values=memoryview(b'').cast('d')
+        self._map()
+
+    def ensure_size(self, size : int) -> None:
+        if size <= self.size:
+            return
+        self._unmap()
+        new_size=max(size, self.size+self._grow_size)
+        self._file.truncate(new_size*8)
+        self.size=new_size
+        self._map()
+
+    def flush(self) -> None:
+        if self._mmap is not None and self._writable:
+            self._mmap.flush()
+
+    def close(self) -> None:
+        self.flush()
+        self._unmap()
+        self._file.close()
+
+    def _map(self) -> None:
+        if self.size:
+            self._mmap=mmap.mmap(self._file.fileno(), self.size*8, access=mmap.ACCESS_WRITE if self._writable else mmap.ACCESS_READ)
+            self.values=memoryview(self._mmap).cast('d')
+
+    def _unmap(self) -> None:
+        # the mmap can be closed only if there is no view
+        self.values.release()
+        self.values=memoryview(b'').cast('d')
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap=None
+
+def _create_file(path : Path) -> None:
+    if not path.exists():
+        open(path, 'xb').close()
+
+class _DaySegment():
+    """The records of a day (UTC): a column file per field and the time, the per-minute and per-hour summaries"""
+    def __init__(self, directory : Path, day : int, writable : bool, grow_size : int) -> None:
+        self.day=day
+        self.start=day*_SECONDS_PER_DAY
+        if writable:
+            os.makedirs(directory, exist_ok=True)
+            for name in (TIME_COLUMN,)+FIELDS+tuple(_SUMMARY_SLOTS):
+                _create_file(directory / f"{name}.f64")
+        self.time=_MappedColumn(directory / f"{TIME_COLUMN}.f64", grow_size, writable, grow_size)
+        self.fields=[_MappedColumn(directory / f"{name}.f64", grow_size, writable, grow_size) for name in FIELDS]
+        self.summaries={name : _MappedColumn(directory / f"{name}.f64", slots*_SLOT_SIZE, writable)
+                        for name, (_, slots) in _SUMMARY_SLOTS.items()}
+        self.count=self._find_count()
+
+    def append(self, timestamp : float, values : List[float]) -> None:
+        index=self.count
+        if index >= self.time.size:
+            self.time.ensure_size(index+1)
+            for column in self.fields:
+                column.ensure_size(index+1)
+        for column, value in zip(self.fields, values):
+            column.values[index]=value
+        # the time is written last: a record without time is not counted (e.g. after a power loss)
+        self.time.values[index]=timestamp
+        self.count+=1
+        offset=timestamp-self.start
+        for name, (slot_sec, _) in _SUMMARY_SLOTS.items():
+            summary=self.summaries[name].values
+            slot=int(offset//slot_sec)*_SLOT_SIZE
+            for field, value in enumerate(values):
+                if value != value:
+                    continue
+                pos=slot+field*_STATS
+                if summary[pos]:
+                    summary[pos+2]=min(summary[pos+2], value)
+                    summary[pos+3]=max(summary[pos+3], value)
+                else:
+                    summary[pos+2]=summary[pos+3]=value
+                summary[pos]+=1
+                summary[pos+1]+=value
+
+    def summarize(self, field : int, start : float, end : float, result : Summary) -> None:
+        """Add the values in [start, end) of this day to the result, from the summaries where possible"""
+        start=max(start, self.start)
+        end=min(end, self.start+_SECONDS_PER_DAY)
+        if start >= end:
+            return
+        self._summarize_slots(field, start, end, result, 'hour')
+
+    def _summarize_slots(self, field : int, start : float, end : float, result : Summary, name : str) -> None:
+        slot_sec=_SUMMARY_SLOTS[name][0]
+        # the complete slots between start and end are taken from the summary, the partial slots at the edges from the finer resolution
+        first=-int(-(start-self.start)//slot_sec)
+        last=int((end-self.start)//slot_sec)
+        if first >= last:
+            self._summarize_edge(field, start, end, result, name)
+            return
+        self._summarize_edge(field, start, self.start+first*slot_sec, result, name)
+        summary=self.summaries[name].values
+        for slot in range(first, last):
+            pos=slot*_SLOT_SIZE+field*_STATS
+            result.merge(summary[pos], summary[pos+1], summary[pos+2], summary[pos+3])
+        self._summarize_edge(field, self.start+last*slot_sec, end, result, name)
+
+    def _summarize_edge(self, field : int, start : float, end : float, result : Summary, name : str) -> None:
+        if start >= end:
+            return
+        if name == 'hour':
+            self._summarize_slots(field, start, end, result, 'minute')
+            return
+        # less than a minute: the raw records
+        times=self.time.values
+        values=self.fields[field].values
+        for index in range(bisect.bisect_left(times, start, 0, self.count), bisect.bisect_left(times, end, 0, self.count)):
+            value=values[index]
+            if value == value:
+                result.add(value)
+
+    def records(self, start : float, end : float) -> Iterator[Tuple[float, List[Optional[float]]]]:
+        times=self.time.values
+        for index in range(bisect.bisect_left(times, start, 0, self.count), bisect.bisect_left(times, end, 0, self.count)):
+            values=[column.values[index] for column in self.fields]
+            yield times[index], [value if value == value else None for value in values]
+
+    def flush(self) -> None:
+        for column in [self.time]+self.fields+list(self.summaries.values()):
+            column.flush()
+
+    def close(self) -> None:
+        for column in [self.time]+self.fields+list(self.summaries.values()):
+            column.close()
+
+    def _find_count(self) -> int:
+        # the times are ascending and followed by zeros (not written yet)
+        times=self.time.values
+        low, high=0, self.time.size
+        while low < high:
+            middle=(low+high)//2
+            if times[middle]:
+                low=middle+1
+            else:
+                high=middle
+        return low
+
+class TimeSeriesArchive():
+    """Local archive of all read values at full resolution (e.g. for analysis), while only aggregates are posted to openHAB
+
+    The values are stored in a directory per day (UTC) with a memory-mapped file per column (time and each field of
+    SmartMeterValues, 8 bytes per value). Per-minute and per-hour summaries (count, sum, min, max) are updated on each
+    append, so range queries (see summary) read at most the raw records of the partial minutes at the edges of the range.
+    Records have to be appended in chronological order, older records are skipped.
+
+    Parameters
+    ----------
+    directory : Path
+        Directory of the day directories
+    grow_records : int
+        The column files grow by this number of records
+    """
+    def __init__(self, directory : Path, logger : Logger, grow_records : int = 4096) -> None:
+        self._directory=directory
+        self._logger=logger
+        self._grow_records=grow_records
+        self._lock=threading.Lock()
+        self._segment : Optional[_DaySegment] = None
+        self._last_timestamp=0.0
+        self.skipped_count=0
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, values : SmartMeterValues, timestamp : Optional[float] = None) -> bool:
+        """Append the values (unix time, default now). Returns False if the record is older than the latest record."""
+        timestamp=time() if timestamp is None else timestamp
+        with self._lock:
+            day=int(timestamp//_SECONDS_PER_DAY)
+            if self._segment is None or self._segment.day != day:
+                if self._segment is not None:
+                    self._segment.close()
+                self._segment=_DaySegment(self._day_directory(day), day, True, self._grow_records)
+                if self._segment.count:
+                    self._last_timestamp=max(self._last_timestamp, self._segment.time.values[self._segment.count-1])
+            if timestamp < self._last_timestamp or timestamp <= 0:
+                self.skipped_count+=1
+                return False
+            self._segment.append(timestamp, values._values.tolist())
+            self._last_timestamp=timestamp
+            return True
+
+    def summary(self, field : str, start : float, end : float) -> Summary:
+        """Aggregate of the values of the field (see FIELDS) in [start, end) (unix time)"""
+        field_index=FIELDS.index(field)
+        result=Summary()
+        with self._lock:
+            for day in range(int(start//_SECONDS_PER_DAY), int(end//_SECONDS_PER_DAY)+1):
+                segment=self._open_segment(day)
+                if segment is None:
+                    continue
+                try:
+                    segment.summarize(field_index, start, end, result)
+                finally:
+                    if segment is not self._segment:
+                        segment.close()
+        return result
+
+    def mean(self, field : str, start : float, end : float) -> Optional[float]:
+        """Mean of the values of the field in [start, end), None if there are no values"""
+        return self.summary(field, start, end).mean
+
+    def records(self, start : float, end : float) -> List[Tuple[float, List[Optional[float]]]]:
+        """The raw records in [start, end): the unix time and the values (in the order of FIELDS)"""
+        records : List[Tuple[float, List[Optional[float]]]] = []
+        with self._lock:
+            for day in range(int(start//_SECONDS_PER_DAY), int(end//_SECONDS_PER_DAY)+1):
+                segment=self._open_segment(day)
+                if segment is None:
+                    continue
+                try:
+                    records.extend(segment.records(start, end))
+                finally:
+                    if segment is not self._segment:
+                        segment.close()
+        return records
+
+    def flush(self) -> None:
+        """Write the changes to the disk (otherwise the operating system decides when)"""
+        with self._lock:
+            if self._segment is not None:
+                self._segment.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._segment is not None:
+                self._segment.close()
+                self._segment=None
+
+    def _day_directory(self, day : int) -> Path:
+        return self._directory / datetime.fromtimestamp(day*_SECONDS_PER_DAY, timezone.utc).strftime('%Y-%m-%d')
+
+    def _open_segment(self, day : int) -> Optional[_DaySegment]:
+        if self._segment is not None and self._segment.day == day:
+            return self._segment
+        directory=self._day_directory(day)
+        if not (directory / f"{TIME_COLUMN}.f64").exists():
+            return None
+        return _DaySegment(directory, day, False, self._grow_records)
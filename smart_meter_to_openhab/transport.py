@@ -0,0 +1,266 @@
+import os
+import random
+from abc import ABC, abstractmethod
+from pathlib import Path
+from time import monotonic, sleep
+from typing import List, Optional
+
+# 9600 baud with 8N1 (start bit + 8 data bits + stop bit)
+SERIAL_BYTES_PER_SEC=9600/10
+
+class TransportError(OSError):
+    pass
+
+class Transport(ABC):
+    """Byte stream of the smart meter (see ByteSource of SmlFrameAssembler)"""
+    @property
+    @abstractmethod
+    def is_open(self) -> bool:
+        pass
+
+    @abstractmethod
+    def open(self) -> None:
+        pass
+
+    @abstractmethod
+    def close(self) -> None:
+        pass
+
+    @property
+    @abstractmethod
+    def in_waiting(self) -> int:
+        pass
+
+    @abstractmethod
+    def read(self, size : int = 1) -> bytes:
+        """Read up to size bytes. Blocks until at least one byte is available."""
+        pass
+
+    def fileno(self) -> Optional[int]:
+        """File descriptor to wait for incoming data (e.g. with selectors). None if the transport has to be polled."""
+        return None
+
+class SerialTransport(Transport):
+    """Serial port (e.g. /dev/ttyUSB0) of the IR reading head. The port is opened on the first read."""
+    def __init__(self, serial_port : str) -> None:
+        # pyserial is imported only if a serial port is used (not for replays etc.)
+        import serial
+        self._port=serial.Serial(baudrate=9600, bytesize=serial.EIGHTBITS, parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE)
+        self._serial_port=serial_port
+
+    @property
+    def is_open(self) -> bool:
+        return self._port.is_open
+
+    def open(self) -> None:
+        self._port.port=self._serial_port
+        self._port.open()
+
+    def close(self) -> None:
+        self._port.close()
+
+    @property
+    def in_waiting(self) -> int:
+        return self._port.in_waiting
+
+    def read(self, size : int = 1) -> bytes:
+        return self._port.read(size)
+
+    def fileno(self) -> Optional[int]:
+        return self._port.fileno()
+
+def load_sml_dumps(path : Path) -> List[bytes]:
+    """Load the frames of a .sml dump file (hex string or binary) or of all .sml files 
+    and the raw frame archive (like written to --raw_data_dump_dir) of a directory"""
+    files=sorted(path.glob('*.sml')) if path.is_dir() else [path]
+    frames : List[bytes] = []
+    if path.is_dir():
+        from .raw_archive import read_raw_archive
+        frames+=[frame for _, _, frame in read_raw_archive(path) if frame]
+    for file in files:
+        data=file.read_bytes()
+        try:
+            frames.append(bytes.fromhex(data.decode('ascii')))
+        except ValueError:
+            frames.append(data)
+    if not frames:
+        raise ValueError(f"Unable to replay {path}: No .sml dumps found")
+    return frames
+
+class ReplayTransport(Transport):
+    """Replays recorded SML frames with the timing of the smart meter (or faster)
+
+    Parameters
+    ----------
+    frames : List[bytes]
+        The frames to replay (see load_sml_dumps)
+    speedup : float
+        Replay speed relative to the real smart meter (e.g. 1 to 1000). 0 replays as fast as possible.
+    frame_interval_sec : float
+        Time between the start of two frames of the real smart meter
+    corruption_rate : float
+        Probability that a replayed frame is corrupted (a byte is flipped, dropped or inserted)
+    loop : bool
+        Start again with the first frame after the last one. Otherwise a TransportError is raised at the end of the replay.
+    seed : int, optional
+        Seed of the corruption (for reproducible replays)
+    """
+    def __init__(self, frames : List[bytes], speedup : float = 1, frame_interval_sec : float = 1, corruption_rate : float = 0,
+                 loop : bool = True, seed : Optional[int] = None) -> None:
+        if speedup < 0 or not 0 <= corruption_rate <= 1:
+            raise ValueError(f"Unable to create ReplayTransport: Invalid speedup or corruption rate")
+        self._frames=frames
+        self._speedup=speedup
+        self._frame_interval_sec=frame_interval_sec
+        self._corruption_rate=corruption_rate
+        self._loop=loop
+        self._random=random.Random(seed)
+        self._is_open=False
+        self.replayed_frame_count=0
+        self.corrupted_frame_count=0
+
+    @property
+    def is_open(self) -> bool:
+        return self._is_open
+
+    def open(self) -> None:
+        self._data=bytearray()
+        # offset of the latest frame in _data
+        self._latest_offset=0
+        self._pos=0
+        self._next_frame=0
+        self._frames_since_open=0
+        self._start_time=monotonic()
+        self._is_open=True
+
+    def close(self) -> None:
+        self._is_open=False
+
+    @property
+    def in_waiting(self) -> int:
+        self._check_open()
+        return self._available()-self._pos
+
+    def read(self, size : int = 1) -> bytes:
+        self._check_open()
+        while True:
+            available=self._available()-self._pos
+            if available > 0:
+                break
+            if not self._loop and self._next_frame >= len(self._frames) and self._pos >= len(self._data):
+                raise TransportError(f"Replay finished after {self.replayed_frame_count} frames")
+            if self._speedup:
+                # wait for the next byte (at most one frame interval)
+                sleep(min(1/SERIAL_BYTES_PER_SEC, self._frame_interval_sec)/self._speedup)
+        data=bytes(self._data[self._pos:self._pos+min(size, available)])
+        self._pos+=len(data)
+        if self._pos > 1 << 20:
+            # drop replayed data
+            del self._data[:self._pos]
+            self._latest_offset-=self._pos
+            self._pos=0
+        return data
+
+    def _check_open(self) -> None:
+        if not self._is_open:
+            raise TransportError("Replay is not open")
+
+    def _available(self) -> int:
+        """Returns the end of the data that has been 'transmitted' until now"""
+        if self._speedup == 0:
+            # as fast as possible: one frame in advance
+            if self._pos >= len(self._data):
+                self._append_frame()
+            return len(self._data)
+        elapsed=(monotonic()-self._start_time)*self._speedup
+        while self._frames_since_open*self._frame_interval_sec <= elapsed and self._append_frame():
+            pass
+        if not self._frames_since_open:
+            return 0
+        # bytes of the latest frame are transmitted with the baud rate
+        transmitted=int((elapsed-(self._frames_since_open-1)*self._frame_interval_sec)*SERIAL_BYTES_PER_SEC)
+        return min(len(self._data), self._latest_offset+transmitted)
+
+    def _append_frame(self) -> bool:
+        if self._next_frame >= len(self._frames):
+            if not self._loop:
+                return False
+            self._next_frame=0
+        frame=self._frames[self._next_frame]
+        self._next_frame+=1
+        if self._corruption_rate and self._random.random() < self._corruption_rate:
+            frame=self._corrupt(frame)
+            self.corrupted_frame_count+=1
+        self._latest_offset=len(self._data)
+        self._data.extend(frame)
+        self._frames_since_open+=1
+        self.replayed_frame_count+=1
+        return True
+
+    def _corrupt(self, frame : bytes) -> bytes:
+        pos=self._random.randrange(len(frame))
+        kind=self._random.randrange(3)
+        if kind == 0:
+            return frame[:pos]+bytes((frame[pos] ^ (1 << self._random.randrange(8)),))+frame[pos+1:]
+        if kind == 1:
+            return frame[:pos]+frame[pos+1:]
+        return frame[:pos]+bytes((self._random.randrange(256),))+frame[pos:]
+
+class PtyTransport(Transport):
+    """Pseudo terminal loopback (POSIX only)
+
+    Everything written to the device (e.g. by another process emulating the smart meter, or by write) is read from
+    this transport. This exercises the same terminal based I/O as the real serial port.
+    """
+    def __init__(self) -> None:
+        self._master : Optional[int] = None
+        self._slave : Optional[int] = None
+
+    @property
+    def device(self) -> str:
+        """Path of the terminal device to write the smart meter data to"""
+        self._check_open()
+        return os.ttyname(self._slave) # type: ignore
+
+    @property
+    def is_open(self) -> bool:
+        return self._master is not None
+
+    def open(self) -> None:
+        import tty
+        self._master, self._slave=os.openpty()
+        # raw mode: bytes are passed unchanged (no line editing, no newline translation)
+        tty.setraw(self._master)
+        tty.setraw(self._slave)
+
+    def close(self) -> None:
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                os.close(fd)
+        self._master=self._slave=None
+
+    def write(self, data : bytes) -> None:
+        self._check_open()
+        view=memoryview(data)
+        while view:
+            written=os.write(self._slave, view) # type: ignore
+            view=view[written:]
+
+    @property
+    def in_waiting(self) -> int:
+        import fcntl
+        import termios
+        import struct
+        self._check_open()
+        return struct.unpack('i', fcntl.ioctl(self._master, termios.FIONREAD, b'\0\0\0\0'))[0] # type: ignore
+
+    def read(self, size : int = 1) -> bytes:
+        self._check_open()
+        return os.read(self._master, size) # type: ignore
+
+    def fileno(self) -> Optional[int]:
+        return self._master
+
+    def _check_open(self) -> None:
+        if self._master is None:
+            raise TransportError("Pseudo terminal is not open")
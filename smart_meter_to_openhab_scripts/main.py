@@ -1,12 +1,13 @@
 import argparse
 import logging
-import os
 import sys
 import subprocess
-from datetime import datetime
+from datetime import datetime, timedelta
 from pathlib import Path
-from dotenv import load_dotenv
-from typing import Union, List
+from typing import Union, List, Optional, Iterable, Any, TYPE_CHECKING
+if TYPE_CHECKING:
+    from smart_meter_to_openhab.openhab import OpenhabConnection
+    from smart_meter_to_openhab.mqtt import MqttConnection
 
 try:
     import importlib.metadata
@@ -37,9 +38,105 @@ def create_args_parser() -> argparse.ArgumentParser:
                         or by any other means (e.g. in your ~/.profile)")
     parser.add_argument("-c", "--smart_meter_read_count", type=int, required=False, default=5, 
                         help="Specifies the number of performed reads that are averaged per interval. Between each read is a sleep of 1 sec.")
+    parser.add_argument("--adaptive_max_read_count", type=int, required=False, 
+                        help="Adapt the number of reads per published value to the load, between --smart_meter_read_count and this number. \
+                        It grows while the load is steady and is reset if the load changes sharply (which is published immediately).")
+    parser.add_argument("--adaptive_steady_w", type=float, required=False, default=10, 
+                        help="The load is steady if the standard deviation of the overall consumption within a cycle \
+                        and the change compared to the last published value are below this (W).")
+    parser.add_argument("--adaptive_change_w", type=float, required=False, default=100, 
+                        help="The load changed sharply if the overall consumption differs more than this (W) from the last published value.")
     parser.add_argument('--end_on_midnight', action='store_true', help="Ends the process so that it can be safely restarted.")
     parser.add_argument("--logfile", type=Path, required=False, help="Write logging to this file instead of to stdout")
-    parser.add_argument("--raw_data_dump_dir", type=Path, required=False, help="Dump raw data of unsuccessful reads to this folder.")
+    parser.add_argument("--raw_data_dump_dir", type=Path, required=False, help="Archive raw data of unsuccessful reads (and of all reads with -vvv) \
+                        in compressed, rotated segment files in this folder.")
+    parser.add_argument("--timeseries_dir", type=Path, required=False, help="Archive all good reads at full resolution in this directory \
+                        (e.g. for analysis), while only the aggregates (see --stream_window_sec) are posted to openHAB.")
+    parser.add_argument("--serial_port", type=str, required=False, default='/dev/ttyUSB0', help="Serial port of the IR reading head.")
+    parser.add_argument("--replay", type=Path, required=False, 
+                        help="Replay the .sml dumps of this file or directory (e.g. --raw_data_dump_dir) instead of reading the smart meter.")
+    parser.add_argument("--replay_speedup", type=float, required=False, default=1, 
+                        help="Replay speed relative to the smart meter (e.g. 1 to 1000). 0 replays as fast as possible.")
+    parser.add_argument("--replay_corruption", type=float, required=False, default=0, 
+                        help="Probability that a replayed frame is corrupted (to test the error handling).")
+    parser.add_argument('--pty', action='store_true', help="Read from a pseudo terminal instead of the smart meter. \
+                        The device path is logged, write the SML data to it (e.g. from another process).")
+    parser.add_argument("--meters_config", type=Path, required=False, 
+                        help="Read several smart meters (ini file with the serial port and openHAB items per smart meter). \
+                        The smart meters are read continuously like in stream mode. The window defaults to --smart_meter_read_count seconds.")
+    parser.add_argument("--outlier_window", type=int, required=False, default=15, 
+                        help="Power values that deviate strongly from the median of the latest reads (Hampel filter over this number of reads) \
+                        are removed from the reads. The other values of the read are kept.")
+    parser.add_argument("--max_power_w", type=float, required=False, default=50000, 
+                        help="Maximum plausible power (W). Values of the electricity meter that decrease or increase faster are removed from the reads.")
+    parser.add_argument("--stream_window_sec", type=float, required=False, 
+                        help="Read continuously instead of --smart_meter_read_count reads with sleeps in between. \
+                        All valid reads within this time window are aggregated.")
+    parser.add_argument("--stream_emit_sec", type=float, required=False, 
+                        help="Publish the aggregated values every n seconds (in stream mode). Default is the window size.")
+    parser.add_argument("--stream_emit_frames", type=int, required=False, 
+                        help="Publish the aggregated values every n reads (in stream mode).")
+    parser.add_argument("--aggregate", choices=['mean', 'median', 'trimmed_mean', 'mad_mean'], required=False, default='mean', 
+                        help="Aggregation of the read values (--smart_meter_read_count reads or the time window in stream mode). \
+                        trimmed_mean ignores the smallest and largest 10 percent, mad_mean ignores outliers (median absolute deviation).")
+    parser.add_argument('--pipeline', action='store_true', help="Read the smart meter and publish to openHAB in parallel. \
+                        The read cadence does not depend on the latency of openHAB then.")
+    parser.add_argument("--queue_size", type=int, required=False, default=10, 
+                        help="Maximum number of values waiting to be published (in --pipeline mode).")
+    parser.add_argument("--backpressure", choices=['drop_oldest', 'coalesce'], required=False, default='drop_oldest', 
+                        help="Handling of new values when the queue is full (in --pipeline mode): Drop the oldest values or merge them into the newest ones.")
+    parser.add_argument("--publish_filter_config", type=Path, required=False, 
+                        help="ini file with deadband, minimum interval and heartbeat (max_silence_sec) settings per openHAB item. \
+                        Values are only published if they pass this filter.")
+    parser.add_argument("--outbox_file", type=Path, required=False, 
+                        help="Store values that could not be posted to openHAB in this database file. \
+                        They are written to the openHAB persistence when openHAB is reachable again.")
+    parser.add_argument("--outbox_max_entries", type=int, required=False, default=100000, 
+                        help="Maximum number of values in the outbox. The oldest values are dropped.")
+    parser.add_argument("--outbox_max_age_days", type=float, required=False, default=7, 
+                        help="Values older than this are dropped from the outbox.")
+    parser.add_argument("--metrics_port", type=int, required=False, 
+                        help="Serve metrics (read, decode and publish latencies, rejected frames, HTTP errors, ...) in the OpenMetrics format \
+                        on this port (e.g. for Prometheus): http://<metrics_host>:<metrics_port>/metrics")
+    parser.add_argument("--metrics_host", type=str, required=False, default='127.0.0.1', 
+                        help="Address to serve the metrics on. Use 0.0.0.0 to serve them on all interfaces.")
+    parser.add_argument("--backend", choices=['rest', 'mqtt'], required=False, default='rest', 
+                        help="Post the values to the REST API of openHAB or publish them to an MQTT broker (e.g. for the MQTT binding of openHAB). \
+                        MQTT uses a single persistent connection, which takes less CPU time per value. \
+                        Provide MQTT_USER and MQTT_PASSWD as environment variables if the broker requires them.")
+    parser.add_argument("--mqtt_host", type=str, required=False, default='localhost', help="Host of the MQTT broker (--backend mqtt).")
+    parser.add_argument("--mqtt_port", type=int, required=False, default=1883, help="Port of the MQTT broker (--backend mqtt).")
+    parser.add_argument("--mqtt_qos", type=int, choices=[0, 1], required=False, default=0, 
+                        help="QoS of the published messages. With QoS 1 the messages are acknowledged by the broker.")
+    parser.add_argument("--mqtt_topic_prefix", type=str, required=False, default='smart_meter', 
+                        help="The value of each item is published (retained) to the topic <prefix>/<item>.")
+    parser.add_argument("--mqtt_packed_topic", type=str, required=False, 
+                        help="Additionally publish all values of a reading as one JSON object to this topic.")
+    parser.add_argument("--mqtt_buffer_size", type=int, required=False, default=1000, 
+                        help="Maximum number of messages kept while the MQTT broker is not reachable. The oldest messages are dropped.")
+    parser.add_argument("--openhab_budget_sec", type=float, required=False, default=10, 
+                        help="Time budget to post the values of a cycle to openHAB (incl. retries). Values that are not posted \
+                        within the budget count as failed (e.g. they are stored in the outbox).")
+    parser.add_argument("--openhab_timeout_sec", type=float, required=False, default=5, 
+                        help="Timeout of a single HTTP request to openHAB.")
+    parser.add_argument("--openhab_pool_size", type=int, required=False, 
+                        help="Maximum number of connections to openHAB that are kept open (default: at least 10).")
+    parser.add_argument('--openhab_no_keep_alive', action='store_true', help="Close the connection to openHAB after each request.")
+    parser.add_argument("--openhab_failure_threshold", type=int, required=False, default=5, 
+                        help="Requests to openHAB fail fast after this number of consecutive failed requests (circuit breaker).")
+    parser.add_argument("--openhab_reset_timeout_sec", type=float, required=False, default=30, 
+                        help="Time until a request is sent to openHAB again after the requests started to fail fast.")
+    parser.add_argument("--openhab_confirm_delivery_sec", type=float, required=False, 
+                        help="Subscribe to the event stream of openHAB and log a warning if the state of a posted item is not updated \
+                        within this time.")
+    parser.add_argument('--profile', action='store_true', help="Record the time of the stages (serial, decode, sleep, publish) of each cycle \
+                        and log a summary at the end.")
+    parser.add_argument("--profile_budget_sec", type=float, required=False, 
+                        help="Log the time per stage of cycles that take longer than this (with --profile).")
+    parser.add_argument("--profile_flamegraph", type=Path, required=False, 
+                        help="Sample the stacks of the first --profile_flamegraph_cycles cycles and write them to this file \
+                        (collapsed stack format, e.g. for flamegraph.pl or speedscope).")
+    parser.add_argument("--profile_flamegraph_cycles", type=int, required=False, default=10)
     parser.add_argument('-v', '--verbose', action='count', default=0)
     return parser
 
@@ -49,41 +146,185 @@ def _exec_process(params : List[str]) -> None:
     if rc != 0:
         raise Exception("Failed to execute command "+ ' '.join(params)+". Return code was: "+str(result.returncode))
 
-def _run(logger : logging.Logger, read_count : int, end_on_midnight : bool, raw_data_dump_dir : Union[Path, None] = None) -> bool:
-    from smart_meter_to_openhab.openhab import OpenhabConnection
+def _create_transport(logger : logging.Logger, args : argparse.Namespace) -> Any:
+    from smart_meter_to_openhab.transport import ReplayTransport, PtyTransport, load_sml_dumps
+    if args.replay:
+        logger.info(f"Replaying {args.replay} with speedup {args.replay_speedup}.")
+        return ReplayTransport(load_sml_dumps(args.replay), args.replay_speedup, corruption_rate=args.replay_corruption)
+    if args.pty:
+        pty=PtyTransport()
+        pty.open()
+        logger.info(f"Reading from pseudo terminal {pty.device}.")
+        return pty
+    return args.serial_port
+
+def _run(logger : logging.Logger, args : argparse.Namespace) -> bool:
+    from smart_meter_to_openhab.config import Config, configure
     from smart_meter_to_openhab.sml_iskra_mt175 import SmlIskraMt175OneWay
+    from smart_meter_to_openhab.interfaces import SmartMeterValues, OhItemAndValue
+    from smart_meter_to_openhab.pipeline import AcquisitionPipeline
+    from smart_meter_to_openhab.publish_filter import PublishFilter, load_publish_filter_config
+    from smart_meter_to_openhab.outbox import PersistenceOutbox
+    from smart_meter_to_openhab.multi_meter import MultiMeterReader, load_meter_configs
+    from smart_meter_to_openhab.adaptive import AdaptiveScheduler, AdaptiveSettings
+    from smart_meter_to_openhab.outlier_filter import OutlierFilterSettings
+    from smart_meter_to_openhab.metrics import MetricsServer, CYCLE_SECONDS
+    from smart_meter_to_openhab import profiling
+    from time import perf_counter
 
-    oh_user=os.getenv('OH_USER') if 'OH_USER' in os.environ else ''
-    oh_passwd=os.getenv('OH_PASSWD') if 'OH_PASSWD' in os.environ else ''
-    oh_connection = OpenhabConnection(os.getenv('OH_HOST'), oh_user, oh_passwd, logger) # type: ignore
-    sml_iskra = SmlIskraMt175OneWay('/dev/ttyUSB0', logger, raw_data_dump_dir)
+    # the items of the environment variables are not used for several smart meters (see --meters_config)
+    config=Config.from_env(require_oh_host=args.backend == 'rest', require_oh_items=not args.meters_config)
+    configure(config)
+    # only the modules of the used backend are imported (requests is not needed for MQTT)
+    oh_connection : Optional[OpenhabConnection] = None
+    connection : Union[OpenhabConnection, MqttConnection]
+    if args.backend == 'mqtt':
+        from smart_meter_to_openhab.mqtt import MqttConnection, MqttSettings
+        if args.outbox_file or args.openhab_confirm_delivery_sec is not None:
+            raise ValueError("--outbox_file and --openhab_confirm_delivery_sec require the REST API of openHAB (--backend rest)")
+        # the MQTT connection buffers the messages while the broker is not reachable
+        mqtt_settings=MqttSettings(topic_prefix=args.mqtt_topic_prefix, packed_topic=args.mqtt_packed_topic, qos=args.mqtt_qos,
+                                   buffer_size=args.mqtt_buffer_size)
+        connection=MqttConnection(args.mqtt_host, args.mqtt_port, config.mqtt_user, config.mqtt_passwd, logger, mqtt_settings)
+    else:
+        from smart_meter_to_openhab.openhab import OpenhabConnection, ConnectionSettings
+        connection_settings=ConnectionSettings(budget_sec=args.openhab_budget_sec, request_timeout_sec=args.openhab_timeout_sec,
+                                               pool_maxsize=args.openhab_pool_size, keep_alive=not args.openhab_no_keep_alive,
+                                               failure_threshold=args.openhab_failure_threshold, reset_timeout_sec=args.openhab_reset_timeout_sec,
+                                               delivery_timeout_sec=args.openhab_confirm_delivery_sec)
+        connection=oh_connection=OpenhabConnection(config.oh_host, config.oh_user, config.oh_passwd, logger, settings=connection_settings)
+    outlier_filter_settings=OutlierFilterSettings(window=args.outlier_window, max_power_w=args.max_power_w)
+    multi_meter : Optional[MultiMeterReader] = None
+    if args.meters_config:
+        # all smart meters are read in this thread and share the connection to openHAB
+        multi_meter=MultiMeterReader(load_meter_configs(args.meters_config), logger, args.stream_window_sec or args.smart_meter_read_count,
+                                     args.stream_emit_sec, args.stream_emit_frames, args.aggregate, args.raw_data_dump_dir,
+                                     timeseries_dir=args.timeseries_dir, outlier_filter_settings=outlier_filter_settings)
+    else:
+        sml_iskra = SmlIskraMt175OneWay(_create_transport(logger, args), logger, args.raw_data_dump_dir, config.oh_item_names, args.timeseries_dir,
+                                        outlier_filter_settings)
+    scheduler : Optional[AdaptiveScheduler] = None
+    if args.adaptive_max_read_count is not None:
+        if args.stream_window_sec or args.meters_config:
+            raise ValueError("--adaptive_max_read_count requires reads with sleeps in between (no --stream_window_sec and --meters_config)")
+        scheduler=AdaptiveScheduler(AdaptiveSettings(args.smart_meter_read_count, args.adaptive_max_read_count, args.adaptive_steady_w,
+                                                     args.adaptive_change_w), logger)
+    publish_filter : Optional[PublishFilter] = None
+    if args.publish_filter_config:
+        default_filter_config, item_filter_configs=load_publish_filter_config(args.publish_filter_config)
+        publish_filter=PublishFilter(item_filter_configs, default_filter_config)
+    outbox=PersistenceOutbox(args.outbox_file, logger, args.outbox_max_entries, timedelta(days=args.outbox_max_age_days)) if args.outbox_file else None
+    metrics_server=MetricsServer(args.metrics_port, args.metrics_host) if args.metrics_port is not None else None
+    if metrics_server:
+        logger.info(f"Serving metrics on http://{args.metrics_host}:{metrics_server.port}/metrics")
     logger.info("Connections established. Starting to transfer smart meter values to openhab.")
     start_day=datetime.now().day
-    while True:
+    stream=sml_iskra.read_stream(args.stream_window_sec, args.stream_emit_sec, args.stream_emit_frames, args.aggregate) if args.stream_window_sec and not multi_meter else None
+    multi_meter_stream=multi_meter.read() if multi_meter else None
+
+    def _read_multi_meter() -> SmartMeterValues:
+        while True:
+            name, values=next(multi_meter_stream) # type: ignore
+            if values.is_valid():
+                logger.info(f"current values of {name}: {values}")
+                return values
+            # a failing smart meter must not stop the others
+            logger.warning(f"Reading values from smart meter {name} failed.")
+
+    def _read() -> SmartMeterValues:
+        if multi_meter_stream:
+            return _read_multi_meter()
         logger.info("Reading SML data")
-        values=sml_iskra.read_avg(read_count)
+        if stream:
+            values=next(stream)
+        elif scheduler:
+            values=sml_iskra.read_avg(scheduler.read_count, args.aggregate, scheduler.observe)
+            scheduler.end_cycle(values)
+        else:
+            values=sml_iskra.read_avg(args.smart_meter_read_count, args.aggregate)
         logger.info(f"current values: {values}")
-        oh_connection.post_to_items(values)
+        return values
+
+    def _publish(values : SmartMeterValues) -> None:
+        timestamp=datetime.now().astimezone()
+        publish_values : Iterable[OhItemAndValue] = values
+        if publish_filter:
+            publish_values=publish_filter.filter(values)
+            logger.debug(f"Publish filter: {publish_filter.summary()}")
+        with profiling.stage('publish'):
+            success=connection.post_to_items(publish_values)
         logger.info("Values posted to openHAB")
+        if publish_filter:
+            publish_filter.commit(connection.last_failed_items)
+        if oh_connection is not None and args.openhab_confirm_delivery_sec is not None:
+            # values of the previous cycles that have not been confirmed
+            oh_connection.check_if_delivered()
+        if outbox is not None and oh_connection is not None:
+            if not success:
+                outbox.append(timestamp, [value for value in publish_values if str(value.oh_item) in oh_connection.last_failed_items])
+                logger.info(f"Stored values of {oh_connection.last_failed_items} in outbox ({outbox.append_latency_sec*1000:.1f} ms).")
+            elif len(outbox):
+                # the replay must not delay reading the smart meter
+                outbox.replay_in_background(oh_connection.put_persistence_values, budget_sec=args.openhab_budget_sec)
+
+    profiler=profiling.CycleProfiler(logger, budget_sec=args.profile_budget_sec, flamegraph_file=args.profile_flamegraph,
+                                     flamegraph_cycles=args.profile_flamegraph_cycles) if args.profile or args.profile_flamegraph else None
+    profiling.activate(profiler)
+    cycle_start=perf_counter()
+    def _check_exit(values : SmartMeterValues) -> Optional[bool]:
+        # called once per cycle (after publishing, or after queueing the values in pipeline mode)
+        nonlocal cycle_start
+        CYCLE_SECONDS.observe(perf_counter()-cycle_start)
+        cycle_start=perf_counter()
+        if profiler:
+            profiler.end_cycle()
+            profiler.start_cycle()
         if values.is_invalid():
             logger.error(f"Reading values from smart meter failed. Exiting process now.")
             return False
-        if end_on_midnight and datetime.now().day != start_day:
+        if args.end_on_midnight and datetime.now().day != start_day:
             logger.info("End of day reached. Exiting process now.")
             return True
+        return None
+
+    try:
+        if args.pipeline:
+            return AcquisitionPipeline(_read, _publish, logger, args.queue_size, args.backpressure).run(_check_exit)
+        while True:
+            values=_read()
+            _publish(values)
+            result=_check_exit(values)
+            if result is not None:
+                return result
+    finally:
+        if profiler:
+            profiling.activate(None)
+            profiler.close()
+            logger.info(profiler.summary())
+        if publish_filter:
+            logger.info(f"Publish filter: {publish_filter.summary()}")
+        connection.close()
+        if outbox is not None:
+            outbox.close()
+        if multi_meter is not None:
+            multi_meter.close()
+        else:
+            sml_iskra.close()
+        if metrics_server is not None:
+            metrics_server.close()
 
 def main() -> None:
     parser=create_args_parser()
     args = parser.parse_args()
     if args.dotenv_path:
+        from dotenv import load_dotenv
         load_dotenv(dotenv_path=args.dotenv_path)
     logger=create_logger(args.logfile)
     logger.setLevel(logging.INFO)
     logger.info(f"Starting smart_meter_to_openhab version {__version__}")
     logger.setLevel(log_level_from_arg(args.verbose))
     try:
-        raw_data_dump_dir=args.raw_data_dump_dir if args.raw_data_dump_dir else None
-        success=_run(logger, args.smart_meter_read_count, args.end_on_midnight, raw_data_dump_dir)
+        success=_run(logger, args)
     except Exception as e:
         logger.exception("Caught Exception: " + str(e))
     except:
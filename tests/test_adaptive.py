@@ -0,0 +1,94 @@
+import unittest
+import logging
+import sys
+from typing import List, Sequence
+
+from smart_meter_to_openhab.adaptive import *
+from smart_meter_to_openhab.interfaces import SmartMeterValues
+from smart_meter_to_openhab import metrics
+
+logging.basicConfig(stream=sys.stdout, level=logging.ERROR)
+logger = logging.getLogger(__name__)
+
+def _values(overall : float) -> SmartMeterValues:
+    return SmartMeterValues(overall/3, overall/3, overall/3, overall, 1000)
+
+class TestAdaptiveScheduler(unittest.TestCase):
+
+    def _cycle(self, scheduler : AdaptiveScheduler, reads : Sequence[float]) -> int:
+        # like read_avg: returns the number of reads until the cycle ended
+        stop_reads=0
+        for index, overall in enumerate(reads[:scheduler.read_count]):
+            stop_reads=scheduler.observe(_values(overall))
+            if stop_reads:
+                break
+        read_count=index+1
+        aggregated=reads[read_count-stop_reads if stop_reads else 0:read_count]
+        scheduler.end_cycle(_values(sum(aggregated)/len(aggregated)))
+        return read_count
+
+    def test_steady_load(self) -> None:
+        scheduler=AdaptiveScheduler(AdaptiveSettings(min_read_count=5, max_read_count=60), logger)
+        self.assertEqual(scheduler.read_count, 5)
+        read_counts : List[int] = []
+        for _ in range(6):
+            self.assertEqual(self._cycle(scheduler, [200, 205, 198, 202]*15), read_counts[-1] if read_counts else 5)
+            read_counts.append(scheduler.read_count)
+        self.assertEqual(read_counts, [10, 20, 40, 60, 60, 60])
+        self.assertEqual(metrics.READ_COUNT.get(), 60)
+
+    def test_varying_load(self) -> None:
+        scheduler=AdaptiveScheduler(AdaptiveSettings(min_read_count=2, max_read_count=60), logger)
+        scheduler.read_count=32
+        # changes within change_w, but not steady
+        self.assertEqual(self._cycle(scheduler, [200, 260, 180, 250]*8), 32)
+        self.assertEqual(scheduler.read_count, 16)
+        self.assertEqual(self._cycle(scheduler, [200, 260, 180, 250]*4), 16)
+        self.assertEqual(scheduler.read_count, 8)
+
+    def test_sharp_change(self) -> None:
+        scheduler=AdaptiveScheduler(AdaptiveSettings(min_read_count=5, max_read_count=60, change_w=100), logger)
+        self._cycle(scheduler, [200]*5)
+        self._cycle(scheduler, [200]*10)
+        self.assertEqual(scheduler.read_count, 20)
+        # a single outlier does not end the cycle
+        self.assertEqual(self._cycle(scheduler, [200]*5+[2000]+[200]*14), 20)
+        self.assertEqual(scheduler.change_count, 0)
+        # the kettle is switched on: published after two reads
+        self.assertEqual(self._cycle(scheduler, [200]*3+[2200]*40), 5)
+        self.assertEqual(scheduler.change_count, 1)
+        self.assertEqual(scheduler.read_count, 5)
+        # only the reads of the new load have been published, so the next cycle is steady
+        self.assertEqual(self._cycle(scheduler, [2200]*5), 5)
+        self.assertEqual(scheduler.read_count, 10)
+
+    def test_single_read(self) -> None:
+        # without a standard deviation, the change compared to the last published value decides
+        scheduler=AdaptiveScheduler(AdaptiveSettings(min_read_count=1, max_read_count=4), logger)
+        self._cycle(scheduler, [200])
+        self.assertEqual(scheduler.read_count, 1)
+        self._cycle(scheduler, [205])
+        self.assertEqual(scheduler.read_count, 2)
+        self._cycle(scheduler, [260, 200])
+        self.assertEqual(scheduler.read_count, 1)
+
+    def test_missing_values(self) -> None:
+        scheduler=AdaptiveScheduler(AdaptiveSettings(min_read_count=5, max_read_count=60), logger)
+        self.assertFalse(scheduler.observe(SmartMeterValues(1, 2, 3, None, 1000)))
+        self.assertIsNone(scheduler.std)
+        scheduler.end_cycle(SmartMeterValues(1, 2, 3, None, 1000))
+        self.assertEqual(scheduler.read_count, 5)
+
+    def test_invalid_settings(self) -> None:
+        with self.assertRaises(ValueError):
+            AdaptiveScheduler(AdaptiveSettings(min_read_count=10, max_read_count=5), logger)
+        with self.assertRaises(ValueError):
+            AdaptiveScheduler(AdaptiveSettings(min_read_count=0), logger)
+
+if __name__ == '__main__':
+    try:
+        unittest.main()
+    except Exception as e:
+        logger.exception("Caught Exception: " + str(e))
+    except:
+        logger.exception("Caught unknow exception")
@@ -0,0 +1,49 @@
+import unittest
+import logging
+import sys
+
+from smart_meter_to_openhab.interfaces import *
+from smart_meter_to_openhab.aggregation import *
+
+logging.basicConfig(stream=sys.stdout, level=logging.ERROR)
+logger = logging.getLogger(__name__)
+
+class TestAggregation(unittest.TestCase):
+
+    def test_time_window(self) -> None:
+        aggregator=SlidingWindowAggregator(window_sec=3, emit_interval_sec=2)
+        self.assertFalse(aggregator.emit_due(0))
+        aggregator.add(0, SmartMeterValues(100, 100, 100, 300, 1))
+        aggregator.add(1, SmartMeterValues(200, 200, 200, 600, 2))
+        self.assertFalse(aggregator.emit_due(1))
+        aggregator.add(2, SmartMeterValues(300, 300, 300, 900, 3))
+        self.assertTrue(aggregator.emit_due(2))
+        self.assertEqual(aggregator.emit(2), SmartMeterValues(200, 200, 200, 600, 2))
+        self.assertFalse(aggregator.emit_due(3))
+        # the first value drops out of the window
+        aggregator.add(3.5, SmartMeterValues(400, 400, 400, 1200, 4))
+        self.assertEqual(len(aggregator), 3)
+        self.assertTrue(aggregator.emit_due(4))
+        self.assertEqual(aggregator.emit(4, 'median'), SmartMeterValues(300, 300, 300, 900, 3))
+        # no values in the window
+        self.assertEqual(aggregator.emit(10), SmartMeterValues())
+
+    def test_frame_count(self) -> None:
+        aggregator=SlidingWindowAggregator(window_sec=100, emit_frame_count=2)
+        aggregator.add(0, SmartMeterValues(100, 100, 100, 300, 1))
+        self.assertFalse(aggregator.emit_due(0))
+        aggregator.add(0.1, SmartMeterValues(200, 200, 200, 600, 2))
+        self.assertTrue(aggregator.emit_due(0.1))
+        self.assertEqual(aggregator.emit(0.1), SmartMeterValues(150, 150, 150, 450, 1.5))
+        aggregator.add(0.2, SmartMeterValues(300, 300, 300, 900, 3))
+        self.assertFalse(aggregator.emit_due(0.2))
+        with self.assertRaises(ValueError):
+            SlidingWindowAggregator(0)
+
+if __name__ == '__main__':
+    try:
+        unittest.main()
+    except Exception as e:
+        logger.exception("Caught Exception: " + str(e))
+    except:
+        logger.exception("Caught unknow exception")
@@ -0,0 +1,59 @@
+import unittest
+import logging
+import sys
+
+from smart_meter_to_openhab.interfaces import *
+from smart_meter_to_openhab.batch import *
+from smart_meter_to_openhab.batch import numpy_available
+
+logging.basicConfig(stream=sys.stdout, level=logging.ERROR)
+logger = logging.getLogger(__name__)
+
+class TestBatch(unittest.TestCase):
+    # the pure python fallback is tested always, NumPy only if it is installed
+    use_numpy=False
+
+    def _batch(self, values : List[SmartMeterValues]) -> SmartMeterBatch:
+        return SmartMeterBatch(values, use_numpy=self.use_numpy)
+
+    def test_mean_and_median(self) -> None:
+        values=[SmartMeterValues(100, 200, None, 600, 2.5), SmartMeterValues(200, 300, None, 700, 3.5), SmartMeterValues(2000, None, None, 800, 30.5)]
+        self.assertEqual(self._batch(values).mean(), SmartMeterValues(2300/3, 250, None, 700, 36.5/3))
+        self.assertEqual(self._batch(values).median(), SmartMeterValues(200, 250, None, 700, 3.5))
+        self.assertEqual(self._batch([]).mean(), SmartMeterValues())
+        self.assertEqual(self._batch([]).median(), SmartMeterValues())
+        self.assertEqual(len(self._batch(values)), 3)
+
+    def test_trimmed_mean(self) -> None:
+        values=[SmartMeterValues(i, i, None, 3*i, 10) for i in range(1, 10)]+[SmartMeterValues(1000, None, None, 3000, 10)]
+        # 10 values: the smallest and the largest are ignored, 9 values: nothing to ignore
+        self.assertEqual(self._batch(values).trimmed_mean(), SmartMeterValues(5.5, 5, None, 16.5, 10))
+        self.assertEqual(self._batch(values).trimmed_mean(0), self._batch(values).mean())
+        with self.assertRaises(ValueError):
+            self._batch(values).trimmed_mean(0.5)
+
+    def test_reject_outliers(self) -> None:
+        values=[SmartMeterValues(100+i, 0, None, 300+i, 10) for i in range(5)]+[SmartMeterValues(10000, 0, None, 301, 10)]
+        without_outliers=self._batch(values).reject_outliers()
+        self.assertEqual(without_outliers.mean(), SmartMeterValues(102, 0, None, (1510+301)/6, 10))
+        self.assertEqual(self._batch(values).aggregate('mad_mean'), without_outliers.mean())
+        self.assertEqual(self._batch(values).aggregate('median'), self._batch(values).median())
+
+    def test_item_names(self) -> None:
+        oh_item_names : SmartMeterOhItemNames = ('', '', '', SmartMeterValues.oh_item_names()[3], '')
+        values=[SmartMeterValues(1, 2, 3, 4, 5, oh_item_names), SmartMeterValues(3, 4, 5, 6, 7, oh_item_names)]
+        mean=SmartMeterBatch(values, oh_item_names, use_numpy=self.use_numpy).mean()
+        self.assertEqual(mean.value_list(), [5])
+        self.assertEqual(mean.phase_1_consumption.value, 2)
+
+@unittest.skipIf(not numpy_available(), "NumPy is not installed")
+class TestBatchNumpy(TestBatch):
+    use_numpy=True
+
+if __name__ == '__main__':
+    try:
+        unittest.main()
+    except Exception as e:
+        logger.exception("Caught Exception: " + str(e))
+    except:
+        logger.exception("Caught unknow exception")
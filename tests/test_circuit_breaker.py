@@ -0,0 +1,218 @@
+import unittest
+import logging
+import datetime
+import socket
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import List
+
+from smart_meter_to_openhab.circuit_breaker import *
+from smart_meter_to_openhab.openhab import OpenhabConnection, ConnectionSettings
+from smart_meter_to_openhab.interfaces import OhItemAndValue
+from smart_meter_to_openhab import metrics
+
+logging.basicConfig(stream=sys.stdout, level=logging.ERROR)
+logger = logging.getLogger(__name__)
+
+class _FaultyHandler(BaseHTTPRequestHandler):
+    server : '_FaultyOpenhabServer'
+    protocol_version='HTTP/1.1'
+
+    def do_POST(self) -> None:
+        self._respond()
+
+    def do_PUT(self) -> None:
+        self._respond()
+
+    def _respond(self) -> None:
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with self.server.lock:
+            self.server.request_count+=1
+            status=self.server.statuses.pop(0) if self.server.statuses else 200
+        time.sleep(self.server.delay_sec)
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+class _FaultyOpenhabServer(ThreadingHTTPServer):
+    """openHAB that responds with the given status codes (then 200) after a delay"""
+    daemon_threads=True
+
+    def __init__(self) -> None:
+        super().__init__(('127.0.0.1', 0), _FaultyHandler)
+        self.lock=threading.Lock()
+        self.statuses : List[int] = []
+        self.delay_sec=0.0
+        self.request_count=0
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def handle_error(self, request, client_address) -> None:
+        pass
+
+def _unused_url() -> str:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return f"http://127.0.0.1:{s.getsockname()[1]}"
+
+class _Clock():
+    def __init__(self) -> None:
+        self.now=0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_open_after_threshold(self) -> None:
+        clock=_Clock()
+        breaker=CircuitBreaker(logger, 'test', failure_threshold=3, reset_timeout_sec=10, clock=clock)
+        for _ in range(2):
+            self.assertTrue(breaker.allow_request())
+            breaker.record_failure()
+        self.assertEqual(breaker.state, 'closed')
+        # a success resets the consecutive failures
+        breaker.record_success()
+        for _ in range(3):
+            self.assertTrue(breaker.allow_request())
+            breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+        self.assertFalse(breaker.allow_request())
+        self.assertFalse(breaker.allow_request())
+        self.assertEqual(breaker.rejected_count, 2)
+
+    def test_half_open(self) -> None:
+        clock=_Clock()
+        breaker=CircuitBreaker(logger, 'test', failure_threshold=1, reset_timeout_sec=10, clock=clock)
+        breaker.allow_request()
+        breaker.record_failure()
+        clock.now=9.9
+        self.assertFalse(breaker.allow_request())
+        clock.now=10
+        self.assertEqual(breaker.state, 'half_open')
+        # a single probe
+        self.assertTrue(breaker.allow_request())
+        self.assertFalse(breaker.allow_request())
+        # the failed probe opens the circuit again
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+        clock.now=20
+        self.assertTrue(breaker.allow_request())
+        breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
+        self.assertTrue(breaker.allow_request())
+        self.assertTrue(breaker.allow_request())
+
+    def test_invalid_threshold(self) -> None:
+        with self.assertRaises(ValueError):
+            CircuitBreaker(logger, 'test', failure_threshold=0)
+
+class TestConnectionSettings(unittest.TestCase):
+
+    def test_retry_server_errors(self) -> None:
+        server=_FaultyOpenhabServer()
+        server.statuses=[503, 502]
+        connection=OpenhabConnection(server.url, '', '', logger, settings=ConnectionSettings(backoff_factor=0.01))
+        retries=metrics.HTTP_RETRIES.get()
+        self.assertEqual(connection.put_persistence_values('item', [(datetime.datetime.now(), 1)]), 1)
+        self.assertEqual(server.request_count, 3)
+        self.assertEqual(metrics.HTTP_RETRIES.get()-retries, 2)
+        self.assertEqual(connection.circuit_breaker.state, 'closed')
+        connection.close()
+        server.shutdown()
+        server.server_close()
+
+    def test_retries_exhausted(self) -> None:
+        server=_FaultyOpenhabServer()
+        server.statuses=[503]*3
+        connection=OpenhabConnection(server.url, '', '', logger, settings=ConnectionSettings(max_retries=2, backoff_factor=0.01))
+        self.assertEqual(connection.put_persistence_values('item', [(datetime.datetime.now(), 1)]), 0)
+        self.assertEqual(server.request_count, 3)
+        connection.close()
+        server.shutdown()
+        server.server_close()
+
+    def test_no_retry_of_sent_post(self) -> None:
+        server=_FaultyOpenhabServer()
+        server.statuses=[503]
+        settings=ConnectionSettings(budget_sec=None, request_timeout_sec=0.2, backoff_factor=0.01)
+        connection=OpenhabConnection(server.url, '', '', logger, settings=settings)
+        # openHAB may have processed the POST despite the server error
+        self.assertFalse(connection.post_to_items([OhItemAndValue('item', 1)]))
+        self.assertEqual(connection.last_failed_items, {'item'})
+        self.assertEqual(server.request_count, 1)
+        # ... or the read timeout
+        server.delay_sec=0.5
+        self.assertFalse(connection.post_to_items([OhItemAndValue('item', 2)]))
+        time.sleep(0.5)
+        self.assertEqual(server.request_count, 2)
+        connection.close()
+        server.shutdown()
+        server.server_close()
+
+    def test_retry_unsent_post(self) -> None:
+        settings=ConnectionSettings(budget_sec=None, max_retries=2, backoff_factor=0.01)
+        connection=OpenhabConnection(_unused_url(), '', '', logger, settings=settings)
+        retries=metrics.HTTP_RETRIES.get()
+        self.assertFalse(connection.post_to_items([OhItemAndValue('item', 1)]))
+        self.assertEqual(metrics.HTTP_RETRIES.get()-retries, 2)
+        connection.close()
+
+    def test_budget(self) -> None:
+        server=_FaultyOpenhabServer()
+        server.delay_sec=1
+        connection=OpenhabConnection(server.url, '', '', logger, settings=ConnectionSettings(budget_sec=0.2))
+        start=time.monotonic()
+        self.assertFalse(connection.post_to_items([OhItemAndValue('item1', 1), OhItemAndValue('item2', 2)]))
+        self.assertLess(time.monotonic()-start, 0.5)
+        self.assertEqual(connection.last_failed_items, {'item1', 'item2'})
+        connection.close()
+        server.shutdown()
+        server.server_close()
+
+    def test_fail_fast(self) -> None:
+        settings=ConnectionSettings(budget_sec=None, max_retries=0, failure_threshold=2, reset_timeout_sec=0.2)
+        connection=OpenhabConnection(_unused_url(), '', '', logger, max_workers=1, settings=settings)
+        values=[OhItemAndValue('item', 1)]
+        self.assertFalse(connection.post_to_items(values))
+        self.assertFalse(connection.post_to_items(values))
+        self.assertEqual(connection.circuit_breaker.state, 'open')
+        # no request is sent while the circuit is open
+        self.assertFalse(connection.post_to_items(values))
+        self.assertEqual(connection.circuit_breaker.rejected_count, 1)
+        connection.close()
+
+    def test_recovery(self) -> None:
+        server=_FaultyOpenhabServer()
+        server.statuses=[500]*2
+        settings=ConnectionSettings(max_retries=0, failure_threshold=2, reset_timeout_sec=0.2)
+        connection=OpenhabConnection(server.url, '', '', logger, max_workers=1, settings=settings)
+        values=[OhItemAndValue('item', 1)]
+        self.assertFalse(connection.post_to_items(values))
+        self.assertFalse(connection.post_to_items(values))
+        self.assertFalse(connection.post_to_items(values))
+        self.assertEqual(server.request_count, 2)
+        time.sleep(0.2)
+        # the probe succeeds and closes the circuit
+        self.assertTrue(connection.post_to_items(values))
+        self.assertEqual(connection.circuit_breaker.state, 'closed')
+        self.assertEqual(server.request_count, 3)
+        connection.close()
+        server.shutdown()
+        server.server_close()
+
+if __name__ == '__main__':
+    try:
+        unittest.main()
+    except Exception as e:
+        logger.exception("Caught Exception: " + str(e))
+    except:
+        logger.exception("Caught unknow exception")
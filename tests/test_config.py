@@ -0,0 +1,50 @@
+import unittest
+import logging
+import os
+import subprocess
+import sys
+import pathlib
+package_path = pathlib.Path(__file__).parent.parent.absolute()
+
+from smart_meter_to_openhab.config import *
+from smart_meter_to_openhab.interfaces import SmartMeterValues
+
+logging.basicConfig(stream=sys.stdout, level=logging.ERROR)
+logger = logging.getLogger(__name__)
+
+class TestConfig(unittest.TestCase):
+
+    def tearDown(self) -> None:
+        configure(None)
+
+    def test_from_env(self) -> None:
+        environ={'OH_HOST' : 'http://openhab:8080', 'OH_USER' : 'user', 'OVERALL_CONSUMPTION_WATT_OH_ITEM' : 'overall', 
+                 'ELECTRICITY_METER_KWH_OH_ITEM' : 'meter'}
+        self.assertEqual(Config.from_env(environ), Config('http://openhab:8080', 'user', '', ('', '', '', 'overall', 'meter')))
+        with self.assertRaises(ValueError):
+            Config.from_env({'OVERALL_CONSUMPTION_WATT_OH_ITEM' : 'overall'})
+        with self.assertRaises(ValueError):
+            Config.from_env({'OH_HOST' : 'http://openhab:8080'})
+        self.assertEqual(Config.from_env({'OH_HOST' : 'http://openhab:8080'}, require_oh_items=False).oh_item_names, ('', '', '', '', ''))
+
+    def test_configure(self) -> None:
+        self.assertEqual(get_config().oh_item_names, tuple(os.environ.get(variable, '') for variable in OH_ITEM_ENV_VARIABLES))
+        configure(Config(oh_item_names=('l1', 'l2', 'l3', 'overall', 'meter')))
+        self.assertEqual(SmartMeterValues.oh_item_names(), ('l1', 'l2', 'l3', 'overall', 'meter'))
+        self.assertEqual(SmartMeterValues(overall_consumption=100).overall_consumption.oh_item, 'overall')
+
+    def test_lazy_imports(self) -> None:
+        # the package can be imported without configuration, the dependencies of unused backends are not imported
+        code="import sys; import smart_meter_to_openhab.sml_iskra_mt175, smart_meter_to_openhab.multi_meter, smart_meter_to_openhab.pipeline; "\
+             "print(' '.join(module for module in ('numpy', 'serial', 'requests', 'http.server') if module in sys.modules))"
+        environ={key : value for key, value in os.environ.items() if key != 'OH_HOST' and not key.endswith('_OH_ITEM')}
+        output=subprocess.run([sys.executable, '-c', code], cwd=package_path, env=environ, capture_output=True, text=True, check=True)
+        self.assertEqual(output.stdout.strip(), '')
+
+if __name__ == '__main__':
+    try:
+        unittest.main()
+    except Exception as e:
+        logger.exception("Caught Exception: " + str(e))
+    except:
+        logger.exception("Caught unknow exception")
@@ -3,6 +3,7 @@ import logging
 import sys
 
 from smart_meter_to_openhab.interfaces import *
+from smart_meter_to_openhab.config import Config, configure, get_config
 
 logging.basicConfig(stream=sys.stdout, level=logging.ERROR)
 logger = logging.getLogger(__name__)
@@ -136,7 +137,10 @@ class TestInterfaces(unittest.TestCase):
         value_2=SmartMeterValues(6, 7, 8, 9, 10)
         self.assertEqual(id(value_1.phase_1_consumption.oh_item), id(value_2.phase_1_consumption.oh_item))
         self.assertNotEqual(id(value_1.phase_1_consumption.oh_item), id(value_2.phase_2_consumption.oh_item))
-        self.assertNotEqual(id(value_1.phase_1_consumption.value), id(value_2.phase_1_consumption.value))
+        # values are not shared (they are created from the storage of the container on access)
+        value_1.phase_1_consumption.value=11
+        self.assertEqual(value_1.phase_1_consumption.value, 11)
+        self.assertEqual(value_2.phase_1_consumption.value, 6)
 
     def test_create_from_persistence_values(self) -> None:
         smv_1=SmartMeterValues(1, 10, 100, 1000, 10000)
@@ -166,6 +170,25 @@ class TestInterfaces(unittest.TestCase):
         with self.assertRaises(Exception):
             create_from_persistence_values([[1,2,3],[4,5]])
 
+    def test_persistence_values_view(self) -> None:
+        pers_values : PersistenceValuesType = [[1, 2], [10, 20], [100, 200], [1000, 2000], [5, 5]]
+        view=PersistenceValuesView(pers_values)
+        self.assertEqual(len(view), 2)
+        self.assertEqual(view[1], SmartMeterValues(2, 20, 200, 2000, 5))
+        self.assertEqual(list(view), create_from_persistence_values(pers_values))
+        self.assertIs(view.column(3), pers_values[3])
+        self.assertTrue(view.is_updated())
+        self.assertEqual(len(PersistenceValuesView([])), 0)
+
+        # columns of unused items are not part of the persistence values
+        oh_item_names : SmartMeterOhItemNames = ('', '', '', SmartMeterValues.oh_item_names()[3], SmartMeterValues.oh_item_names()[4])
+        view=PersistenceValuesView([[1000, 2000], [5]], oh_item_names)
+        self.assertEqual(view.column(0), [])
+        self.assertEqual(view.column(4), [5])
+        self.assertEqual(view[0], SmartMeterValues(None, None, None, 1000, 5, oh_item_names))
+        with self.assertRaises(IndexError):
+            view[1]
+
     def test_convert_to_persistence_values(self) -> None:
         value_1=SmartMeterValues(1, 2, 3, 4, 5)
         value_2=SmartMeterValues(6, 7, 8, 9, 10)
@@ -182,6 +205,21 @@ class TestInterfaces(unittest.TestCase):
         pers_values=convert_to_persistence_values([value_1, value_2])
         self.assertEqual(pers_values,[[1,6], [2], [3], [4], [5,10]])
 
+    def test_persistence_values_round_trip(self) -> None:
+        # only the overall consumption and the electricity meter are used: one column per used item
+        config=get_config()
+        oh_item_names : SmartMeterOhItemNames = ('', '', '', config.oh_item_names[3], config.oh_item_names[4])
+        configure(Config(oh_item_names=oh_item_names))
+        try:
+            values=[SmartMeterValues(1, 2, 3, 4, 5), SmartMeterValues(6, 7, 8, 9, 10)]
+            pers_values=convert_to_persistence_values(values)
+            self.assertEqual(pers_values, [[4, 9], [5, 10]])
+            self.assertEqual(create_from_persistence_values(pers_values), [SmartMeterValues(None, None, None, 4, 5), SmartMeterValues(None, None, None, 9, 10)])
+            self.assertEqual(PersistenceValuesView(pers_values).column(4), [5, 10])
+            self.assertTrue(SmartMeterValues.check_if_updated(pers_values))
+        finally:
+            configure(config)
+
     def test_check_if_updated(self) -> None:
         invalid=SmartMeterValues()
         valid_no_electricity_meter=SmartMeterValues(100, 200, 300, 400, None)
@@ -0,0 +1,212 @@
+import unittest
+import logging
+import json
+import queue
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import List, Set
+
+from smart_meter_to_openhab.item_events import *
+from smart_meter_to_openhab.openhab import OpenhabConnection, ConnectionSettings
+from smart_meter_to_openhab.interfaces import OhItemAndValue
+from smart_meter_to_openhab import metrics
+
+logging.basicConfig(stream=sys.stdout, level=logging.ERROR)
+logger = logging.getLogger(__name__)
+
+def _state_event(item : str, state : str, event_type : str = 'ItemStateEvent') -> str:
+    topic='state' if event_type == 'ItemStateEvent' else event_type[len('Item'):-len('Event')].lower()
+    return json.dumps({'topic' : f"openhab/items/{item}/{topic}", 'type' : event_type,
+                       'payload' : json.dumps({'type' : 'Quantity', 'value' : state})})
+
+class _SseHandler(BaseHTTPRequestHandler):
+    server : '_SseOpenhabServer'
+    protocol_version='HTTP/1.1'
+
+    def do_GET(self) -> None:
+        if not self.path.startswith('/rest/events'):
+            self.send_error(404)
+            return
+        # subscribe before the response, so no events are missed
+        events=self.server.subscribe()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        self._write_chunk(": connected\n\n")
+        while True:
+            event=events.get()
+            if event is None:
+                self.wfile.write(b"0\r\n\r\n")
+                return
+            self._write_chunk(event)
+
+    def do_POST(self) -> None:
+        # POST /rest/items/<item>: openHAB updates the state and sends events
+        state=self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+        item=self.path.rsplit('/', 1)[-1]
+        if item not in self.server.silent_items:
+            self.server.publish(f"event: message\ndata: {_state_event(item, state+' W')}\n\n")
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _write_chunk(self, text : str) -> None:
+        data=text.encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode()+data+b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+class _SseOpenhabServer(ThreadingHTTPServer):
+    """openHAB that sends an ItemStateEvent on the event stream for each posted value (except for silent_items)"""
+    daemon_threads=True
+
+    def __init__(self) -> None:
+        super().__init__(('127.0.0.1', 0), _SseHandler)
+        self._lock=threading.Lock()
+        self._subscribers : List[queue.Queue] = []
+        self.silent_items : Set[str] = set()
+        self.subscription_count=0
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def subscribe(self) -> queue.Queue:
+        events : queue.Queue = queue.Queue()
+        with self._lock:
+            self._subscribers.append(events)
+            self.subscription_count+=1
+        return events
+
+    def publish(self, event : str) -> None:
+        with self._lock:
+            for events in self._subscribers:
+                events.put(event)
+
+    def disconnect_subscribers(self) -> None:
+        with self._lock:
+            for events in self._subscribers:
+                events.put(None)
+            self._subscribers=[]
+
+    def handle_error(self, request, client_address) -> None:
+        pass
+
+    def close(self) -> None:
+        self.disconnect_subscribers()
+        self.shutdown()
+        self.server_close()
+
+class _Clock():
+    def __init__(self) -> None:
+        self.now=0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def _wait_for(condition, timeout : float = 5) -> bool:
+    end=time.monotonic()+timeout
+    while not condition():
+        if time.monotonic() > end:
+            return False
+        time.sleep(0.01)
+    return True
+
+class TestItemEvents(unittest.TestCase):
+
+    def test_parse_event_stream(self) -> None:
+        lines=[': keep-alive', '', 'event: alive', 'data: 1', '', 'data: first', 'data:second', '', 'data: incomplete']
+        self.assertEqual(list(parse_event_stream(lines)), [('alive', '1'), ('message', 'first\nsecond')])
+
+    def test_parse_item_state_event(self) -> None:
+        self.assertEqual(parse_item_state_event(_state_event('power', '230.5 W')), ('power', '230.5 W'))
+        self.assertEqual(parse_item_state_event(_state_event('power', '230.5', 'ItemStateUpdatedEvent')), ('power', '230.5'))
+        command=json.dumps({'topic' : "openhab/items/power/command", 'type' : 'ItemCommandEvent', 'payload' : '{"type":"Decimal","value":"1"}'})
+        self.assertIsNone(parse_item_state_event(command))
+        self.assertIsNone(parse_item_state_event('no json'))
+        self.assertIsNone(parse_item_state_event('{"type": "ItemStateEvent"}'))
+
+    def test_tracker(self) -> None:
+        clock=_Clock()
+        tracker=DeliveryTracker(1, clock)
+        tracker.expect('power', '230.5')
+        tracker.expect('energy', '10.0')
+        tracker.expect('other', 'ON')
+        clock.now=0.25
+        # a different value (e.g. of an earlier post) does not confirm
+        self.assertIsNone(tracker.confirm('power', '100 W'))
+        self.assertEqual(tracker.confirm('power', '230.5 W'), 0.25)
+        self.assertIsNone(tracker.confirm('power', '230.5 W'))
+        self.assertEqual(tracker.confirm('other', 'ON'), 0.25)
+        tracker.expect('cancelled', '1.0')
+        tracker.cancel('cancelled', '1.0')
+        self.assertEqual(tracker.overdue_items(), {})
+        clock.now=1.5
+        self.assertEqual(tracker.overdue_items(), {'energy' : '10.0'})
+        self.assertEqual(tracker.overdue_items(), {})
+        self.assertEqual((tracker.confirmed_count, tracker.timeout_count, tracker.pending_count), (2, 1, 0))
+
+    def test_confirm_delivery(self) -> None:
+        server=_SseOpenhabServer()
+        server.silent_items={'lost'}
+        connection=OpenhabConnection(server.url, '', '', logger, settings=ConnectionSettings(delivery_timeout_sec=1))
+        tracker=connection.delivery_tracker
+        assert tracker is not None
+        self.assertTrue(connection._event_subscriber.connected.wait(5)) # type: ignore
+        delivered=metrics.DELIVERY_SECONDS.count
+        timeouts=metrics.DELIVERY_TIMEOUTS.get()
+        self.assertTrue(connection.post_to_items([OhItemAndValue('power', 230.5), OhItemAndValue('energy', 10), OhItemAndValue('lost', 1)]))
+        self.assertTrue(_wait_for(lambda: tracker.confirmed_count == 2))
+        self.assertEqual(metrics.DELIVERY_SECONDS.count-delivered, 2)
+        self.assertTrue(connection.check_if_delivered())
+        time.sleep(1)
+        self.assertFalse(connection.check_if_delivered())
+        self.assertEqual(metrics.DELIVERY_TIMEOUTS.get()-timeouts, 1)
+        self.assertEqual(tracker.pending_count, 0)
+        connection.close()
+        server.close()
+
+    def test_reconnect(self) -> None:
+        server=_SseOpenhabServer()
+        tracker=DeliveryTracker(10)
+        subscriber=ItemEventSubscriber(server.url, 'user', 'passwd', tracker, logger, reconnect_sec=0.01)
+        self.assertTrue(subscriber.connected.wait(5))
+        server.disconnect_subscribers()
+        self.assertTrue(_wait_for(lambda: server.subscription_count == 2))
+        tracker.expect('power', '1.0')
+        server.publish(f"data: {_state_event('power', '1.0')}\n\n")
+        self.assertTrue(_wait_for(lambda: tracker.confirmed_count == 1))
+        # closing does not wait for events
+        start=time.monotonic()
+        subscriber.close()
+        self.assertLess(time.monotonic()-start, 1)
+        server.close()
+
+    def test_read_timeout(self) -> None:
+        # a silent connection (e.g. half-open) is re-established
+        server=_SseOpenhabServer()
+        subscriber=ItemEventSubscriber(server.url, '', '', DeliveryTracker(10), logger, reconnect_sec=0.01, read_timeout_sec=0.2)
+        self.assertTrue(_wait_for(lambda: server.subscription_count >= 2))
+        subscriber.close()
+        server.close()
+
+    def test_not_enabled(self) -> None:
+        connection=OpenhabConnection('http://127.0.0.1:1', '', '', logger)
+        self.assertIsNone(connection.delivery_tracker)
+        with self.assertRaises(ValueError):
+            connection.check_if_delivered()
+        connection.close()
+
+if __name__ == '__main__':
+    try:
+        unittest.main()
+    except Exception as e:
+        logger.exception("Caught Exception: " + str(e))
+    except:
+        logger.exception("Caught unknow exception")
@@ -0,0 +1,75 @@
+import unittest
+import logging
+import sys
+import pathlib
+import urllib.request
+test_path = pathlib.Path(__file__).parent.absolute()
+
+from smart_meter_to_openhab.metrics import *
+from smart_meter_to_openhab import metrics
+from smart_meter_to_openhab.sml_iskra_mt175 import SmlIskraMt175OneWay
+from smart_meter_to_openhab.transport import ReplayTransport, load_sml_dumps
+
+logging.basicConfig(stream=sys.stdout, level=logging.ERROR)
+logger = logging.getLogger(__name__)
+
+class TestMetrics(unittest.TestCase):
+
+    def test_render(self) -> None:
+        registry=MetricsRegistry()
+        counter=registry.counter('frames', "Frames.")
+        rejected=registry.counter('rejected', "Rejected frames.", ('reason',))
+        gauge=registry.gauge('depth', "Queue depth.")
+        histogram=registry.histogram('latency_seconds', "Latency.", (0.1, 1))
+        counter.inc()
+        counter.inc(amount=2)
+        rejected.inc('corrupt')
+        rejected.inc('in"valid')
+        histogram.observe(0.05)
+        histogram.observe(0.1)
+        histogram.observe(0.5)
+        histogram.observe(3)
+        self.assertEqual(registry.render(), 
+            '# TYPE frames counter\n# HELP frames Frames.\nframes_total 3\n'
+            '# TYPE rejected counter\n# HELP rejected Rejected frames.\nrejected_total{reason="corrupt"} 1\nrejected_total{reason="in\\"valid"} 1\n'
+            '# TYPE depth gauge\n# HELP depth Queue depth.\n'
+            '# TYPE latency_seconds histogram\n# HELP latency_seconds Latency.\n'
+            'latency_seconds_bucket{le="0.1"} 2\nlatency_seconds_bucket{le="1"} 3\nlatency_seconds_bucket{le="+Inf"} 4\n'
+            'latency_seconds_count 4\nlatency_seconds_sum 3.65\n# EOF\n')
+        gauge.set_function(lambda: 7)
+        self.assertIn('depth 7\n', registry.render())
+        with self.assertRaises(ValueError):
+            registry.gauge('depth', "Duplicate.")
+
+    def test_server(self) -> None:
+        registry=MetricsRegistry()
+        registry.counter('frames', "Frames.").inc()
+        server=MetricsServer(0, registry=registry)
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics") as response:
+                self.assertEqual(response.headers['Content-Type'], OPENMETRICS_CONTENT_TYPE)
+                self.assertIn('frames_total 1\n', response.read().decode())
+        finally:
+            server.close()
+
+    def test_read_metrics(self) -> None:
+        received=metrics.FRAMES_RECEIVED.get()
+        corrupt=metrics.FRAMES_REJECTED.get('corrupt')
+        decode_count=metrics.FRAME_DECODE_SECONDS.count
+        frames=load_sml_dumps(test_path / 'data' / 'iskra_mt175_valid.sml')
+        # the second frame is corrupt (CRC mismatch)
+        transport=ReplayTransport(frames+[frames[0][:-1]+bytes((frames[0][-1] ^ 0xff,))], speedup=0, loop=False)
+        reader=SmlIskraMt175OneWay(transport, logger)
+        reader._read_raw()
+        reader._read_raw()
+        self.assertEqual(metrics.FRAMES_RECEIVED.get()-received, 2)
+        self.assertEqual(metrics.FRAMES_REJECTED.get('corrupt')-corrupt, 1)
+        self.assertEqual(metrics.FRAME_DECODE_SECONDS.count-decode_count, 2)
+
+if __name__ == '__main__':
+    try:
+        unittest.main()
+    except Exception as e:
+        logger.exception("Caught Exception: " + str(e))
+    except:
+        logger.exception("Caught unknow exception")
@@ -0,0 +1,242 @@
+import unittest
+import logging
+import json
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+from typing import List, Tuple
+
+from smart_meter_to_openhab.mqtt import MqttConnection, MqttSettings, read_packet, encode_packet, encode_publish, decode_publish, encode_connect, \
+    CONNECT, CONNACK, PUBLISH, PUBACK, PINGREQ, PINGRESP, DISCONNECT
+from smart_meter_to_openhab.interfaces import OhItemAndValue
+from smart_meter_to_openhab import metrics
+
+logging.basicConfig(stream=sys.stdout, level=logging.ERROR)
+logger = logging.getLogger(__name__)
+
+class _BrokerHandler(socketserver.BaseRequestHandler):
+    server : '_Broker'
+
+    def handle(self) -> None:
+        self.server.add_client(self.request)
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            while True:
+                packet_type, flags, body=read_packet(self.request)
+                if packet_type == CONNECT:
+                    self.server.connects.append(body)
+                    self.request.sendall(encode_packet(CONNACK, 0, bytes([0, self.server.connack_code])))
+                elif packet_type == PUBLISH:
+                    topic, payload, qos, retain, packet_id=decode_publish(flags, body)
+                    with self.server.lock:
+                        self.server.messages.append((topic, payload.decode(), qos, retain))
+                    if qos and self.server.ack:
+                        self.request.sendall(encode_packet(PUBACK, 0, struct.pack('!H', packet_id)))
+                elif packet_type == PINGREQ:
+                    self.server.ping_count+=1
+                    if self.server.ping_response:
+                        self.request.sendall(encode_packet(PINGRESP, 0, b''))
+                elif packet_type == DISCONNECT:
+                    return
+        except OSError:
+            return
+
+class _Broker(socketserver.ThreadingTCPServer):
+    """MQTT broker stand-in that records the published messages. Acknowledgements and connections can be withheld."""
+    daemon_threads=True
+    allow_reuse_address=True
+
+    def __init__(self, port : int = 0) -> None:
+        super().__init__(('127.0.0.1', port), _BrokerHandler)
+        self.lock=threading.Lock()
+        self.messages : List[Tuple[str, str, int, bool]] = []
+        self.connects : List[bytes] = []
+        self.ack=True
+        self.connack_code=0
+        self.ping_count=0
+        self.ping_response=True
+        self._clients : List[socket.socket] = []
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def add_client(self, sock : socket.socket) -> None:
+        with self.lock:
+            self._clients.append(sock)
+
+    def drop_clients(self) -> None:
+        with self.lock:
+            for sock in self._clients:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            self._clients=[]
+
+    def close(self) -> None:
+        self.drop_clients()
+        self.shutdown()
+        self.server_close()
+
+def _unused_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def _values(*values : float) -> List[OhItemAndValue]:
+    return [OhItemAndValue(f'item_{index}', value) for index, value in enumerate(values)]
+
+def _wait_for(condition, timeout : float = 5) -> bool:
+    end=time.monotonic()+timeout
+    while not condition():
+        if time.monotonic() > end:
+            return False
+        time.sleep(0.01)
+    return True
+
+class TestMqttPackets(unittest.TestCase):
+
+    def test_remaining_length(self) -> None:
+        for size in (0, 127, 128, 16383, 16384, 200000):
+            packet=encode_packet(PUBLISH, 0, bytes(size))
+            server, client=socket.socketpair()
+            threading.Thread(target=client.sendall, args=(packet,)).start()
+            self.assertEqual(read_packet(server), (PUBLISH, 0, bytes(size)))
+            server.close()
+            client.close()
+        self.assertEqual(encode_packet(PUBLISH, 0, bytes(321))[:3], bytes([0x30, 0xc1, 0x02]))
+
+    def test_publish(self) -> None:
+        packet=encode_publish('smart_meter/power', b'230.5', qos=1, retain=True, packet_id=258)
+        self.assertEqual(packet[0], 0x33)
+        self.assertEqual(decode_publish(packet[0] & 0x0f, packet[2:]), ('smart_meter/power', b'230.5', 1, True, 258))
+        packet=encode_publish('t', b'1')
+        self.assertEqual(packet, bytes([0x30, 4, 0, 1])+b't1')
+
+    def test_connect(self) -> None:
+        body=encode_connect('client', 60, 'user', 'passwd')[2:]
+        self.assertEqual(body[:10], b'\x00\x04MQTT\x04\xc2\x00\x3c')
+        self.assertEqual(body[10:], b'\x00\x06client\x00\x04user\x00\x06passwd')
+        self.assertEqual(encode_connect('client', 60)[9], 0x02)
+
+class TestMqttConnection(unittest.TestCase):
+
+    def test_publish_retained(self) -> None:
+        broker=_Broker()
+        connection=MqttConnection('127.0.0.1', broker.port, '', '', logger, MqttSettings(topic_prefix='meter', packed_topic='meter/reading'))
+        self.assertTrue(connection.post_to_items(_values(100, 200) + [OhItemAndValue('none'), OhItemAndValue('', 1)]))
+        self.assertTrue(_wait_for(lambda: len(broker.messages) == 3))
+        self.assertEqual(broker.messages[:2], [('meter/item_0', '100.0', 0, True), ('meter/item_1', '200.0', 0, True)])
+        topic, payload, _, _=broker.messages[2]
+        self.assertEqual(topic, 'meter/reading')
+        self.assertEqual(json.loads(payload)['values'], {'item_0' : '100.0', 'item_1' : '200.0'})
+        connection.close()
+        self.assertEqual(len(broker.connects), 1)
+        broker.close()
+
+    def test_qos1(self) -> None:
+        broker=_Broker()
+        connection=MqttConnection('127.0.0.1', broker.port, '', '', logger, MqttSettings(qos=1, ack_timeout_sec=0.2, reconnect_sec=0))
+        self.assertTrue(connection.post_to_items(_values(1, 2)))
+        self.assertEqual(connection.last_failed_items, set())
+        broker.ack=False
+        self.assertFalse(connection.post_to_items(_values(3, 4)))
+        self.assertEqual(connection.last_failed_items, {'item_0', 'item_1'})
+        self.assertEqual(metrics.MQTT_PENDING.get(), 2)
+        # the messages that have not been acknowledged are published again after reconnecting
+        broker.ack=True
+        broker.drop_clients()
+        self.assertTrue(_wait_for(lambda: not connection.connected))
+        self.assertTrue(connection.post_to_items(_values(5)))
+        self.assertEqual(len(broker.connects), 2)
+        with broker.lock:
+            self.assertEqual([payload for _, payload, _, _ in broker.messages], ['1.0', '2.0', '3.0', '4.0', '3.0', '4.0', '5.0'])
+        self.assertEqual(metrics.MQTT_PENDING.get(), 0)
+        connection.close()
+        broker.close()
+
+    def test_inflight_bound(self) -> None:
+        broker=_Broker()
+        broker.ack=False
+        connection=MqttConnection('127.0.0.1', broker.port, '', '', logger, MqttSettings(qos=1, ack_timeout_sec=0.05, reconnect_sec=0, buffer_size=3))
+        for value in range(4):
+            self.assertFalse(connection.post_to_items(_values(value)))
+        # the oldest messages that have not been acknowledged are dropped
+        self.assertEqual(metrics.MQTT_PENDING.get(), 3)
+        self.assertEqual(connection.dropped_count, 1)
+        broker.ack=True
+        broker.drop_clients()
+        self.assertTrue(_wait_for(lambda: not connection.connected))
+        self.assertTrue(connection.post_to_items(_values(4)))
+        with broker.lock:
+            self.assertEqual([payload for _, payload, _, _ in broker.messages][4:], ['1.0', '2.0', '3.0', '4.0'])
+        connection.close()
+        broker.close()
+
+    def test_reconnect_buffer(self) -> None:
+        port=_unused_port()
+        connection=MqttConnection('127.0.0.1', port, '', '', logger, MqttSettings(reconnect_sec=0, buffer_size=3))
+        self.assertFalse(connection.post_to_items(_values(1, 2)))
+        self.assertEqual(connection.last_failed_items, {'item_0', 'item_1'})
+        self.assertFalse(connection.post_to_items(_values(3, 4)))
+        self.assertEqual(connection.dropped_count, 1)
+        broker=_Broker(port)
+        # the buffered messages are published first
+        self.assertTrue(connection.post_to_items(_values(5)))
+        self.assertTrue(_wait_for(lambda: len(broker.messages) == 4))
+        self.assertEqual([payload for _, payload, _, _ in broker.messages], ['2.0', '3.0', '4.0', '5.0'])
+        connection.close()
+        broker.close()
+
+    def test_reconnect_interval(self) -> None:
+        port=_unused_port()
+        connection=MqttConnection('127.0.0.1', port, '', '', logger, MqttSettings(reconnect_sec=60))
+        self.assertFalse(connection.post_to_items(_values(1)))
+        broker=_Broker(port)
+        # no connection attempt within the reconnect interval
+        self.assertFalse(connection.post_to_items(_values(2)))
+        self.assertEqual(broker.connects, [])
+        connection.close()
+        broker.close()
+
+    def test_connection_refused(self) -> None:
+        broker=_Broker()
+        broker.connack_code=5
+        connection=MqttConnection('127.0.0.1', broker.port, 'user', 'wrong', logger)
+        self.assertFalse(connection.post_to_items(_values(1)))
+        self.assertFalse(connection.connected)
+        self.assertEqual(broker.messages, [])
+        connection.close()
+        broker.close()
+
+    def test_keepalive(self) -> None:
+        broker=_Broker()
+        connection=MqttConnection('127.0.0.1', broker.port, '', '', logger, MqttSettings(keepalive_sec=1))
+        self.assertTrue(connection.post_to_items(_values(1)))
+        self.assertTrue(_wait_for(lambda: broker.ping_count > 0, 3))
+        self.assertTrue(connection.connected)
+        connection.close()
+        broker.close()
+
+    def test_missing_pingresp(self) -> None:
+        broker=_Broker()
+        broker.ping_response=False
+        connection=MqttConnection('127.0.0.1', broker.port, '', '', logger, MqttSettings(keepalive_sec=1))
+        self.assertTrue(connection.post_to_items(_values(1)))
+        # the connection is closed if the broker does not respond within the keepalive
+        self.assertTrue(_wait_for(lambda: not connection.connected, 4))
+        connection.close()
+        broker.close()
+
+if __name__ == '__main__':
+    try:
+        unittest.main()
+    except Exception as e:
+        logger.exception("Caught Exception: " + str(e))
+    except:
+        logger.exception("Caught unknow exception")
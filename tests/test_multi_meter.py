@@ -0,0 +1,82 @@
+import unittest
+import logging
+import sys
+import os
+import tempfile
+import pathlib
+from pathlib import Path
+test_path = pathlib.Path(__file__).parent.absolute()
+
+from smart_meter_to_openhab.interfaces import SmartMeterValues, SmartMeterOhItemNames
+from smart_meter_to_openhab.multi_meter import *
+from smart_meter_to_openhab.transport import load_sml_dumps
+
+logging.basicConfig(stream=sys.stdout, level=logging.ERROR)
+logger = logging.getLogger(__name__)
+
+HOUSE_ITEMS : SmartMeterOhItemNames = ('house_l1', 'house_l2', 'house_l3', 'house_overall', 'house_meter')
+HEAT_PUMP_ITEMS : SmartMeterOhItemNames = ('', '', '', 'heat_pump_overall', 'heat_pump_meter')
+
+class TestMultiMeter(unittest.TestCase):
+
+    def test_load_meter_configs(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            config_file=Path(tmp_dir, 'meters.ini')
+            config_file.write_text("[house]\nserial_port = /dev/ttyUSB0\nphase_1_consumption = house_l1\nelectricity_meter = house_meter\n"
+                                   "[heat_pump]\nreplay = tests/data\nreplay_speedup = 10\noverall_consumption = heat_pump_overall\n")
+            configs=load_meter_configs(config_file)
+            self.assertEqual(configs[0], MeterConfig('house', ('house_l1', '', '', '', 'house_meter'), '/dev/ttyUSB0'))
+            self.assertEqual(configs[1], MeterConfig('heat_pump', ('', '', '', 'heat_pump_overall', ''), None, Path('tests/data'), 10))
+            for invalid_config in ("[house]\nphase_1_consumption = house_l1\n", 
+                                   "[house]\nserial_port = /dev/ttyUSB0\n",
+                                   "[house]\nserial_port = /dev/ttyUSB0\nunknown = 1\n"):
+                config_file.write_text(invalid_config)
+                with self.assertRaises(ValueError):
+                    load_meter_configs(config_file)
+
+    def test_read_replays(self) -> None:
+        configs=[MeterConfig('house', HOUSE_ITEMS, replay=test_path / 'data' / 'iskra_mt175_valid.sml', replay_speedup=0),
+                 MeterConfig('heat_pump', HEAT_PUMP_ITEMS, replay=test_path / 'data', replay_speedup=0)]
+        reader=MultiMeterReader(configs, logger, window_sec=100, emit_frame_count=3, poll_interval_sec=0.001)
+        stream=reader.read()
+        results={name : values for name, values in (next(stream) for _ in range(4))}
+        reader.close()
+        self.assertEqual(results['house'], SmartMeterValues(131, 19, 13, 163, 18999.0194, HOUSE_ITEMS))
+        self.assertEqual(results['house'].overall_consumption.oh_item, 'house_overall')
+        # only the configured items of the heat pump are posted
+        self.assertEqual(len(results['heat_pump'].value_list()), 2)
+        self.assertEqual(results['heat_pump'].overall_consumption.oh_item, 'heat_pump_overall')
+
+    def test_read_serial_ports(self) -> None:
+        import tty
+        master, slave=os.openpty()
+        tty.setraw(slave)
+        frame=load_sml_dumps(test_path / 'data' / 'iskra_mt175_valid.sml')[0]
+        try:
+            configs=[MeterConfig('house', HOUSE_ITEMS, serial_port=os.ttyname(slave)),
+                     MeterConfig('heat_pump', HEAT_PUMP_ITEMS, replay=test_path / 'data' / 'iskra_mt175_valid.sml', replay_speedup=0)]
+            reader=MultiMeterReader(configs, logger, window_sec=100, emit_frame_count=2, poll_interval_sec=0.001)
+            stream=reader.read()
+            self.assertEqual(next(stream)[0], 'heat_pump')
+            os.write(master, frame+frame)
+            name, values=next(stream)
+            while name != 'house':
+                name, values=next(stream)
+            self.assertEqual(values, SmartMeterValues(131, 19, 13, 163, 18999.0194, HOUSE_ITEMS))
+            reader.close()
+        finally:
+            os.close(master)
+            os.close(slave)
+
+    def test_unique_names(self) -> None:
+        config=MeterConfig('house', HOUSE_ITEMS, replay=test_path / 'data', replay_speedup=0)
+        with self.assertRaises(ValueError):
+            MultiMeterReader([config, config], logger, window_sec=1)
+
+if __name__ == '__main__':
+    try:
+        unittest.main()
+    except Exception as e:
+        logger.exception("Caught Exception: " + str(e))
+    except:
+        logger.exception("Caught unknow exception")
@@ -0,0 +1,122 @@
+import unittest
+import logging
+import sys
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from smart_meter_to_openhab.interfaces import *
+from smart_meter_to_openhab.outbox import *
+
+logging.basicConfig(stream=sys.stdout, level=logging.ERROR)
+logger = logging.getLogger(__name__)
+
+class TestOutbox(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self._tmp_dir=tempfile.TemporaryDirectory()
+        self._db_file=Path(self._tmp_dir.name, 'outbox.db')
+
+    def tearDown(self) -> None:
+        self._tmp_dir.cleanup()
+
+    def test_append_and_replay(self) -> None:
+        written : Dict[str, List[Tuple[datetime, float]]] = {}
+        def _write(item : str, values : List[Tuple[datetime, float]], deadline : Optional[float]) -> int:
+            written.setdefault(item, []).extend(values)
+            return len(values)
+        timestamp=datetime(2024, 1, 1, 12, 0, 0).astimezone()
+        outbox=PersistenceOutbox(self._db_file, logger)
+        outbox.append(timestamp, [OhItemAndValue('item_1', 1), OhItemAndValue('item_2', 2), OhItemAndValue('item_3')])
+        outbox.append(timestamp+timedelta(seconds=1), [OhItemAndValue('item_1', 3)])
+        self.assertEqual(len(outbox), 3)
+        self.assertEqual(outbox.replay(_write), 3)
+        self.assertEqual(len(outbox), 0)
+        self.assertEqual(written, {'item_1' : [(timestamp, 1), (timestamp+timedelta(seconds=1), 3)], 'item_2' : [(timestamp, 2)]})
+        outbox.close()
+
+    def test_failed_replay_is_kept(self) -> None:
+        outbox=PersistenceOutbox(self._db_file, logger)
+        outbox.append(datetime.now().astimezone(), [OhItemAndValue('item_1', 1), OhItemAndValue('item_2', 2)])
+        self.assertEqual(outbox.replay(lambda item, values, deadline: len(values) if item == 'item_1' else 0), 1)
+        self.assertEqual(len(outbox), 1)
+        outbox.close()
+
+    def test_partial_replay(self) -> None:
+        # only the values that have been written are removed
+        start=datetime.now().astimezone()
+        outbox=PersistenceOutbox(self._db_file, logger)
+        for i in range(5):
+            outbox.append(start+timedelta(seconds=i), [OhItemAndValue('item_1', i)])
+        self.assertEqual(outbox.replay(lambda item, values, deadline: 2), 2)
+        self.assertEqual(len(outbox), 3)
+        written : List[float] = []
+        def _write(item : str, values : List[Tuple[datetime, float]], deadline : Optional[float]) -> int:
+            written.extend(state for _, state in values)
+            return len(values)
+        self.assertEqual(outbox.replay(_write), 3)
+        self.assertEqual(written, [2, 3, 4])
+        outbox.close()
+
+    def test_replay_budget(self) -> None:
+        outbox=PersistenceOutbox(self._db_file, logger)
+        outbox.append(datetime.now().astimezone(), [OhItemAndValue('item_1', 1), OhItemAndValue('item_2', 2)])
+        deadlines : List[Optional[float]] = []
+        def _write(item : str, values : List[Tuple[datetime, float]], deadline : Optional[float]) -> int:
+            deadlines.append(deadline)
+            return len(values)
+        # the budget is exceeded before the first item
+        self.assertEqual(outbox.replay(_write, budget_sec=0), 0)
+        self.assertEqual(len(outbox), 2)
+        self.assertEqual(outbox.replay(_write, budget_sec=10), 2)
+        self.assertEqual(len(deadlines), 2)
+        self.assertIsNotNone(deadlines[0])
+        outbox.close()
+
+    def test_replay_in_background(self) -> None:
+        outbox=PersistenceOutbox(self._db_file, logger)
+        outbox.append(datetime.now().astimezone(), [OhItemAndValue('item_1', 1)])
+        release=threading.Event()
+        def _write(item : str, values : List[Tuple[datetime, float]], deadline : Optional[float]) -> int:
+            release.wait(10)
+            return len(values)
+        self.assertTrue(outbox.replay_in_background(_write))
+        # a single replay at a time
+        self.assertFalse(outbox.replay_in_background(_write))
+        release.set()
+        outbox.close()
+        self.assertEqual(len(outbox), 0)
+
+    def test_survives_restart(self) -> None:
+        outbox=PersistenceOutbox(self._db_file, logger)
+        outbox.append(datetime.now().astimezone(), [OhItemAndValue('item_1', 1)])
+        outbox.close()
+        outbox=PersistenceOutbox(self._db_file, logger)
+        self.assertEqual(len(outbox), 1)
+        outbox.close()
+
+    def test_bounds(self) -> None:
+        outbox=PersistenceOutbox(self._db_file, logger, max_entries=3, max_age=timedelta(hours=1))
+        start=datetime.now().astimezone()
+        for i in range(5):
+            outbox.append(start+timedelta(seconds=i), [OhItemAndValue('item_1', i)])
+        self.assertEqual(len(outbox), 3)
+        outbox.append(start+timedelta(hours=2), [OhItemAndValue('item_1', 5)])
+        self.assertEqual(len(outbox), 1)
+        written : List[float] = []
+        def _write(item : str, values : List[Tuple[datetime, float]], deadline : Optional[float]) -> int:
+            written.extend(state for _, state in values)
+            return len(values)
+        outbox.replay(_write)
+        self.assertEqual(written, [5])
+        outbox.close()
+
+if __name__ == '__main__':
+    try:
+        unittest.main()
+    except Exception as e:
+        logger.exception("Caught Exception: " + str(e))
+    except:
+        logger.exception("Caught unknow exception")
@@ -0,0 +1,99 @@
+import unittest
+import logging
+import sys
+import pathlib
+
+from smart_meter_to_openhab.outlier_filter import *
+from smart_meter_to_openhab.interfaces import SmartMeterValues
+from smart_meter_to_openhab.sml_iskra_mt175 import _decode_sml_iskra_mt175_one_way
+test_path = pathlib.Path(__file__).parent.absolute()
+
+logging.basicConfig(stream=sys.stdout, level=logging.ERROR)
+logger = logging.getLogger(__name__)
+
+OH_ITEM_NAMES=('phase_1', 'phase_2', 'phase_3', 'overall', 'meter')
+
+class TestHampelFilter(unittest.TestCase):
+
+    def test_spike(self) -> None:
+        hampel=HampelFilter(window=9, threshold=5, min_deviation=50, min_count=3)
+        # too few values to decide
+        self.assertTrue(all(hampel.accept(value) for value in (200, 190, 210)))
+        self.assertTrue(all(hampel.accept(value) for value in (205, 195, 215, 240)))
+        self.assertFalse(hampel.accept(3000))
+        self.assertFalse(hampel.accept(0))
+        self.assertTrue(hampel.accept(210))
+        # small changes are accepted, even if the load was constant (MAD 0)
+        constant=HampelFilter(window=9, threshold=5, min_deviation=50)
+        self.assertTrue(all(constant.accept(100) for _ in range(9)))
+        self.assertTrue(constant.accept(140))
+        self.assertFalse(constant.accept(160))
+
+    def test_level_shift(self) -> None:
+        hampel=HampelFilter(window=15, threshold=5, min_deviation=50, level_shift_count=2)
+        self.assertTrue(all(hampel.accept(value) for value in (200, 202, 198, 201)*3))
+        # a kettle is switched on: accepted with the second value of the new level
+        self.assertFalse(hampel.accept(2200))
+        self.assertTrue(hampel.accept(2210))
+        self.assertTrue(hampel.accept(2190))
+        self.assertTrue(hampel.accept(2205))
+        self.assertFalse(hampel.accept(200))
+        # two outliers that are not close to each other are no new level
+        self.assertFalse(hampel.accept(5000))
+        self.assertTrue(hampel.accept(2200))
+
+class TestMonotonicCounterFilter(unittest.TestCase):
+
+    def test_rate(self) -> None:
+        counter=MonotonicCounterFilter(max_power_w=36000, tolerance_kwh=0.001)
+        self.assertTrue(counter.accept(1000, 0))
+        self.assertTrue(counter.accept(1000, 1))
+        # at most 10 Wh per second (plus tolerance)
+        self.assertTrue(counter.accept(1000.011, 2))
+        self.assertFalse(counter.accept(1000.1, 3))
+        self.assertTrue(counter.accept(1000.1, 20))
+        self.assertFalse(counter.accept(1000.09, 21))
+        self.assertFalse(counter.accept(2000.1, 22))
+        self.assertTrue(counter.accept(1000.1, 23))
+
+    def test_reanchor(self) -> None:
+        # the first value is an outlier. The following values are plausible among each other.
+        counter=MonotonicCounterFilter(max_power_w=36000, tolerance_kwh=0.001, reanchor_count=3)
+        self.assertTrue(counter.accept(90000, 0))
+        self.assertFalse(counter.accept(1000, 1))
+        self.assertFalse(counter.accept(1000.001, 2))
+        self.assertTrue(counter.accept(1000.002, 3))
+        self.assertTrue(counter.accept(1000.003, 4))
+        self.assertFalse(counter.accept(90000, 5))
+
+class TestStreamingOutlierFilter(unittest.TestCase):
+
+    def test_per_channel(self) -> None:
+        outlier_filter=StreamingOutlierFilter(OutlierFilterSettings(min_count=3))
+        for second in range(5):
+            self.assertEqual(outlier_filter.filter(SmartMeterValues(100, 50, None, 150, 100+second*0.001, OH_ITEM_NAMES), second), {})
+        values=SmartMeterValues(100, 2000, None, 150, 99, OH_ITEM_NAMES)
+        self.assertEqual(outlier_filter.filter(values, 5), {'phase_2_consumption' : 2000, 'electricity_meter' : 99})
+        self.assertEqual(values, SmartMeterValues(100, None, None, 150, None, OH_ITEM_NAMES))
+        self.assertEqual(outlier_filter.rejected_counts, {'phase_1_consumption' : 0, 'phase_2_consumption' : 1, 'phase_3_consumption' : 0, 
+                                                          'overall_consumption' : 0, 'electricity_meter' : 1})
+
+    def test_sml_dumps(self) -> None:
+        # the outlier dump of the smart meter (overall consumption 0 and a lower electricity meter) between valid reads
+        def _load(name : str) -> SmartMeterValues:
+            with open(test_path / 'data' / name, 'r') as f:
+                return _decode_sml_iskra_mt175_one_way(bytes.fromhex(f.read()), OH_ITEM_NAMES)
+        outlier_filter=StreamingOutlierFilter()
+        for second in range(5):
+            self.assertEqual(outlier_filter.filter(_load('iskra_mt175_valid.sml'), second), {})
+        outliers=outlier_filter.filter(_load('iskra_mt175_outlier.sml'), 5)
+        self.assertEqual(set(outliers), {'phase_1_consumption', 'overall_consumption', 'electricity_meter'})
+        self.assertEqual(outlier_filter.filter(_load('iskra_mt175_valid.sml'), 6), {})
+
+if __name__ == '__main__':
+    try:
+        unittest.main()
+    except Exception as e:
+        logger.exception("Caught Exception: " + str(e))
+    except:
+        logger.exception("Caught unknow exception")
@@ -0,0 +1,115 @@
+import unittest
+import logging
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+from smart_meter_to_openhab.persistence_cache import PersistenceWindowCache
+
+logging.basicConfig(stream=sys.stdout, level=logging.ERROR)
+logger = logging.getLogger(__name__)
+
+class FakePersistence():
+    def __init__(self, delay_sec : float = 0) -> None:
+        self.values : List[Tuple[int, float]] = []
+        self.requests : List[Tuple[str, datetime, datetime]] = []
+        self.fail=False
+        self._delay_sec=delay_sec
+        self._lock=threading.Lock()
+
+    def fetch(self, oh_item : str, start_time : datetime, end_time : datetime) -> Optional[List[Tuple[int, float]]]:
+        with self._lock:
+            self.requests.append((oh_item, start_time, end_time))
+        time.sleep(self._delay_sec)
+        if self.fail:
+            return None
+        start_ms, end_ms=int(start_time.timestamp()*1000), int(end_time.timestamp()*1000)
+        return [(t, state) for t, state in self.values if start_ms <= t <= end_ms]
+
+class TestPersistenceCache(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self._start=datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    def _add_values(self, persistence : FakePersistence, first_sec : int, last_sec : int) -> None:
+        start_ms=int(self._start.timestamp()*1000)
+        persistence.values.extend((start_ms+sec*1000, float(sec)) for sec in range(first_sec, last_sec+1))
+
+    def test_incremental_fetch(self) -> None:
+        persistence=FakePersistence()
+        cache=PersistenceWindowCache(persistence.fetch)
+        self._add_values(persistence, 0, 60)
+        values=cache.get_values(('item_1', '', 'item_2'), self._start, self._start+timedelta(seconds=60))
+        self.assertEqual(values, [[float(i) for i in range(61)]]*2)
+        self.assertEqual(persistence.requests[0][1], self._start)
+
+        self._add_values(persistence, 61, 90)
+        values=cache.get_values(('item_1',), self._start+timedelta(seconds=30), self._start+timedelta(seconds=90))
+        self.assertEqual(values, [[float(i) for i in range(30, 91)]])
+        # only the delta since the latest known value is requested
+        self.assertEqual(persistence.requests[-1][1], self._start+timedelta(seconds=60))
+        self.assertEqual(cache.fetch_count, 3)
+        self.assertEqual(cache.fetched_value_count, 61+61+31)
+        cache.close()
+
+    def test_refetch(self) -> None:
+        persistence=FakePersistence()
+        cache=PersistenceWindowCache(persistence.fetch)
+        self._add_values(persistence, 0, 60)
+        cache.get_values(('item_1',), self._start+timedelta(seconds=30), self._start+timedelta(seconds=60))
+        # the window moved backwards
+        values=cache.get_values(('item_1',), self._start, self._start+timedelta(seconds=60))
+        self.assertEqual(values, [[float(i) for i in range(61)]])
+        self.assertEqual(persistence.requests[-1][1], self._start)
+        cache.invalidate('item_1')
+        cache.get_values(('item_1',), self._start, self._start+timedelta(seconds=60))
+        self.assertEqual(persistence.requests[-1][1], self._start)
+        self.assertEqual(cache.fetch_count, 3)
+        cache.close()
+
+    def test_invalidate_during_fetch(self) -> None:
+        persistence=FakePersistence()
+        cache=PersistenceWindowCache(persistence.fetch)
+        self._add_values(persistence, 0, 60)
+        cache.get_values(('item_1',), self._start, self._start+timedelta(seconds=30))
+        def _fetch(oh_item : str, start_time : datetime, end_time : datetime) -> Optional[List[Tuple[int, float]]]:
+            # e.g. the outbox writes values into the past while the delta is fetched
+            cache.invalidate(oh_item)
+            return persistence.fetch(oh_item, start_time, end_time)
+        cache._fetch=_fetch
+        values=cache.get_values(('item_1',), self._start, self._start+timedelta(seconds=60))
+        self.assertEqual(values, [[float(i) for i in range(61)]])
+        # the window fetched before the invalidation is not cached
+        cache._fetch=persistence.fetch
+        cache.get_values(('item_1',), self._start, self._start+timedelta(seconds=60))
+        self.assertEqual(persistence.requests[-1][1], self._start)
+        cache.close()
+
+    def test_failed_fetch(self) -> None:
+        persistence=FakePersistence()
+        cache=PersistenceWindowCache(persistence.fetch)
+        self._add_values(persistence, 0, 10)
+        persistence.fail=True
+        self.assertEqual(cache.get_values(('item_1',), self._start, self._start+timedelta(seconds=10)), [[]])
+        persistence.fail=False
+        self.assertEqual(cache.get_values(('item_1',), self._start, self._start+timedelta(seconds=10)), [[float(i) for i in range(11)]])
+        cache.close()
+
+    def test_parallel_fetch(self) -> None:
+        persistence=FakePersistence(delay_sec=0.1)
+        cache=PersistenceWindowCache(persistence.fetch, max_workers=5)
+        start=time.perf_counter()
+        values=cache.get_values(('item_1', 'item_2', 'item_3', 'item_4', 'item_5'), self._start, self._start+timedelta(seconds=10))
+        self.assertLess(time.perf_counter()-start, 0.3)
+        self.assertEqual(values, [[]]*5)
+        cache.close()
+
+if __name__ == '__main__':
+    try:
+        unittest.main()
+    except Exception as e:
+        logger.exception("Caught Exception: " + str(e))
+    except:
+        logger.exception("Caught unknow exception")
@@ -0,0 +1,86 @@
+import unittest
+import logging
+import sys
+import time
+from typing import List, Optional
+
+from smart_meter_to_openhab.interfaces import *
+from smart_meter_to_openhab.pipeline import *
+
+logging.basicConfig(stream=sys.stdout, level=logging.ERROR)
+logger = logging.getLogger(__name__)
+
+class TestPipeline(unittest.TestCase):
+
+    def test_queue_drop_oldest(self) -> None:
+        queue=BoundedValueQueue(2, 'drop_oldest')
+        for i in range(1, 4):
+            queue.put(SmartMeterValues(i, i, i, i, i))
+        self.assertEqual(len(queue), 2)
+        self.assertEqual(queue.dropped_count, 1)
+        self.assertEqual(queue.get(), SmartMeterValues(2, 2, 2, 2, 2))
+        self.assertEqual(queue.get(), SmartMeterValues(3, 3, 3, 3, 3))
+        self.assertIsNone(queue.get(timeout=0.01))
+
+    def test_queue_coalesce(self) -> None:
+        queue=BoundedValueQueue(2, 'coalesce')
+        queue.put(SmartMeterValues(1, 1, 1, 1, 1))
+        queue.put(SmartMeterValues(2, 2, 2, 2, 2))
+        queue.put(SmartMeterValues(3, None, 3, 3, 3))
+        self.assertEqual(queue.coalesced_count, 1)
+        self.assertEqual(queue.get(), SmartMeterValues(1, 1, 1, 1, 1))
+        self.assertEqual(queue.get(), SmartMeterValues(3, 2, 3, 3, 3))
+
+    def test_queue_coalesce_different_items(self) -> None:
+        queue=BoundedValueQueue(1, 'coalesce')
+        queue.put(SmartMeterValues(1, 1, 1, 1, 1, ('a', 'b', 'c', 'd', 'e')))
+        # values of other items (e.g. another smart meter) are not merged, the oldest values are dropped
+        queue.put(SmartMeterValues(2, 2, 2, 2, 2))
+        self.assertEqual(queue.dropped_count, 1)
+        self.assertEqual(queue.get(), SmartMeterValues(2, 2, 2, 2, 2))
+
+    def test_queue_close(self) -> None:
+        queue=BoundedValueQueue(2)
+        queue.put(SmartMeterValues(1, 1, 1, 1, 1))
+        queue.close()
+        self.assertIsNotNone(queue.get())
+        self.assertIsNone(queue.get())
+        with self.assertRaises(ValueError):
+            BoundedValueQueue(0)
+        with self.assertRaises(ValueError):
+            BoundedValueQueue(1, 'unknown') # type: ignore
+
+    def test_read_cadence_independent_of_publishing(self) -> None:
+        read_times : List[float] = []
+        published : List[SmartMeterValues] = []
+        def _read() -> SmartMeterValues:
+            read_times.append(time.perf_counter())
+            time.sleep(0.02)
+            return SmartMeterValues(len(read_times), 0, 0, 0, 0)
+        def _publish(values : SmartMeterValues) -> None:
+            time.sleep(0.1)
+            published.append(values)
+        def _check_exit(values : SmartMeterValues) -> Optional[bool]:
+            return True if values.phase_1_consumption.value == 10 else None
+
+        pipeline=AcquisitionPipeline(_read, _publish, logger, queue_size=3, policy='drop_oldest')
+        self.assertTrue(pipeline.run(_check_exit))
+        self.assertEqual(len(read_times), 10)
+        # 10 reads do not wait for (up to) 10 slow posts
+        self.assertLess(read_times[-1]-read_times[0], 0.5)
+        self.assertEqual(published[-1], SmartMeterValues(10, 0, 0, 0, 0))
+        self.assertEqual(len(published)+pipeline.queue.dropped_count, 10)
+
+    def test_exit_on_invalid_values(self) -> None:
+        published : List[SmartMeterValues] = []
+        pipeline=AcquisitionPipeline(lambda: SmartMeterValues(), published.append, logger)
+        self.assertFalse(pipeline.run(lambda values: False if values.is_invalid() else None))
+        self.assertEqual(published, [SmartMeterValues()])
+
+if __name__ == '__main__':
+    try:
+        unittest.main()
+    except Exception as e:
+        logger.exception("Caught Exception: " + str(e))
+    except:
+        logger.exception("Caught unknow exception")
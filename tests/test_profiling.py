@@ -0,0 +1,101 @@
+import unittest
+import logging
+import sys
+import tempfile
+import threading
+import time
+import pathlib
+from pathlib import Path
+test_path = pathlib.Path(__file__).parent.absolute()
+
+from smart_meter_to_openhab.profiling import *
+from smart_meter_to_openhab import profiling
+from smart_meter_to_openhab.sml_iskra_mt175 import SmlIskraMt175OneWay
+from smart_meter_to_openhab.transport import ReplayTransport, load_sml_dumps
+
+logging.basicConfig(stream=sys.stdout, level=logging.ERROR)
+logger = logging.getLogger(__name__)
+
+def _busy_wait(duration_sec : float) -> None:
+    # CPU time of the thread, so the wait is not shortened by a busy machine (preemption)
+    end=time.thread_time()+duration_sec
+    while time.thread_time() < end:
+        pass
+
+class TestProfiling(unittest.TestCase):
+
+    def test_stages(self) -> None:
+        profiler=CycleProfiler(logger)
+        with profiler.stage('sleep'):
+            time.sleep(0.05)
+        with profiler.stage('decode'):
+            _busy_wait(0.02)
+        # stages of other threads (e.g. the publish stage of the pipeline) are not part of the cycle
+        thread=threading.Thread(target=lambda: profiler.stage('publish').__enter__())
+        thread.start()
+        thread.join()
+        profiler.end_cycle()
+        record=profiler.records()[0]
+        self.assertGreaterEqual(record['sleep'], 0.05)
+        self.assertLess(record['sleep_cpu'], 0.01)
+        self.assertGreaterEqual(record['decode'], 0.02)
+        self.assertGreaterEqual(record['decode_cpu'], 0.02)
+        self.assertGreater(record['decode_cpu'], record['sleep_cpu'])
+        self.assertEqual(record['publish'], 0)
+        self.assertAlmostEqual(record['wall'], record['sleep']+record['decode']+record['other'])
+        self.assertIn('decode: p50', profiler.summary())
+
+    def test_ring_buffer(self) -> None:
+        profiler=CycleProfiler(logger, capacity=3)
+        for i in range(5):
+            with profiler.stage('serial'):
+                time.sleep(0.01*i)
+            profiler.end_cycle()
+            profiler.start_cycle()
+        self.assertEqual(profiler.cycle_count, 5)
+        # the oldest 2 cycles have been overwritten
+        serial=[record['serial'] for record in profiler.records()]
+        self.assertEqual(len(serial), 3)
+        self.assertTrue(0.02 <= serial[0] < 0.03 <= serial[1] < 0.04 <= serial[2])
+
+    def test_budget(self) -> None:
+        profiler=CycleProfiler(logger, budget_sec=0.01)
+        with profiler.stage('sleep'):
+            time.sleep(0.02)
+        with self.assertLogs(logger, logging.WARNING) as logs:
+            profiler.end_cycle()
+        self.assertIn('sleep 0.02', logs.output[0])
+
+    def test_flamegraph(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file=Path(tmp_dir, 'profile.folded')
+            profiler=CycleProfiler(logger, flamegraph_file=file, flamegraph_cycles=2)
+            for _ in range(2):
+                _busy_wait(0.05)
+                profiler.end_cycle()
+                profiler.start_cycle()
+            stacks=[line.rsplit(' ', 1) for line in file.read_text().splitlines()]
+            self.assertTrue(stacks)
+            self.assertTrue(any('_busy_wait' in stack for stack, _ in stacks))
+            self.assertGreater(sum(int(count) for _, count in stacks), 5)
+
+    def test_reader_stages(self) -> None:
+        reader=SmlIskraMt175OneWay(ReplayTransport(load_sml_dumps(test_path / 'data' / 'iskra_mt175_valid.sml'), speedup=0), logger)
+        profiler=CycleProfiler(logger)
+        profiling.activate(profiler)
+        try:
+            reader._read_raw()
+        finally:
+            profiling.activate(None)
+        profiler.end_cycle()
+        record=profiler.records()[0]
+        self.assertGreater(record['serial'], 0)
+        self.assertGreater(record['decode'], 0)
+
+if __name__ == '__main__':
+    try:
+        unittest.main()
+    except Exception as e:
+        logger.exception("Caught Exception: " + str(e))
+    except:
+        logger.exception("Caught unknow exception")
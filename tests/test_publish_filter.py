@@ -0,0 +1,76 @@
+import unittest
+import logging
+import sys
+import tempfile
+from pathlib import Path
+
+from smart_meter_to_openhab.interfaces import *
+from smart_meter_to_openhab.publish_filter import *
+
+logging.basicConfig(stream=sys.stdout, level=logging.ERROR)
+logger = logging.getLogger(__name__)
+
+class TestPublishFilter(unittest.TestCase):
+    _overall=SmartMeterValues.oh_item_names()[3]
+    _e_meter=SmartMeterValues.oh_item_names()[4]
+
+    def _published(self, publish_filter : PublishFilter, values : SmartMeterValues, timestamp : float) -> List[Any]:
+        published=[value.value for value in publish_filter.filter(values, timestamp)]
+        publish_filter.commit()
+        return published
+
+    def test_deadband(self) -> None:
+        publish_filter=PublishFilter({self._overall : PublishFilterConfig(absolute_deadband=10), 
+                                      self._e_meter : PublishFilterConfig(relative_deadband=0.01)})
+        self.assertEqual(self._published(publish_filter, SmartMeterValues(1, 2, 3, 100, 1000), 0), [1, 2, 3, 100, 1000])
+        # unconfigured items are always published
+        self.assertEqual(self._published(publish_filter, SmartMeterValues(1, 2, 3, 110, 1010), 1), [1, 2, 3, None, None])
+        self.assertEqual(self._published(publish_filter, SmartMeterValues(1, 2, 3, 111, 1011), 2), [1, 2, 3, 111, 1011])
+        self.assertEqual(publish_filter.suppressed_counts, {self._overall : 1, self._e_meter : 1})
+        self.assertEqual(publish_filter.published_counts[self._overall], 2)
+
+    def test_interval_and_heartbeat(self) -> None:
+        publish_filter=PublishFilter({}, PublishFilterConfig(min_interval_sec=5, max_silence_sec=60))
+        values=SmartMeterValues(0, 0, 0, 0, 1000)
+        self.assertEqual(self._published(publish_filter, values, 0), [0, 0, 0, 0, 1000])
+        self.assertEqual(self._published(publish_filter, SmartMeterValues(1, 0, 0, 1, 1000), 4), [None]*5)
+        # change-only publishing (deadband of 0)
+        self.assertEqual(self._published(publish_filter, SmartMeterValues(1, 0, 0, 1, 1000), 5), [1, None, None, 1, None])
+        self.assertEqual(self._published(publish_filter, SmartMeterValues(1, 0, 0, 1, 1000), 59), [None]*5)
+        self.assertEqual(self._published(publish_filter, SmartMeterValues(1, 0, 0, 1, 1000), 60), [None, 0, 0, None, 1000])
+        # None values are passed through
+        self.assertEqual(self._published(publish_filter, SmartMeterValues(), 100), [None]*5)
+
+    def test_failed_post(self) -> None:
+        # values that have not been posted are not the reference of the deadband
+        publish_filter=PublishFilter({self._overall : PublishFilterConfig(absolute_deadband=10)})
+        self.assertEqual(self._published(publish_filter, SmartMeterValues(1, 2, 3, 100, 1000), 0), [1, 2, 3, 100, 1000])
+        self.assertEqual([value.value for value in publish_filter.filter(SmartMeterValues(1, 2, 3, 120, 1000), 1)], [1, 2, 3, 120, 1000])
+        publish_filter.commit({self._overall})
+        self.assertEqual(self._published(publish_filter, SmartMeterValues(1, 2, 3, 105, 1000), 2), [1, 2, 3, None, 1000])
+        self.assertEqual(self._published(publish_filter, SmartMeterValues(1, 2, 3, 111, 1000), 3), [1, 2, 3, 111, 1000])
+        # without commit nothing is recorded
+        publish_filter.filter(SmartMeterValues(1, 2, 3, 200, 1000), 4)
+        self.assertEqual(self._published(publish_filter, SmartMeterValues(1, 2, 3, 115, 1000), 5), [1, 2, 3, None, 1000])
+
+    def test_load_config(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            config_file=Path(tmp_dir) / 'publish_filter.ini'
+            with open(config_file, 'w') as f:
+                f.write(f"[DEFAULT]\nmax_silence_sec = 300\n[{self._overall}]\nabsolute_deadband = 5\nmin_interval_sec = 10\n")
+            default_config, item_configs=load_publish_filter_config(config_file)
+            self.assertEqual(default_config, PublishFilterConfig(max_silence_sec=300))
+            self.assertEqual(item_configs, {self._overall : PublishFilterConfig(absolute_deadband=5, min_interval_sec=10, max_silence_sec=300)})
+
+            with open(config_file, 'w') as f:
+                f.write(f"[{self._overall}]\nunknown = 5\n")
+            with self.assertRaises(ValueError):
+                load_publish_filter_config(config_file)
+
+if __name__ == '__main__':
+    try:
+        unittest.main()
+    except Exception as e:
+        logger.exception("Caught Exception: " + str(e))
+    except:
+        logger.exception("Caught unknow exception")
@@ -0,0 +1,80 @@
+import unittest
+import logging
+import sys
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from smart_meter_to_openhab.publisher import CoalescingPublisher
+
+logging.basicConfig(stream=sys.stdout, level=logging.ERROR)
+logger = logging.getLogger(__name__)
+
+class FakePoster():
+    def __init__(self, delays : Dict[str, float]) -> None:
+        self._delays=delays
+        self._lock=threading.Lock()
+        self.posted : List[Tuple[str, str]] = []
+        self.failing_items : List[str] = []
+
+    def post(self, oh_item : str, value : str) -> bool:
+        time.sleep(self._delays.get(oh_item, 0))
+        with self._lock:
+            self.posted.append((oh_item, value))
+        if oh_item in self.failing_items:
+            raise RuntimeError("post failed")
+        return True
+
+class TestPublisher(unittest.TestCase):
+
+    def test_parallel_posts(self) -> None:
+        poster=FakePoster({'item_1': 0.2, 'item_2': 0.2, 'item_3': 0.2, 'item_4': 0.3})
+        publisher=CoalescingPublisher(poster.post, logger, max_workers=4)
+        start=time.perf_counter()
+        self.assertTrue(publisher.publish({'item_1': '1', 'item_2': '2', 'item_3': '3', 'item_4': '4'}))
+        duration=time.perf_counter()-start
+        # the duration is defined by the slowest item (not the sum of all items)
+        self.assertLess(duration, 0.6)
+        self.assertEqual(sorted(poster.posted), [('item_1', '1'), ('item_2', '2'), ('item_3', '3'), ('item_4', '4')])
+        publisher.close()
+
+    def test_coalescing_and_ordering(self) -> None:
+        poster=FakePoster({'slow_item': 0.2})
+        publisher=CoalescingPublisher(poster.post, logger, max_workers=2)
+        publisher.submit('slow_item', '1')
+        time.sleep(0.05)
+        # '1' is being posted. '2' and '3' are queued, '2' is dropped in favour of '3'
+        publisher.submit('slow_item', '2')
+        publisher.submit('slow_item', '3')
+        publisher.submit('fast_item', '10')
+        self.assertTrue(publisher.wait())
+        self.assertEqual([value for item, value in poster.posted if item == 'slow_item'], ['1', '3'])
+        self.assertEqual(publisher.coalesced_count, 1)
+        publisher.close()
+
+    def test_failure(self) -> None:
+        poster=FakePoster({})
+        poster.failing_items.append('item_2')
+        publisher=CoalescingPublisher(poster.post, logger)
+        self.assertFalse(publisher.publish({'item_1': '1', 'item_2': '2'}))
+        self.assertTrue(publisher.publish({'item_1': '1'}))
+        self.assertFalse(publisher.wait())
+        poster.failing_items.clear()
+        self.assertTrue(publisher.publish({'item_2': '2'}))
+        self.assertTrue(publisher.wait())
+        publisher.close()
+
+    def test_timeout(self) -> None:
+        poster=FakePoster({'item_1': 0.3})
+        publisher=CoalescingPublisher(poster.post, logger)
+        self.assertFalse(publisher.publish({'item_1': '1'}, timeout=0.05))
+        self.assertTrue(publisher.wait())
+        publisher.close()
+
+if __name__ == '__main__':
+    try:
+        unittest.main()
+    except Exception as e:
+        logger.exception("Caught Exception: " + str(e))
+    except:
+        logger.exception("Caught unknow exception")
@@ -0,0 +1,110 @@
+import unittest
+import logging
+import sys
+import tempfile
+import pathlib
+from pathlib import Path
+test_path = pathlib.Path(__file__).parent.absolute()
+
+from smart_meter_to_openhab.raw_archive import *
+from smart_meter_to_openhab.sml_iskra_mt175 import SmlIskraMt175OneWay
+from smart_meter_to_openhab.transport import ReplayTransport, load_sml_dumps
+from smart_meter_to_openhab.sml_frame import SML_START, SML_ESCAPE
+from smart_meter_to_openhab.sml_parser import crc16_x25
+
+logging.basicConfig(stream=sys.stdout, level=logging.ERROR)
+logger = logging.getLogger(__name__)
+
+class TestRawArchive(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self._frames=load_sml_dumps(test_path / 'data')
+        self._tmp_dir=tempfile.TemporaryDirectory()
+        self._dir=Path(self._tmp_dir.name)
+
+    def tearDown(self) -> None:
+        self._tmp_dir.cleanup()
+
+    def test_append_and_read(self) -> None:
+        archive=RawFrameArchive(self._dir, logger)
+        for i, frame in enumerate(self._frames):
+            self.assertTrue(archive.append(CLASSIFICATIONS[i % 4], frame, 1000+i))
+        archive.close()
+        self.assertEqual(list(read_raw_archive(self._dir)), [(1000+i, CLASSIFICATIONS[i % 4], frame) for i, frame in enumerate(self._frames)])
+        self.assertEqual(len(archive.index), 1)
+        self.assertEqual(archive.index, load_archive_index(self._dir))
+        self.assertEqual(archive.index[0].frame_count, len(self._frames))
+        self.assertEqual(archive.index[0].classification_counts, {'valid' : 1, 'invalid' : 1, 'inconsistent' : 1, 'corrupt' : 1})
+        self.assertEqual((archive.index[0].first_timestamp, archive.index[0].last_timestamp), (1000, 1003))
+        # binary and compressed, the hex dumps have twice the size of the frames
+        archive_size=sum(path.stat().st_size for path in self._dir.glob('*.sml.gz'))
+        self.assertLess(archive_size, sum(len(frame) for frame in self._frames))
+
+    def test_rotation(self) -> None:
+        archive=RawFrameArchive(self._dir, logger, max_segment_bytes=1, max_segments=3)
+        for i in range(5):
+            archive.append('valid', self._frames[0], 1000+i)
+        archive.close()
+        # each frame exceeds the segment size, the 2 oldest segments have been deleted
+        self.assertEqual([segment.first_timestamp for segment in archive.index], [1002, 1003, 1004])
+        self.assertEqual(len(list(self._dir.glob('*.sml.gz'))), 3)
+        self.assertEqual([timestamp for timestamp, _, _ in read_raw_archive(self._dir)], [1002, 1003, 1004])
+
+    def test_restart(self) -> None:
+        for i in range(2):
+            archive=RawFrameArchive(self._dir, logger)
+            # the same time stamp does not overwrite the previous segment
+            archive.append('invalid', self._frames[i], 1000)
+            archive.close()
+        self.assertEqual([frame for _, _, frame in read_raw_archive(self._dir)], self._frames[:2])
+        self.assertEqual(len(archive.index), 2)
+
+    def test_recover_unclosed_segment(self) -> None:
+        archive=RawFrameArchive(self._dir, logger)
+        archive.append('valid', self._frames[0], 1000)
+        archive.append('corrupt', self._frames[1], 1001)
+        # simulate a killed process: the segment is flushed, but not closed
+        archive.flush()
+        self.assertEqual([frame for _, _, frame in read_raw_archive(self._dir)], self._frames[:2])
+        recovered=RawFrameArchive(self._dir, logger)
+        recovered.close()
+        self.assertEqual(len(recovered.index), 1)
+        self.assertEqual(recovered.index[0].frame_count, 2)
+        self.assertEqual(recovered.index[0].classification_counts, {'valid' : 1, 'corrupt' : 1})
+
+    def test_dump_raw_data_of_reader(self) -> None:
+        valid_frame=load_sml_dumps(test_path / 'data' / 'iskra_mt175_valid.sml')[0]
+        corrupt_frame=valid_frame[:-1]+bytes((valid_frame[-1] ^ 0xff,))
+        reader=SmlIskraMt175OneWay(ReplayTransport([corrupt_frame, valid_frame], speedup=0, loop=False), logger, self._dir)
+        self.assertTrue(reader._read_raw().is_valid())
+        reader.close()
+        self.assertEqual([(classification, frame) for _, classification, frame in read_raw_archive(self._dir)], [('corrupt', corrupt_frame)])
+        # the archive can be replayed
+        self.assertEqual(load_sml_dumps(self._dir), [corrupt_frame])
+
+    def test_dump_raw_data_of_batch(self) -> None:
+        # several frames are decoded by one read_available call, each rejected frame is dumped (not the latest frame)
+        valid_frame=load_sml_dumps(test_path / 'data' / 'iskra_mt175_valid.sml')[0]
+        # the electricity meter decreased
+        outlier_frame=load_sml_dumps(test_path / 'data' / 'iskra_mt175_outlier.sml')[0]
+        # valid CRC, but without values
+        empty_frame=SML_START+SML_ESCAPE+bytes([0x1a, 0])
+        crc=crc16_x25(empty_frame)
+        empty_frame+=bytes([crc & 0xff, crc >> 8])
+        reader=SmlIskraMt175OneWay(ReplayTransport([valid_frame+outlier_frame+empty_frame+valid_frame], speedup=0, loop=False), logger, self._dir)
+        aggregator=reader.create_aggregator(100)
+        frames=reader.read_available()
+        self.assertEqual([raw_frame for _, raw_frame in frames], [valid_frame, outlier_frame, empty_frame, valid_frame])
+        for timestamp, (values, raw_frame) in enumerate(frames):
+            reader.add_to_window(aggregator, values, timestamp, raw_frame=raw_frame)
+        reader.close()
+        self.assertEqual([(classification, frame) for _, classification, frame in read_raw_archive(self._dir)],
+                         [('inconsistent', outlier_frame), ('invalid', empty_frame)])
+
+if __name__ == '__main__':
+    try:
+        unittest.main()
+    except Exception as e:
+        logger.exception("Caught Exception: " + str(e))
+    except:
+        logger.exception("Caught unknow exception")
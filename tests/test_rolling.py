@@ -0,0 +1,84 @@
+import unittest
+import logging
+import math
+import random
+import statistics
+import sys
+from typing import List, Optional
+
+from smart_meter_to_openhab.rolling import *
+from smart_meter_to_openhab.interfaces import SmartMeterValues
+
+logging.basicConfig(stream=sys.stdout, level=logging.ERROR)
+logger = logging.getLogger(__name__)
+
+OH_ITEM_NAMES=('phase_1', 'phase_2', 'phase_3', 'overall', 'meter')
+
+class TestRollingWindow(unittest.TestCase):
+
+    def test_statistics(self) -> None:
+        window=RollingWindow(3)
+        self.assertEqual((len(window), window.count), (0, 0))
+        self.assertIsNone(window.mean())
+        self.assertIsNone(window.median())
+        self.assertIsNone(window.min())
+        for value in (5, 1, None, 3):
+            window.push(value)
+        self.assertEqual(window.values(), [1, None, 3])
+        self.assertEqual((len(window), window.count), (3, 2))
+        self.assertEqual((window.mean(), window.median(), window.min(), window.max()), (2, 2, 1, 3))
+        window.push(math.nan)
+        window.push(None)
+        self.assertEqual((window.mean(), window.median(), window.min(), window.max()), (3, 3, 3, 3))
+        window.push(None)
+        self.assertEqual(window.count, 0)
+        self.assertIsNone(window.max())
+
+    def test_brute_force(self) -> None:
+        # compare with the statistics of the window list (incl. duplicates, missing values and large values)
+        rng=random.Random(1)
+        for capacity in (1, 2, 5, 64):
+            window=RollingWindow(capacity)
+            expected : List[Optional[float]] = []
+            for _ in range(3000):
+                choice=rng.random()
+                value=None if choice < 0.1 else float(rng.randint(0, 10)) if choice < 0.5 else rng.uniform(0, 1e6)
+                window.push(value)
+                expected=(expected+[value])[-capacity:]
+                self.assertEqual(window.values(), expected)
+                values=[value for value in expected if value is not None]
+                if not values:
+                    self.assertIsNone(window.median())
+                    continue
+                self.assertEqual(window.median(), statistics.median(values))
+                self.assertEqual((window.min(), window.max()), (min(values), max(values)))
+                self.assertTrue(math.isclose(window.mean(), math.fsum(values)/len(values), rel_tol=1e-9)) # type: ignore
+            # outdated heap entries are compacted
+            self.assertLessEqual(len(window._low)+len(window._high), 2*capacity+1)
+
+    def test_invalid_capacity(self) -> None:
+        with self.assertRaises(ValueError):
+            RollingWindow(0)
+
+class TestSmartMeterRollingWindow(unittest.TestCase):
+
+    def test_channels(self) -> None:
+        window=SmartMeterRollingWindow(2, OH_ITEM_NAMES)
+        window.push(SmartMeterValues(100, 200, None, 600, 2.5, OH_ITEM_NAMES))
+        window.push(SmartMeterValues(200, 300, None, 700, 3.5, OH_ITEM_NAMES))
+        window.push(SmartMeterValues(300, 400, None, 900, 4.5, OH_ITEM_NAMES))
+        self.assertEqual(len(window), 2)
+        self.assertEqual(window.mean(), SmartMeterValues(250, 350, None, 800, 4.0, OH_ITEM_NAMES))
+        self.assertEqual(window.aggregate('median'), SmartMeterValues(250, 350, None, 800, 4.0, OH_ITEM_NAMES))
+        self.assertEqual(window.min(), SmartMeterValues(200, 300, None, 700, 3.5, OH_ITEM_NAMES))
+        self.assertEqual(window.max(), SmartMeterValues(300, 400, None, 900, 4.5, OH_ITEM_NAMES))
+        with self.assertRaises(ValueError):
+            window.aggregate('mad_mean')
+
+if __name__ == '__main__':
+    try:
+        unittest.main()
+    except Exception as e:
+        logger.exception("Caught Exception: " + str(e))
+    except:
+        logger.exception("Caught unknow exception")
@@ -4,6 +4,7 @@ import sys
 
 from smart_meter_to_openhab.interfaces import *
 from smart_meter_to_openhab.sml_iskra_mt175 import *
+from smart_meter_to_openhab.outlier_filter import StreamingOutlierFilter, OutlierFilterSettings
 
 logging.basicConfig(stream=sys.stdout, level=logging.ERROR)
 logger = logging.getLogger(__name__)
@@ -25,7 +26,9 @@ class TestSml(unittest.TestCase):
             TestSml._function_call_count+=1
             return values
 
-    _test_reader=TestReader()
+    def setUp(self) -> None:
+        # the outlier filter keeps the previous reads
+        self._test_reader=TestSml.TestReader()
 
     @staticmethod
     def _return_test_values() -> SmartMeterValues:
@@ -49,22 +52,77 @@ class TestSml(unittest.TestCase):
     def test_read_with_prev_values(self) -> None:
         TestSml._function_call_count=0
         TestSml._test_values[0]=SmartMeterValues(100, 200, 300, 600, 60)
-        SmartMeterReader._prev_avg_values=SmartMeterValues(50, 50, 50, 50, 50)
+        self._test_reader._prev_avg_values=SmartMeterValues(50, 50, 50, 50, 50)
         read_values=self._test_reader.read_avg(read_count=1)
         self.assertEqual(TestSml._test_values[0], read_values)
 
-        # If there is an outlier, all return values should be None
+        # If the electricity meter is an outlier, only its value is None
         TestSml._function_call_count=0
-        TestSml._test_values[0].electricity_meter.value=1000000
+        TestSml._test_values[0]=SmartMeterValues(100, 200, 300, 600, 1000000)
+        read_values=self._test_reader.read_avg(read_count=1)
+        self.assertEqual(read_values, SmartMeterValues(100, 200, 300, 600, None))
+
+        # If all values are outliers, all return values should be None
+        TestSml._function_call_count=0
+        TestSml._test_values[0]=SmartMeterValues(100, 200, 300, 600, 59)
+        self._test_reader._outlier_filter=StreamingOutlierFilter(OutlierFilterSettings(min_count=1))
+        self._test_reader._outlier_filter.filter(SmartMeterValues(1000, 1000, 1000, 1000, 60))
         read_values=self._test_reader.read_avg(read_count=1)
         self.assertTrue(all(value is None for value in read_values.value_list()))
 
     def test_read_avg(self) -> None:
         TestSml._function_call_count=0
         TestSml._test_values[0]=SmartMeterValues(100, 200, 300, 600, 2.5)
-        TestSml._test_values[1]=SmartMeterValues(200, 300, 400, 700, 4.5)
+        TestSml._test_values[1]=SmartMeterValues(200, 300, 400, 700, 2.5078125)
         read_values=self._test_reader.read_avg(read_count=2)
-        self.assertEqual(SmartMeterValues(150, 250, 350, 650, 3.5), read_values)
+        self.assertEqual(SmartMeterValues(150, 250, 350, 650, 2.50390625), read_values)
+
+    def test_read_avg_stop_early(self) -> None:
+        TestSml._function_call_count=0
+        TestSml._test_values[0]=SmartMeterValues(100, 200, 300, 600, 2.5)
+        TestSml._test_values[1]=SmartMeterValues(200, 300, 400, 700, 4.5)
+        stopped_values : List[SmartMeterValues] = []
+        def _stop(values : SmartMeterValues) -> int:
+            stopped_values.append(values)
+            return 1
+        read_values=self._test_reader.read_avg(read_count=5, stop_early=_stop)
+        self.assertEqual(TestSml._function_call_count, 1)
+        self.assertEqual(stopped_values, [TestSml._test_values[0]])
+        self.assertEqual(read_values, TestSml._test_values[0])
+
+    def test_read_avg_stop_early_latest_reads(self) -> None:
+        # only the reads since the change are aggregated
+        TestSml._function_call_count=0
+        TestSml._test_values=[SmartMeterValues(100, 100, 100, 300, 2.5) for _ in range(3)]+[SmartMeterValues(700, 700, 700, 2100, 2.5) for _ in range(2)]
+        try:
+            def _stop(values : SmartMeterValues) -> int:
+                return 2 if TestSml._function_call_count == 5 else 0
+            read_values=self._test_reader.read_avg(read_count=10, stop_early=_stop)
+        finally:
+            TestSml._test_values=[SmartMeterValues(), SmartMeterValues()]
+        self.assertEqual(TestSml._function_call_count, 5)
+        self.assertEqual(read_values, SmartMeterValues(700, 700, 700, 2100, 2.5))
+
+    class StreamReader(SmartMeterReader):
+        def __init__(self, values : List[SmartMeterValues]) -> None:
+            super().__init__(logger)
+            self._values=values
+        
+        def _read_raw(self) -> SmartMeterValues:
+            return self._values.pop(0)
+
+    def test_read_stream(self) -> None:
+        reader=TestSml.StreamReader([SmartMeterValues(100, 200, 300, 600, 2.5), SmartMeterValues(), 
+                                     SmartMeterValues(110, 210, 310, 630, 2.5), SmartMeterValues(120, 220, 320, 660, 2.5),
+                                     SmartMeterValues(1000, 0, 1000, 0, 1), SmartMeterValues(130, 230, 330, 690, 1)])
+        stream=reader.read_stream(window_sec=100, emit_frame_count=2)
+        # no valid previous values: median of the first two good reads (invalid values are ignored)
+        self.assertEqual(next(stream), SmartMeterValues(105, 205, 305, 615, 2.5))
+        # outliers are ignored per value, reads without values are ignored completely. Mean of all good reads in the window.
+        self.assertEqual(next(stream), SmartMeterValues(115, 215, 315, 645, 2.5))
+        self.assertEqual(reader._prev_avg_values, SmartMeterValues(115, 215, 315, 645, 2.5))
+        self.assertEqual(reader._outlier_filter.rejected_counts['electricity_meter'], 2)
+        self.assertEqual(reader._outlier_filter.rejected_counts['phase_1_consumption'], 1)
 
 if __name__ == '__main__':
     try:
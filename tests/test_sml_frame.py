@@ -0,0 +1,113 @@
+import unittest
+import logging
+import sys
+from typing import List
+
+import pathlib
+test_path = str( pathlib.Path(__file__).parent.absolute() )
+
+from smart_meter_to_openhab.sml_frame import *
+
+logging.basicConfig(stream=sys.stdout, level=logging.ERROR)
+logger = logging.getLogger(__name__)
+
+def _read_frame(file_name : str) -> bytes:
+    with open(test_path+"/data/"+file_name, "r") as f:
+        return bytes.fromhex(f.read())
+
+class FakeSerial():
+    def __init__(self, data : bytes, chunk_size : int) -> None:
+        self._data=data
+        self._pos=0
+        self._chunk_size=chunk_size
+
+    @property
+    def in_waiting(self) -> int:
+        return min(self._chunk_size, len(self._data)-self._pos)
+
+    def read(self, size : int = 1) -> bytes:
+        data=self._data[self._pos:self._pos+size]
+        self._pos+=len(data)
+        return data
+
+class TestSmlFrame(unittest.TestCase):
+    _valid_frame=_read_frame("iskra_mt175_valid.sml")
+    _outlier_frame=_read_frame("iskra_mt175_outlier.sml")
+
+    def _collect_frames(self, assembler : SmlFrameAssembler, source : FakeSerial, byte_count : int) -> List[bytes]:
+        frames : List[bytes] = []
+        read_bytes=0
+        while read_bytes < byte_count:
+            frame=assembler.next_frame()
+            if frame is None:
+                read_bytes+=assembler.read_from(source)
+            else:
+                frames.append(bytes(frame))
+        frame=assembler.next_frame()
+        while frame is not None:
+            frames.append(bytes(frame))
+            frame=assembler.next_frame()
+        return frames
+
+    def test_single_frame(self) -> None:
+        assembler=SmlFrameAssembler()
+        assembler.feed(self._valid_frame)
+        frame=assembler.next_frame()
+        self.assertIsInstance(frame, memoryview)
+        self.assertEqual(bytes(frame), self._valid_frame) # type: ignore
+        self.assertIsNone(assembler.next_frame())
+
+    def test_chunked_stream_with_trash(self) -> None:
+        data=b'\x00\x1b\x1b\x01'+self._valid_frame[100:]+self._valid_frame+b'\x1b\x1b\x1b'+self._outlier_frame+self._valid_frame[:50]
+        for chunk_size in (1, 7, 64, len(data)):
+            frames=self._collect_frames(SmlFrameAssembler(), FakeSerial(data, chunk_size), len(data))
+            self.assertEqual(frames, [self._valid_frame, self._outlier_frame])
+
+    def test_escaped_data(self) -> None:
+        frame=SML_START+b'\x76\x05\x01\x02'+SML_ESCAPE+SML_ESCAPE+b'\x01\x02\x03\x00'+SML_ESCAPE+b'\x1a\x01\x12\x34'
+        assembler=SmlFrameAssembler()
+        assembler.feed(frame)
+        self.assertEqual(bytes(assembler.next_frame()), frame) # type: ignore
+
+    def test_corrupt_frame_length(self) -> None:
+        # a frame with an inserted byte must not swallow the following frame
+        corrupt_frame=_read_frame("iskra_mt175_outlier_2.sml")
+        self.assertNotEqual(len(corrupt_frame) % 4, 0)
+        assembler=SmlFrameAssembler()
+        assembler.feed(corrupt_frame+self._valid_frame)
+        self.assertEqual(bytes(assembler.next_frame()), corrupt_frame) # type: ignore
+        self.assertEqual(bytes(assembler.next_frame()), self._valid_frame) # type: ignore
+
+    def test_restart_and_invalid_escape(self) -> None:
+        assembler=SmlFrameAssembler()
+        truncated=self._outlier_frame[:200]
+        assembler.feed(truncated+self._valid_frame)
+        self.assertEqual(bytes(assembler.next_frame()), self._valid_frame) # type: ignore
+
+        invalid=SML_START+b'\x76\x05\x01\x02'+SML_ESCAPE+b'\x05\x05\x05\x05'
+        assembler.feed(invalid+self._valid_frame)
+        self.assertEqual(bytes(assembler.next_frame()), self._valid_frame) # type: ignore
+        self.assertEqual(assembler.dropped_bytes, len(truncated)+len(invalid))
+
+    def test_max_frame_size(self) -> None:
+        assembler=SmlFrameAssembler(max_frame_size=256)
+        assembler.feed(self._valid_frame)
+        self.assertIsNone(assembler.next_frame())
+        assembler.feed(self._valid_frame[:-1])
+        self.assertIsNone(assembler.next_frame())
+
+    def test_frame_kept_by_caller(self) -> None:
+        assembler=SmlFrameAssembler()
+        assembler.feed(self._valid_frame+self._outlier_frame)
+        frame=assembler.next_frame()
+        payload=frame[8:] # type: ignore
+        self.assertEqual(bytes(assembler.next_frame()), self._outlier_frame) # type: ignore
+        self.assertEqual(bytes(payload), self._valid_frame[8:])
+
+if __name__ == '__main__':
+    try:
+        unittest.main()
+    except Exception as e:
+        logger.exception("Caught Exception: " + str(e))
+    except:
+        logger.exception("Caught unknow exception")
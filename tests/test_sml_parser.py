@@ -0,0 +1,102 @@
+import unittest
+import logging
+import sys
+
+import pathlib
+test_path = str( pathlib.Path(__file__).parent.absolute() )
+
+from smart_meter_to_openhab.sml_frame import SML_START, SML_ESCAPE
+from smart_meter_to_openhab.sml_parser import *
+from typing import Dict, Union
+
+logging.basicConfig(stream=sys.stdout, level=logging.ERROR)
+logger = logging.getLogger(__name__)
+
+def _read_frame(file_name : str) -> bytes:
+    with open(test_path+"/data/"+file_name, "r") as f:
+        return bytes.fromhex(f.read())
+
+def _create_frame(messages : bytes) -> bytes:
+    padding=(4-len(messages) % 4) % 4
+    frame=SML_START+messages+b'\x00'*padding+SML_ESCAPE+bytes([0x1a, padding])
+    crc=crc16_x25(frame)
+    return frame+bytes([crc & 0xff, crc >> 8])
+
+# SML_Message with a GetListResponse containing a single list entry
+def _create_get_list_response(obj_name : bytes, unit : int, scaler : int, value : bytes) -> bytes:
+    entry=b'\x77'+bytes([len(obj_name)+1])+obj_name+b'\x01\x01'+bytes([0x62, unit, 0x52, scaler & 0xff])+value+b'\x01'
+    body=b'\x72\x63\x07\x01'+b'\x77\x01\x01\x01\x01'+b'\x71'+entry+b'\x01\x01'
+    return b'\x76\x02\x01\x62\x00\x62\x00'+body+b'\x63\x00\x00\x00'
+
+_OBIS_CODES=(bytes.fromhex('0100010800ff'), bytes.fromhex('0100100700ff'))
+
+def _read_entries(frame : Union[bytes, bytearray]) -> Dict[bytes, SmlListEntry]:
+    return read_list_entries(frame, _OBIS_CODES)
+
+class TestSmlParser(unittest.TestCase):
+
+    def test_crc16(self) -> None:
+        self.assertEqual(crc16_x25(b'123456789'), 0x906e)
+
+    def test_parse_capture(self) -> None:
+        entries=_read_entries(_read_frame("iskra_mt175_valid.sml"))
+        energy=entries[bytes.fromhex('0100010800ff')]
+        self.assertEqual(energy.unit, SML_UNIT_WATT_HOUR)
+        self.assertEqual(energy.scaler, -1)
+        self.assertEqual(energy.value, 189990194)
+        self.assertEqual(energy.scaled_value(), 18999019.4)
+        self.assertEqual(energy.scaled_value(-3), 18999.0194)
+        power=entries[bytes.fromhex('0100100700ff')]
+        self.assertEqual(power.unit, SML_UNIT_WATT)
+        self.assertEqual(power.scaled_value(), 163)
+
+        # negative values are signed integers
+        entries=_read_entries(_read_frame("iskra_mt175_outlier.sml"))
+        self.assertEqual(entries[bytes.fromhex('0100100700ff')].scaled_value(), -103)
+
+    def test_variable_field_length(self) -> None:
+        obis=bytes.fromhex('0100100700ff')
+        # the same value encoded as 2 and as 4 byte integer
+        for value in (b'\x53\x01\x2c', b'\x55\x00\x00\x01\x2c'):
+            entries=_read_entries(_create_frame(_create_get_list_response(obis, SML_UNIT_WATT, 0, value)))
+            self.assertEqual(entries[obis].scaled_value(), 300)
+        entries=_read_entries(_create_frame(_create_get_list_response(obis, SML_UNIT_WATT, 2, b'\x62\x03')))
+        self.assertEqual(entries[obis].scaled_value(), 300)
+
+    def test_escaped_data(self) -> None:
+        obis=bytes.fromhex('0100010800ff')
+        messages=_create_get_list_response(obis, SML_UNIT_WATT_HOUR, 0, b'\x65'+SML_ESCAPE)
+        frame=_create_frame(messages.replace(SML_ESCAPE, SML_ESCAPE+SML_ESCAPE))
+        self.assertEqual(_read_entries(frame)[obis].value, 0x1b1b1b1b)
+
+    def test_corrupt_frames(self) -> None:
+        for file_name in ("iskra_mt175_outlier_2.sml", "iskra_mt175_outlier_3.sml"):
+            with self.assertRaises(SmlParseError):
+                _read_entries(_read_frame(file_name))
+
+        frame=bytearray(_read_frame("iskra_mt175_valid.sml"))
+        frame[100]^=0x01
+        with self.assertRaises(SmlParseError):
+            _read_entries(frame)
+        with self.assertRaises(SmlParseError):
+            _read_entries(frame[:-10])
+
+        # valid CRC but broken structure of a list entry
+        obis=_OBIS_CODES[1]
+        with self.assertRaises(SmlParseError):
+            _read_entries(_create_frame(b'\x77\x07'+obis+b'\x01\x01\x62'))
+        with self.assertRaises(SmlParseError):
+            _read_entries(_create_frame(b'\x77\x07'+obis+b'\x01\x01\x71\x01\x52\x00\x52\x01\x01'))
+
+    def test_requested_entries(self) -> None:
+        # only the requested entries are decoded
+        entries=read_list_entries(_read_frame("iskra_mt175_valid.sml"), (bytes.fromhex('0100100700ff'),))
+        self.assertEqual(list(entries), [bytes.fromhex('0100100700ff')])
+
+if __name__ == '__main__':
+    try:
+        unittest.main()
+    except Exception as e:
+        logger.exception("Caught Exception: " + str(e))
+    except:
+        logger.exception("Caught unknow exception")
@@ -0,0 +1,108 @@
+import unittest
+import logging
+import random
+import sys
+import tempfile
+import pathlib
+from pathlib import Path
+from typing import List, Optional
+test_path = pathlib.Path(__file__).parent.absolute()
+
+from smart_meter_to_openhab.timeseries import *
+from smart_meter_to_openhab.interfaces import SmartMeterValues
+from smart_meter_to_openhab.sml_iskra_mt175 import SmlIskraMt175OneWay
+from smart_meter_to_openhab.transport import ReplayTransport, load_sml_dumps
+
+logging.basicConfig(stream=sys.stdout, level=logging.ERROR)
+logger = logging.getLogger(__name__)
+
+OH_ITEM_NAMES=('phase_1', 'phase_2', 'phase_3', 'overall', 'meter')
+# 2024-03-01 00:00:00 UTC
+DAY_START=1709251200.0
+
+def _values(overall : Optional[float], meter : Optional[float] = None) -> SmartMeterValues:
+    return SmartMeterValues(1, 2, 3, overall, meter, OH_ITEM_NAMES)
+
+class TestTimeSeriesArchive(unittest.TestCase):
+
+    def test_records(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            archive=TimeSeriesArchive(Path(directory), logger)
+            self.assertTrue(archive.append(_values(100, 5), DAY_START+10))
+            self.assertTrue(archive.append(_values(None, 5.5), DAY_START+11.5))
+            self.assertEqual(archive.records(DAY_START, DAY_START+60), [(DAY_START+10, [1, 2, 3, 100, 5]), (DAY_START+11.5, [1, 2, 3, None, 5.5])])
+            self.assertEqual(archive.records(DAY_START+11, DAY_START+60), [(DAY_START+11.5, [1, 2, 3, None, 5.5])])
+            # older records are skipped
+            self.assertFalse(archive.append(_values(100), DAY_START+5))
+            self.assertEqual(archive.skipped_count, 1)
+            archive.close()
+            self.assertTrue((Path(directory) / '2024-03-01' / 'overall_consumption.f64').exists())
+
+    def test_summary(self) -> None:
+        # compare the summaries with the raw records of two days (incl. gaps and missing values)
+        rng=random.Random(42)
+        with tempfile.TemporaryDirectory() as directory:
+            archive=TimeSeriesArchive(Path(directory), logger, grow_records=1000)
+            timestamps : List[float] = []
+            values : List[Optional[float]] = []
+            timestamp=DAY_START+86400-3*3600
+            while timestamp < DAY_START+86400+2*3600:
+                value=rng.uniform(0, 1000) if rng.random() > 0.05 else None
+                archive.append(_values(value), timestamp)
+                timestamps.append(timestamp)
+                values.append(value)
+                timestamp+=rng.choice((0.7, 1, 1.3, 1.3, 240))
+            for _ in range(200):
+                start=rng.uniform(timestamps[0]-600, timestamps[-1])
+                end=start+rng.choice((0.5, 30, 90, 1800, 4000, 3*3600, 6*3600))*rng.random()
+                expected=[value for timestamp, value in zip(timestamps, values) if start <= timestamp < end and value is not None]
+                summary=archive.summary('overall_consumption', start, end)
+                self.assertEqual(summary.count, len(expected))
+                if expected:
+                    self.assertAlmostEqual(summary.sum, sum(expected), places=6)
+                    self.assertEqual((summary.min, summary.max), (min(expected), max(expected)))
+                    self.assertAlmostEqual(archive.mean('overall_consumption', start, end), sum(expected)/len(expected)) # type: ignore
+                else:
+                    self.assertIsNone(summary.mean)
+            self.assertEqual(archive.summary('phase_2_consumption', DAY_START, DAY_START+2*86400).count, len(timestamps))
+            archive.close()
+
+    def test_reopen(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            archive=TimeSeriesArchive(Path(directory), logger, grow_records=16)
+            for second in range(100):
+                archive.append(_values(second), DAY_START+second)
+            archive.close()
+            archive=TimeSeriesArchive(Path(directory), logger, grow_records=16)
+            # the records of the day are continued
+            self.assertFalse(archive.append(_values(0), DAY_START+50))
+            self.assertTrue(archive.append(_values(100), DAY_START+100))
+            self.assertEqual(len(archive.records(DAY_START, DAY_START+86400)), 101)
+            self.assertEqual(archive.mean('overall_consumption', DAY_START, DAY_START+3600), 50)
+            archive.close()
+            # read only
+            archive=TimeSeriesArchive(Path(directory), logger)
+            self.assertEqual(archive.summary('overall_consumption', DAY_START, DAY_START+86400).max, 100)
+            self.assertEqual(archive.summary('overall_consumption', DAY_START+86400, DAY_START+2*86400).count, 0)
+            archive.close()
+
+    def test_reader(self) -> None:
+        # all good reads are archived, only the aggregates are returned
+        with tempfile.TemporaryDirectory() as directory:
+            frames=load_sml_dumps(test_path / 'data' / 'iskra_mt175_valid.sml')
+            reader=SmlIskraMt175OneWay(ReplayTransport(frames*3, speedup=0), logger, oh_item_names=OH_ITEM_NAMES, timeseries_dir=Path(directory))
+            reader.read_stream(60, emit_frame_count=3).__next__()
+            reader.close()
+            archive=TimeSeriesArchive(Path(directory), logger)
+            records=archive.records(0, 2e9)
+            self.assertEqual(len(records), 3*len(frames))
+            self.assertEqual(archive.summary('overall_consumption', 0, 2e9).count, 3*len(frames))
+            archive.close()
+
+if __name__ == '__main__':
+    try:
+        unittest.main()
+    except Exception as e:
+        logger.exception("Caught Exception: " + str(e))
+    except:
+        logger.exception("Caught unknow exception")
@@ -0,0 +1,84 @@
+import unittest
+import logging
+import sys
+import os
+import time
+import tempfile
+import pathlib
+from pathlib import Path
+test_path = pathlib.Path(__file__).parent.absolute()
+
+from smart_meter_to_openhab.interfaces import SmartMeterValues
+from smart_meter_to_openhab.sml_iskra_mt175 import SmlIskraMt175OneWay
+from smart_meter_to_openhab.transport import *
+
+logging.basicConfig(stream=sys.stdout, level=logging.ERROR)
+logger = logging.getLogger(__name__)
+
+class TestTransport(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self._valid_frame=load_sml_dumps(test_path / 'data' / 'iskra_mt175_valid.sml')[0]
+        self._valid_values=SmartMeterValues(131, 19, 13, 163, 18999.0194)
+
+    def _read_all(self, transport : Transport) -> bytes:
+        data=bytearray()
+        try:
+            while True:
+                data+=transport.read(transport.in_waiting or 1)
+        except TransportError:
+            return bytes(data)
+
+    def test_load_sml_dumps(self) -> None:
+        self.assertEqual(len(load_sml_dumps(test_path / 'data')), 4)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            Path(tmp_dir, 'binary.sml').write_bytes(self._valid_frame)
+            self.assertEqual(load_sml_dumps(Path(tmp_dir)), [self._valid_frame])
+            os.mkdir(Path(tmp_dir, 'empty'))
+            with self.assertRaises(ValueError):
+                load_sml_dumps(Path(tmp_dir, 'empty'))
+
+    def test_replay_as_fast_as_possible(self) -> None:
+        transport=ReplayTransport([self._valid_frame, b'\x01\x02'], speedup=0, loop=False)
+        with self.assertRaises(TransportError):
+            transport.read()
+        transport.open()
+        self.assertEqual(self._read_all(transport), self._valid_frame+b'\x01\x02')
+        self.assertEqual(transport.replayed_frame_count, 2)
+
+    def test_replay_speedup(self) -> None:
+        # 3 frames with an interval of 1 sec, replayed 100 times faster: the last one starts after 20 ms
+        transport=ReplayTransport([b'\x01', b'\x02', b'\x03'], speedup=100, loop=False)
+        transport.open()
+        start=time.monotonic()
+        self.assertEqual(self._read_all(transport), b'\x01\x02\x03')
+        self.assertGreaterEqual(time.monotonic()-start, 0.02)
+        self.assertLess(time.monotonic()-start, 0.5)
+
+    def test_replay_corruption(self) -> None:
+        transport=ReplayTransport([self._valid_frame], speedup=0, corruption_rate=0.5, seed=1)
+        reader=SmlIskraMt175OneWay(transport, logger)
+        values=[reader._read_raw() for _ in range(20)]
+        self.assertGreater(transport.corrupted_frame_count, 0)
+        self.assertLess(transport.corrupted_frame_count, transport.replayed_frame_count)
+        # corrupt frames are dropped by the reader, every read returns the values of a valid frame
+        self.assertTrue(all(value == self._valid_values for value in values))
+
+    @unittest.skipUnless(hasattr(os, 'openpty'), "pseudo terminals are not supported")
+    def test_pty_loopback(self) -> None:
+        transport=PtyTransport()
+        reader=SmlIskraMt175OneWay(transport, logger)
+        transport.open()
+        self.assertTrue(transport.device.startswith('/dev/'))
+        transport.write(b'\x00\x1b'+self._valid_frame)
+        self.assertEqual(reader._read_raw(), self._valid_values)
+        transport.close()
+        self.assertFalse(transport.is_open)
+
+if __name__ == '__main__':
+    try:
+        unittest.main()
+    except Exception as e:
+        logger.exception("Caught Exception: " + str(e))
+    except:
+        logger.exception("Caught unknow exception")